@@ -0,0 +1,76 @@
+import asyncio
+import json
+import tempfile
+import time
+from pathlib import Path
+
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from src.group_commit import GroupInsert
+from src.models import Todo, TodoState, User, table_registry
+
+CONCURRENCY = 500
+
+
+def values(user_id: int, n: int) -> dict:
+    return {
+        'title': f'todo {n}',
+        'description': 'benchmark',
+        'state': TodoState.todo,
+        'user_id': user_id,
+    }
+
+
+async def insert_one(engine, user_id: int, n: int):
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        session.add(Todo(**values(user_id, n)))
+        await session.commit()
+
+
+async def measure(run) -> float:
+    start = time.perf_counter()
+    await asyncio.gather(*(run(n) for n in range(CONCURRENCY)))
+    return CONCURRENCY / (time.perf_counter() - start)
+
+
+async def main():
+    with tempfile.TemporaryDirectory() as directory:
+        # A file database, so every commit pays for its journal sync. The
+        # group still runs one INSERT per row here, so this measures what
+        # sharing the commit saves.
+        engine = create_async_engine(
+            f'sqlite+aiosqlite:///{Path(directory) / "bench.db"}'
+        )
+        async with engine.begin() as conn:
+            await conn.run_sync(table_registry.metadata.create_all)
+
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            user = User(username='bench', email='bench@bench', password='-')
+            user.version = 1
+            session.add(user)
+            await session.commit()
+
+        inserts = GroupInsert(Todo, 'bench.group_commit')
+        single = await measure(lambda n: insert_one(engine, user.id, n))
+        grouped = await measure(
+            lambda n: inserts.insert(engine, values(user.id, n))
+        )
+
+        await engine.dispose()
+
+    print(
+        json.dumps(
+            {
+                'concurrency': CONCURRENCY,
+                'inserts_per_second': {
+                    'commit_per_request': round(single),
+                    'group_commit': round(grouped),
+                },
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,101 @@
+import asyncio
+import json
+import time
+import tracemalloc
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from src import queries
+from src.models import Todo, TodoState, User, table_registry
+from src.schemas import TodoList
+
+ROWS = 1000
+ITERATIONS = 50
+
+
+async def orm_page(session: AsyncSession, user_id: int) -> bytes:
+    todos = await session.scalars(
+        select(Todo).where(Todo.user_id == user_id).limit(ROWS)
+    )
+    todo_list = TodoList.model_validate(
+        {'todos': todos.all()}, from_attributes=True
+    )
+    return todo_list.model_dump_json().encode()
+
+
+async def core_page(session: AsyncSession, user_id: int) -> bytes:
+    result = await session.execute(queries.user_todos(user_id, 0, ROWS))
+    todo_list = TodoList.model_validate(
+        {'todos': queries.records(queries.TodoRecord, result)},
+        from_attributes=True,
+    )
+    return todo_list.model_dump_json().encode()
+
+
+async def measure(engine, page, user_id: int) -> tuple[float, float]:
+    # A fresh session per page, as a request gets.
+    async with AsyncSession(engine) as session:
+        await page(session, user_id)
+
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        async with AsyncSession(engine) as session:
+            await page(session, user_id)
+    per_row = (time.perf_counter() - start) / ITERATIONS / ROWS
+
+    tracemalloc.start()
+    async with AsyncSession(engine) as session:
+        await page(session, user_id)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return per_row * 1_000_000, peak / 1024
+
+
+async def main():
+    engine = create_async_engine('sqlite+aiosqlite:///:memory:')
+    async with engine.begin() as conn:
+        await conn.run_sync(table_registry.metadata.create_all)
+
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        user = User(username='bench', email='bench@bench', password='-')
+        user.version = 1
+        session.add(user)
+        await session.commit()
+        session.add_all(
+            Todo(
+                title=f'todo {n}',
+                description='benchmark',
+                state=TodoState.todo,
+                user_id=user.id,
+            )
+            for n in range(ROWS)
+        )
+        await session.commit()
+
+    orm_us, orm_kib = await measure(engine, orm_page, user.id)
+    core_us, core_kib = await measure(engine, core_page, user.id)
+
+    await engine.dispose()
+
+    print(
+        json.dumps(
+            {
+                'rows': ROWS,
+                'us_per_row': {
+                    'orm': round(orm_us, 2),
+                    'core_records': round(core_us, 2),
+                },
+                'peak_kib_per_page': {
+                    'orm': round(orm_kib),
+                    'core_records': round(core_kib),
+                },
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,207 @@
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from src.app import create_app
+from src.models import Todo, table_registry
+from src.settings import get_settings
+from src.sharding import ShardMap
+from src.tools.seed import SeedOptions, seed
+
+SIZES = (10, 1_000, 100_000, 1_000_000)
+PAGE = 50
+ITERATIONS = 20
+# Latency and memory may grow this much from the first size with full
+# pages to the largest before an endpoint counts as growing with the data.
+MAX_GROWTH = 3.0
+PASSWORD = 'secret'
+
+type Endpoint = tuple[str, str, dict | None]
+
+
+def endpoints(user_id: int, todo_id: int, version: int) -> dict:
+    # Everything here should cost O(page), whatever the user owns.
+    since = max(0, version - PAGE)
+    todo = {'title': 't', 'description': 'd', 'state': 'todo'}
+    return {
+        'POST /auth/token': ('POST', '/auth/token', None),
+        'GET /users/': ('GET', '/users/', None),
+        'GET /users/{user_id}': ('GET', f'/users/{user_id}', None),
+        'GET /todos/': ('GET', f'/todos/?limit={PAGE}', None),
+        'GET /todos/?state': (
+            'GET',
+            f'/todos/?limit={PAGE}&state=doing',
+            None,
+        ),
+        'GET /todos/?order_by': (
+            'GET',
+            f'/todos/?limit={PAGE}&order_by=created_at&order=desc',
+            None,
+        ),
+        'GET /todos/changes': (
+            'GET',
+            f'/todos/changes?limit={PAGE}&since={since}',
+            None,
+        ),
+        'POST /todos/': ('POST', '/todos/', todo),
+        'PATCH /todos/{todo_id}': (
+            'PATCH',
+            f'/todos/{todo_id}',
+            {'state': 'doing'},
+        ),
+    }
+
+
+async def call(client: AsyncClient, endpoint: Endpoint, username: str):
+    method, path, body = endpoint
+    if path == '/auth/token':
+        data = {'username': username, 'password': PASSWORD}
+        response = await client.post(path, data=data)
+    else:
+        response = await client.request(method, path, json=body)
+    response.raise_for_status()
+
+
+async def measure(client: AsyncClient, endpoint: Endpoint, username: str):
+    await call(client, endpoint, username)
+
+    samples = []
+    for _ in range(ITERATIONS):
+        start = time.perf_counter()
+        await call(client, endpoint, username)
+        samples.append((time.perf_counter() - start) * 1000)
+
+    tracemalloc.start()
+    await call(client, endpoint, username)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'p50_ms': round(statistics.median(samples), 3),
+        'peak_kib': round(peak / 1024),
+    }
+
+
+async def run_size(url: str, size: int) -> dict:
+    engine = create_async_engine(url)
+    async with engine.begin() as conn:
+        await conn.run_sync(table_registry.metadata.drop_all)
+        await conn.run_sync(table_registry.metadata.create_all)
+
+    await seed(
+        ShardMap([engine]),
+        SeedOptions(users=1, todos_per_user=size, password=PASSWORD),
+    )
+    async with engine.connect() as conn:
+        user_id, todo_id, version = (
+            await conn.execute(
+                select(
+                    Todo.user_id, func.min(Todo.id), func.max(Todo.version)
+                ).group_by(Todo.user_id)
+            )
+        ).one()
+    await engine.dispose()
+
+    settings = get_settings().model_copy(
+        update={
+            'DATABASE_URL': url,
+            'DATABASE_SHARD_URLS': [],
+            'ADMISSION_ENABLED': False,
+            'SLOW_QUERY_LOG_ENABLED': False,
+        }
+    )
+    app = create_app(settings)
+    username = f'seed0_{user_id}'
+    results = {}
+
+    async with (
+        app.router.lifespan_context(app),
+        AsyncClient(
+            transport=ASGITransport(app), base_url='http://bench'
+        ) as client,
+    ):
+        response = await client.post(
+            '/auth/token', data={'username': username, 'password': PASSWORD}
+        )
+        token = response.json()['access_token']
+        client.headers['Authorization'] = f'Bearer {token}'
+
+        for name, endpoint in endpoints(user_id, todo_id, version).items():
+            results[name] = await measure(client, endpoint, username)
+
+    return results
+
+
+def growth(results: dict[int, dict], max_growth: float) -> list[str]:
+    # Smaller users get short pages, which would hide growth.
+    full = [size for size in results if size >= PAGE]
+    if len(full) < 2:  # noqa: PLR2004
+        return []
+
+    first, last = results[min(full)], results[max(full)]
+    failures = []
+    for name, baseline in first.items():
+        for metric in ('p50_ms', 'peak_kib'):
+            ratio = last[name][metric] / max(baseline[metric], 1)
+            if ratio > max_growth:
+                failures.append(
+                    f'{name} {metric} grew {ratio:.1f}x from {min(full)} '
+                    f'to {max(full)} todos'
+                )
+    return failures
+
+
+async def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.scaling')
+    parser.add_argument(
+        '--sizes',
+        type=lambda value: [int(size) for size in value.split(',')],
+        default=list(SIZES),
+    )
+    parser.add_argument('--max-growth', type=float, default=MAX_GROWTH)
+    parser.add_argument(
+        '--database-url',
+        help='a scratch database, its tables are dropped for every size; '
+        'defaults to a temporary SQLite file',
+    )
+    parser.add_argument('--output', help='also write the JSON here')
+    args = parser.parse_args(argv)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for size in args.sizes:
+            url = args.database_url or (
+                f'sqlite+aiosqlite:///{Path(directory) / f"{size}.db"}'
+            )
+            results[size] = await run_size(url, size)
+
+    failures = growth(results, args.max_growth)
+    report = json.dumps(
+        {
+            'page': PAGE,
+            'iterations': ITERATIONS,
+            'max_growth': args.max_growth,
+            'sizes': results,
+            'failures': failures,
+        },
+        indent=2,
+    )
+    print(report)
+    if args.output:
+        Path(args.output).write_text(report, encoding='utf-8')
+
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,60 @@
+import asyncio
+import json
+import time
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from src import queries
+from src.models import User, table_registry
+
+ITERATIONS = 2000
+
+
+def inline_statement(username: str):
+    return select(User).where(User.username == username)
+
+
+async def measure(session: AsyncSession, build, **options) -> float:
+    for _ in range(50):
+        await session.scalar(build('warmup'), execution_options=options)
+
+    start = time.perf_counter()
+    for n in range(ITERATIONS):
+        await session.scalar(build(f'user{n}'), execution_options=options)
+
+    return (time.perf_counter() - start) / ITERATIONS * 1_000_000
+
+
+async def main():
+    engine = create_async_engine('sqlite+aiosqlite:///:memory:')
+    async with engine.begin() as conn:
+        await conn.run_sync(table_registry.metadata.create_all)
+
+    async with AsyncSession(engine) as session:
+        uncached = await measure(
+            session, inline_statement, compiled_cache=None
+        )
+        inline = await measure(session, inline_statement)
+        cached = await measure(session, queries.user_by_username)
+
+    await engine.dispose()
+
+    print(
+        json.dumps(
+            {
+                'iterations': ITERATIONS,
+                'us_per_request': {
+                    'inline_no_compile_cache': round(uncached, 2),
+                    'inline_compile_cache': round(inline, 2),
+                    'lambda_stmt': round(cached, 2),
+                },
+                'saving_us_per_request': round(uncached - cached, 2),
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -12,11 +12,7 @@ wait_for_db() {
 # Chama a função para aguardar o banco de dados
 wait_for_db
 
-# Executa as migrações do banco de dados
-echo "Executando migrações do Alembic..."
-uv run alembic upgrade head
-echo "Migrações concluídas!"
-
-# Inicia a aplicação
+# Inicia a aplicação (as migrações pendentes são aplicadas pelo src.serve,
+# com lock para que apenas uma réplica migre por vez)
 echo "Iniciando a aplicação FastAPI..."
-uv run uvicorn src.app:app --host 0.0.0.0 --port 8080
\ No newline at end of file
+exec uv run python -m src.serve
\ No newline at end of file
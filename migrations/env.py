@@ -8,16 +8,18 @@ from sqlalchemy import pool
 from alembic import context
 
 from src.models import table_registry
-from src.settings import Settings
+from src.settings import get_settings
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
 config = context.config
-config.set_main_option('sqlalchemy.url', Settings().DATABASE_URL)  # type: ignore
+config.set_main_option('sqlalchemy.url', get_settings().DATABASE_URL)
 
 # Interpret the config file for Python logging.
 # This line sets up loggers basically.
-if config.config_file_name is not None:
+if config.config_file_name is not None and config.attributes.get(
+    'configure_logger', True
+):
     fileConfig(config.config_file_name)
 
 # add your model's MetaData object here
@@ -77,7 +79,13 @@ async def run_async_migrations_online() -> None:
 
 
 def run_migrations_online() -> None:
-    asyncio.run(run_async_migrations_online())
+    # src.migrate hands over an already locked connection.
+    connection = config.attributes.get('connection')
+
+    if connection is None:
+        asyncio.run(run_async_migrations_online())
+    else:
+        do_run_migrations(connection)
 
 
 if sys.platform == 'win32': 
@@ -0,0 +1,55 @@
+"""add todo change versions and tombstones
+
+Revision ID: 3f9a1c7d2b64
+Revises: c0605e694a98
+Create Date: 2026-10-19 10:12:31.418205
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f9a1c7d2b64'
+down_revision: Union[str, Sequence[str], None] = 'c0605e694a98'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute(sa.schema.CreateSequence(sa.Sequence('change_version_seq')))
+        # Backfills existing rows with distinct, increasing versions.
+        version_default = sa.text("nextval('change_version_seq')")
+    else:
+        version_default = sa.text('0')
+
+    op.add_column('todos', sa.Column('version', sa.BigInteger(), server_default=version_default, nullable=False))
+    if op.get_bind().dialect.name != 'postgresql':
+        # Distinct and above 0, so since=0 returns every existing todo.
+        op.execute('UPDATE todos SET version = id')
+    op.create_index('ix_todos_user_id_version', 'todos', ['user_id', 'version'], unique=False)
+    op.create_table('todo_tombstones',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('todo_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('version', sa.BigInteger(), nullable=False),
+    sa.Column('deleted_at', sa.DateTime(), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_todo_tombstones_user_id_version', 'todo_tombstones', ['user_id', 'version'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_todo_tombstones_user_id_version', table_name='todo_tombstones')
+    op.drop_table('todo_tombstones')
+    op.drop_index('ix_todos_user_id_version', table_name='todos')
+    op.drop_column('todos', 'version')
+
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute(sa.schema.DropSequence(sa.Sequence('change_version_seq')))
@@ -0,0 +1,51 @@
+"""add change writer xids
+
+Revision ID: 9c3e7b1f4a28
+Revises: f3c8a1d5b920
+Create Date: 2026-10-20 09:14:52.630118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9c3e7b1f4a28'
+down_revision: Union[str, Sequence[str], None] = 'f3c8a1d5b920'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TABLES = ('todos', 'todo_tombstones')
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Existing rows are committed, so 0 puts them below every watermark.
+    for table in TABLES:
+        op.add_column(table, sa.Column('writer_xid', sa.BigInteger(), server_default=sa.text('0'), nullable=False))
+
+    if op.get_bind().dialect.name == 'postgresql':
+        for table in TABLES:
+            op.alter_column(table, 'writer_xid', server_default=sa.text('(pg_current_xact_id()::text::bigint)'))
+        return
+
+    # Databases migrated before 3f9a1c7d2b64 backfilled distinct versions
+    # still hold todos at version 0, which no since=0 sync returns.
+    bind = op.get_bind()
+    latest = bind.scalar(sa.text(
+        'SELECT coalesce(max(version), 0) FROM ('
+        'SELECT max(version) AS version FROM todos UNION ALL '
+        'SELECT max(version) FROM todo_tombstones)'
+    ))
+    bind.execute(
+        sa.text('UPDATE todos SET version = id + :latest WHERE version = 0'),
+        {'latest': latest},
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table in reversed(TABLES):
+        op.drop_column(table, 'writer_xid')
@@ -0,0 +1,33 @@
+"""add todo sort indexes
+
+Revision ID: a4d7e2c9b351
+Revises: e5a92c0f7b18
+Create Date: 2026-10-19 18:42:11.530218
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a4d7e2c9b351'
+down_revision: Union[str, Sequence[str], None] = 'e5a92c0f7b18'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SORT_COLUMNS = ('created_at', 'updated_at', 'title', 'state')
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # On the partitioned Postgres table these cascade to every partition.
+    for column in SORT_COLUMNS:
+        op.create_index(f'ix_todos_user_id_{column}', 'todos', ['user_id', column, 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for column in reversed(SORT_COLUMNS):
+        op.drop_index(f'ix_todos_user_id_{column}', table_name='todos')
@@ -0,0 +1,86 @@
+"""partition todos by user_id
+
+Revision ID: b7c41e9d05a3
+Revises: 8d2e4b6a1f35
+Create Date: 2026-10-19 15:41:07.226913
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7c41e9d05a3'
+down_revision: Union[str, Sequence[str], None] = '8d2e4b6a1f35'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+PARTITIONS = 16
+
+COLUMNS = 'id, title, description, state, user_id, created_at, updated_at, version'
+
+
+def create_todos(name: str, primary_key: str, partition_by: str = '') -> None:
+    op.execute(f"""
+        CREATE TABLE {name} (
+            id integer NOT NULL DEFAULT nextval('todos_id_seq'),
+            title varchar NOT NULL,
+            description varchar NOT NULL,
+            state todostate NOT NULL,
+            user_id integer NOT NULL REFERENCES users (id),
+            created_at timestamp without time zone NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            updated_at timestamp without time zone NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            version bigint NOT NULL DEFAULT nextval('change_version_seq'),
+            CONSTRAINT todos_pkey PRIMARY KEY ({primary_key})
+        ) {partition_by}
+    """)
+
+
+def swap_todos(primary_key: str, partition_by: str = '') -> None:
+    op.execute('ALTER TABLE todos RENAME TO todos_old')
+    op.execute('ALTER TABLE todos_old RENAME CONSTRAINT todos_pkey TO todos_old_pkey')
+    op.drop_index('ix_todos_user_id_version', table_name='todos_old')
+
+    create_todos('todos', primary_key, partition_by)
+    if partition_by:
+        for remainder in range(PARTITIONS):
+            op.execute(
+                f'CREATE TABLE todos_p{remainder} PARTITION OF todos '
+                f'FOR VALUES WITH (MODULUS {PARTITIONS}, REMAINDER {remainder})'
+            )
+
+    op.execute(f'INSERT INTO todos ({COLUMNS}) SELECT {COLUMNS} FROM todos_old')
+    op.execute('ALTER SEQUENCE todos_id_seq OWNED BY todos.id')
+    op.drop_table('todos_old')
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    # A partitioned table's primary key has to contain the partition key.
+    swap_todos('user_id, id', 'PARTITION BY HASH (user_id)')
+
+    # Built after the copy, which beats updating each index row by row.
+    # This all runs in one transaction that holds the ACCESS EXCLUSIVE lock
+    # taken by the rename until it commits, so every read and write of
+    # todos waits for the copy and the builds: run it in a maintenance
+    # window.
+    op.execute('CREATE INDEX ix_todos_user_id_version ON ONLY todos (user_id, version)')
+    for remainder in range(PARTITIONS):
+        op.execute(f'CREATE INDEX ix_todos_p{remainder}_user_id_version ON todos_p{remainder} (user_id, version)')
+        op.execute(f'ALTER INDEX ix_todos_user_id_version ATTACH PARTITION ix_todos_p{remainder}_user_id_version')
+
+    op.execute('ANALYZE todos')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    swap_todos('id')
+    op.create_index('ix_todos_user_id_version', 'todos', ['user_id', 'version'], unique=False)
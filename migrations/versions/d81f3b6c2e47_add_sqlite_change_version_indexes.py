@@ -0,0 +1,38 @@
+"""add sqlite change version indexes
+
+Revision ID: d81f3b6c2e47
+Revises: a4d7e2c9b351
+Create Date: 2026-10-19 21:12:40.418397
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd81f3b6c2e47'
+down_revision: Union[str, Sequence[str], None] = 'a4d7e2c9b351'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Postgres takes change versions from a sequence; elsewhere every write
+    # reads max(version), which needs an index of its own.
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+
+    op.create_index('ix_todos_version', 'todos', ['version'], unique=False)
+    op.create_index('ix_todo_tombstones_version', 'todo_tombstones', ['version'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+
+    op.drop_index('ix_todo_tombstones_version', table_name='todo_tombstones')
+    op.drop_index('ix_todos_version', table_name='todos')
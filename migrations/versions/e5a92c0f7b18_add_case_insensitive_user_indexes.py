@@ -0,0 +1,31 @@
+"""add case insensitive user indexes
+
+Revision ID: e5a92c0f7b18
+Revises: b7c41e9d05a3
+Create Date: 2026-10-19 17:26:53.104772
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5a92c0f7b18'
+down_revision: Union[str, Sequence[str], None] = 'b7c41e9d05a3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Fails if existing rows differ only by case; those need merging first.
+    op.create_index('ix_users_username_lower', 'users', [sa.text('lower(username)')], unique=True)
+    op.create_index('ix_users_email_lower', 'users', [sa.text('lower(email)')], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_users_email_lower', table_name='users')
+    op.drop_index('ix_users_username_lower', table_name='users')
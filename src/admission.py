@@ -0,0 +1,223 @@
+import asyncio
+import time
+from collections import deque
+from contextlib import suppress
+from http import HTTPStatus
+
+from starlette.responses import JSONResponse
+from starlette.routing import Match, Router
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from src.metrics import metrics
+
+BACKOFF = 0.9
+
+
+class Overloaded(Exception):
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class Limiter:
+    def __init__(
+        self,
+        limit: int,
+        queue_size: int,
+        timeout: float,
+        target_latency: float | None = None,
+        min_limit: int = 1,
+    ):
+        self.max_limit = limit
+        self.limit = float(limit)
+        self.min_limit = min_limit
+        self.queue_size = queue_size
+        self.timeout = timeout
+        # None keeps the limit fixed; otherwise AIMD on handler latency.
+        self.target_latency = target_latency
+        self.in_flight = 0
+        self.shed = 0
+        self._waiters: deque[asyncio.Future] = deque()
+        self._backed_off_at = 0.0
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self, timeout: float | None = None):
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+            return
+
+        if len(self._waiters) >= self.queue_size:
+            self.shed += 1
+            raise Overloaded('queue_full')
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            async with asyncio.timeout(
+                self.timeout if timeout is None else timeout
+            ):
+                await waiter
+        except BaseException as exc:
+            if waiter.done() and not waiter.cancelled():
+                # Handed a slot just as we gave up; pass it on.
+                self.release()
+            else:
+                with suppress(ValueError):
+                    self._waiters.remove(waiter)
+
+            if isinstance(exc, TimeoutError):
+                self.shed += 1
+                raise Overloaded('deadline') from None
+            raise
+
+    def release(self):
+        self.in_flight -= 1
+        self._wake()
+
+    def _wake(self):
+        # A released slot goes straight to the oldest waiter.
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    def observe(self, started: float, latency: float):
+        if self.target_latency is None:
+            return
+
+        if latency <= self.target_latency:
+            # Additive increase: about one more slot per limit completions.
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._wake()
+        elif started >= self._backed_off_at:
+            # Requests admitted before the last backoff saw the old limit;
+            # their latency says nothing about the new one.
+            self.limit = max(self.min_limit, self.limit * BACKOFF)
+            self._backed_off_at = time.monotonic()
+
+
+class AdmissionControl:
+    def __init__(self):
+        self.configure()
+
+    def configure(  # noqa: PLR0913
+        self,
+        *,
+        limit: int = 15,
+        route_limits: dict[str, int] | None = None,
+        queue_size: int = 64,
+        timeout: float = 2.0,
+        exempt: list[str] | None = None,
+        target_latency: float | None = None,
+        min_limit: int = 1,
+    ):
+        self.limit = limit
+        self.route_limits = route_limits or {}
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.exempt = set(exempt or ())
+        self.target_latency = target_latency
+        self.min_limit = min_limit
+        # Every route shares one limit sized to the pool; route limits
+        # only keep one route from taking all of it.
+        self.shared = self._limiter(limit)
+        self._limiters: dict[str, Limiter | None] = {}
+
+    def _limiter(self, limit: int) -> Limiter:
+        return Limiter(
+            limit,
+            self.queue_size,
+            self.timeout,
+            self.target_latency,
+            self.min_limit,
+        )
+
+    def limiters(self, route: str) -> list[Limiter]:
+        # In the order they are acquired.
+        if route in self.exempt:
+            return []
+
+        if route not in self._limiters:
+            self._limiters[route] = (
+                self._limiter(self.route_limits[route])
+                if route in self.route_limits
+                else None
+            )
+        limiter = self._limiters[route]
+        return [self.shared] if limiter is None else [limiter, self.shared]
+
+    def stats(self) -> dict:
+        data = {}
+        limiters = {'all': self.shared, **self._limiters}
+        for route, limiter in limiters.items():
+            if limiter is None:
+                continue
+            data[f'admission.{route}.limit'] = round(limiter.limit, 2)
+            data[f'admission.{route}.in_flight'] = limiter.in_flight
+            data[f'admission.{route}.queued'] = limiter.queued
+            data[f'admission.{route}.shed'] = limiter.shed
+        return data
+
+
+admission = AdmissionControl()
+metrics.register(admission.stats)
+
+
+class AdmissionMiddleware:
+    def __init__(self, app: ASGIApp, router: Router, retry_after: int = 1):
+        self.app = app
+        self.router = router
+        self.retry_after = retry_after
+
+    def route_name(self, scope: Scope) -> str | None:
+        # Same names as tracing's current_route, e.g. 'GET /todos/{todo_id}'.
+        for route in self.router.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return f'{scope["method"]} {route.path}'  # type: ignore
+        return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        route = self.route_name(scope)
+        limiters = admission.limiters(route) if route else []
+        if not limiters:
+            await self.app(scope, receive, send)
+            return
+
+        acquired: list[Limiter] = []
+        deadline = time.monotonic() + admission.timeout
+        try:
+            for limiter in limiters:
+                # One deadline across the route's queue and the shared one.
+                await limiter.acquire(max(0.0, deadline - time.monotonic()))
+                acquired.append(limiter)
+        except BaseException as exc:
+            for limiter in acquired:
+                limiter.release()
+            if not isinstance(exc, Overloaded):
+                raise
+
+            metrics.incr(f'admission.shed.{exc.reason}')
+            response = JSONResponse(
+                {'detail': 'server overloaded'},
+                status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+                headers={'Retry-After': str(self.retry_after)},
+            )
+            await response(scope, receive, send)
+            return
+
+        started = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            for limiter in reversed(acquired):
+                limiter.release()
+                limiter.observe(started, time.monotonic() - started)
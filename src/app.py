@@ -1,21 +1,177 @@
 import asyncio
 import sys
+from contextlib import asynccontextmanager
 from http import HTTPStatus
 
 from fastapi import FastAPI
 
-from src.routers import auth, todos, users
+from src.admission import AdmissionMiddleware, admission
+from src.compression import CompressionMiddleware
+from src.database import build_shards, warm_up
+from src.events import PostgresTransport, broker
+from src.idempotency import (
+    IdempotencyMiddleware,
+    IdempotencyStore,
+    IdempotentReplay,
+    replay_response,
+)
+from src.profiling import ProfilingMiddleware
+from src.routers import admin, auth, batch, todos, users
+from src.security import build_password_hasher, load_argon2_profile
+from src.settings import Settings, get_settings
+from src.singleflight import SingleFlight
+from src.slow_queries import slow_query_log
+from src.tracing import (
+    JsonLinesExporter,
+    RingBufferCollector,
+    TracedRoute,
+    TracingMiddleware,
+    tracer,
+)
 
 if sys.platform == 'win32':  # pragma: no cover
     asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
 
-app = FastAPI()
 
-app.include_router(auth.router)
-app.include_router(users.router)
-app.include_router(todos.router)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    settings: Settings = app.state.settings
+    app.state.shards = build_shards(settings)
+    app.state.engine = app.state.shards.engines[0]
+    app.state.password_hasher = build_password_hasher(
+        load_argon2_profile(settings.ARGON2_PROFILE_PATH)
+    )
 
+    # Runs before the server starts accepting, so the first requests
+    # after a deploy find open connections and compiled statements.
+    if settings.DB_POOL_WARMUP:
+        await asyncio.gather(
+            *(
+                warm_up(
+                    engine,
+                    min(settings.DB_POOL_WARMUP, settings.DB_POOL_SIZE),
+                    # Enough runs for psycopg to switch to prepared statements.
+                    repeat=(settings.DB_PREPARE_THRESHOLD or 0) + 1,
+                )
+                for engine in app.state.shards.engines
+            )
+        )
 
-@app.get('/', status_code=HTTPStatus.OK)
-async def read_root():
-    return {'message': 'Hello world!'}
+    # Read coalescing and idempotency keys are per user id, which only
+    # means something within this app's database.
+    app.state.reads = SingleFlight('todos.reads')
+    app.state.idempotency = IdempotencyStore()
+
+    # The broker, tracer, slow query log, admission control and group
+    # commit stay process-wide: every app in the process shares them and
+    # the last one started configures them.
+    broker.configure(
+        settings.EVENTS_QUEUE_SIZE,
+        settings.EVENTS_BACKLOG,
+        settings.EVENTS_BACKLOG_USERS,
+        settings.EVENTS_BACKLOG_IDLE_SECONDS,
+    )
+    todos.inserts.configure(
+        settings.TODO_GROUP_COMMIT_WINDOW_MS / 1000,
+        settings.TODO_GROUP_COMMIT_MAX_SIZE,
+    )
+
+    app.state.idempotency.configure(
+        ttl=settings.IDEMPOTENCY_TTL_SECONDS,
+        lock_timeout=settings.IDEMPOTENCY_LOCK_SECONDS,
+        wait_timeout=settings.IDEMPOTENCY_WAIT_SECONDS,
+        cache_size=settings.IDEMPOTENCY_CACHE_SIZE,
+    )
+
+    app.state.traces = RingBufferCollector(settings.TRACING_BUFFER_SIZE)
+    collectors = [app.state.traces]
+    exporter = None
+    if settings.TRACING_JSONL_PATH:
+        exporter = JsonLinesExporter(
+            settings.TRACING_JSONL_PATH, settings.TRACING_JSONL_BUFFER_SIZE
+        )
+        collectors.append(exporter)
+    tracer.configure(collectors, settings.TRACING_MAX_SPANS)
+
+    slow_query_log.configure(
+        settings.SLOW_QUERY_LOG_SIZE, settings.SLOW_QUERY_LOG_PER_MINUTE
+    )
+    target_latency = settings.ADMISSION_TARGET_LATENCY_MS / 1000
+    admission.configure(
+        limit=settings.ADMISSION_LIMIT
+        or settings.DB_POOL_SIZE + settings.DB_MAX_OVERFLOW,
+        route_limits=settings.ADMISSION_ROUTE_LIMITS,
+        queue_size=settings.ADMISSION_QUEUE_SIZE,
+        timeout=settings.ADMISSION_QUEUE_TIMEOUT_SECONDS,
+        exempt=settings.ADMISSION_EXEMPT,
+        target_latency=target_latency if settings.ADMISSION_ADAPTIVE else None,
+        min_limit=settings.ADMISSION_MIN_LIMIT,
+    )
+    transport = None
+
+    if settings.EVENTS_PG_NOTIFY:  # pragma: no cover
+        transport = PostgresTransport(broker, settings.DATABASE_URL)
+        await transport.start()
+
+    try:
+        yield
+    finally:
+        if transport:  # pragma: no cover
+            await transport.stop()
+
+        await todos.inserts.drain()
+        await slow_query_log.drain()
+        if exporter:
+            await exporter.drain()
+        await app.state.shards.dispose()
+
+
+def create_app(settings: Settings | None = None) -> FastAPI:
+    app = FastAPI(lifespan=lifespan)
+    app.router.route_class = TracedRoute
+    app.state.settings = settings = settings or get_settings()
+
+    app.add_middleware(
+        IdempotencyMiddleware, max_body_size=settings.IDEMPOTENCY_MAX_BODY_SIZE
+    )
+    app.add_exception_handler(IdempotentReplay, replay_response)  # type: ignore
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=settings.COMPRESSION_MINIMUM_SIZE,
+        offload_size=settings.COMPRESSION_OFFLOAD_SIZE,
+    )
+
+    if settings.PROFILING_ENABLED:
+        app.add_middleware(
+            ProfilingMiddleware,
+            token=settings.PROFILING_TOKEN,
+            directory=settings.PROFILING_DIR,
+            retention=settings.PROFILING_RETENTION,
+            interval=settings.PROFILING_INTERVAL_SECONDS,
+        )
+
+    if settings.ADMISSION_ENABLED:
+        # Inside tracing, so shed requests still show up as traces.
+        app.add_middleware(
+            AdmissionMiddleware,
+            router=app.router,
+            retry_after=settings.ADMISSION_RETRY_AFTER_SECONDS,
+        )
+
+    if settings.TRACING_ENABLED:
+        app.add_middleware(TracingMiddleware)
+
+    app.include_router(auth.router)
+    app.include_router(users.router)
+    app.include_router(todos.router)
+    app.include_router(admin.router)
+    app.include_router(batch.router)
+
+    @app.get('/', status_code=HTTPStatus.OK)
+    async def read_root():
+        return {'message': 'Hello world!'}
+
+    return app
+
+
+app = create_app()
@@ -0,0 +1,194 @@
+import asyncio
+import zlib
+from collections.abc import Callable
+from importlib.util import find_spec
+from typing import NamedTuple
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+UNCOMPRESSED_TYPES = ('text/event-stream',)
+
+
+class Encoder(NamedTuple):
+    compress: Callable[[bytes], bytes]
+    finish: Callable[[], bytes]
+
+
+def gzip_encoder() -> Encoder:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return Encoder(compressor.compress, compressor.flush)
+
+
+def brotli_encoder() -> Encoder:  # pragma: no cover
+    import brotli  # noqa: PLC0415
+
+    compressor = brotli.Compressor(quality=4)
+    return Encoder(compressor.process, compressor.finish)
+
+
+def zstd_encoder() -> Encoder:  # pragma: no cover
+    import zstandard  # noqa: PLC0415
+
+    compressor = zstandard.ZstdCompressor(level=3).compressobj()
+    return Encoder(compressor.compress, compressor.flush)
+
+
+def available_encoders() -> dict[str, Callable[[], Encoder]]:
+    # In order of preference when the client weighs them equally.
+    encoders = {}
+    if find_spec('brotli'):
+        encoders['br'] = brotli_encoder
+    if find_spec('zstandard'):
+        encoders['zstd'] = zstd_encoder
+    encoders['gzip'] = gzip_encoder
+    return encoders
+
+
+def negotiate(accept_encoding: str, encodings) -> str | None:
+    weights = {}
+    for item in accept_encoding.split(','):
+        coding, *params = (part.strip() for part in item.split(';'))
+        weight = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        if coding:
+            weights[coding.lower()] = weight
+
+    wildcard = weights.get('*', 0.0)
+    best, best_weight = None, 0.0
+    for encoding in encodings:
+        weight = weights.get(encoding, wildcard)
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+
+    return best
+
+
+class CompressionMiddleware:
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 1024,
+        offload_size: int = 64 * 1024,
+        encoders: dict[str, Callable[[], Encoder]] | None = None,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.offload_size = offload_size
+        self.encoders = encoders or available_encoders()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = Headers(scope=scope).get('accept-encoding', '')
+        encoding = negotiate(accept_encoding, self.encoders)
+        responder = CompressionResponder(self, encoding, send)
+        await self.app(scope, receive, responder)
+
+
+class CompressionResponder:
+    def __init__(
+        self,
+        middleware: CompressionMiddleware,
+        encoding: str | None,
+        send: Send,
+    ):
+        self.middleware = middleware
+        self.encoding = encoding
+        self.send = send
+        self.start: Message | None = None
+        self.buffer = bytearray()
+        self.encoder: Encoder | None = None
+        self.passthrough = False
+
+    async def __call__(self, message: Message):
+        if message['type'] == 'http.response.start':
+            headers = MutableHeaders(raw=message['headers'])
+            content_type = headers.get('content-type', '')
+            self.passthrough = 'content-encoding' in headers or (
+                content_type.startswith(UNCOMPRESSED_TYPES)
+            )
+            if not self.passthrough:
+                # Whether or not this one is, other clients may get it
+                # compressed, so caches have to key on the header.
+                headers.add_vary_header('Accept-Encoding')
+            if self.passthrough or self.encoding is None:
+                self.passthrough = True
+                await self.send(message)
+            else:
+                self.start = message
+            return
+
+        if self.passthrough or message['type'] != 'http.response.body':
+            await self.send(message)
+            return
+
+        body = message.get('body', b'')
+        more_body = message.get('more_body', False)
+
+        if self.encoder is None:
+            # Only the first minimum_size bytes are held back, to decide
+            # whether compressing is worth it at all.
+            self.buffer += body
+            if len(self.buffer) < self.middleware.minimum_size:
+                if more_body:
+                    return
+
+                await self.send(self.start)
+                await self.send({
+                    'type': 'http.response.body',
+                    'body': bytes(self.buffer),
+                })
+                return
+
+            body, self.buffer = bytes(self.buffer), bytearray()
+            await self.start_encoding(body, more_body)
+            return
+
+        await self.send_compressed(body, more_body)
+
+    async def start_encoding(self, body: bytes, more_body: bool):
+        self.encoder = self.middleware.encoders[self.encoding]()
+        headers = MutableHeaders(raw=self.start['headers'])
+        headers['Content-Encoding'] = self.encoding
+        if (tag := headers.get('etag')) and not tag.startswith('W/'):
+            # A strong tag names exact bytes; see etag.strip_coding.
+            headers['ETag'] = f'{tag[:-1]}-{self.encoding}"'
+
+        if more_body:
+            del headers['Content-Length']
+            await self.send(self.start)
+            await self.send_compressed(body, more_body)
+            return
+
+        compressed = await self.compress(body, finish=True)
+        headers['Content-Length'] = str(len(compressed))
+        await self.send(self.start)
+        await self.send({'type': 'http.response.body', 'body': compressed})
+
+    async def send_compressed(self, body: bytes, more_body: bool):
+        compressed = await self.compress(body, finish=not more_body)
+        if compressed or not more_body:
+            await self.send({
+                'type': 'http.response.body',
+                'body': compressed,
+                'more_body': more_body,
+            })
+
+    async def compress(self, body: bytes, finish: bool) -> bytes:
+        def run() -> bytes:
+            data = self.encoder.compress(body)
+            return data + self.encoder.finish() if finish else data
+
+        # Large chunks would stall every other request on the loop.
+        if len(body) >= self.middleware.offload_size:
+            return await asyncio.to_thread(run)
+        return run()
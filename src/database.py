@@ -1,10 +1,203 @@
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+import asyncio
+import time
+from collections import Counter
+from contextlib import AsyncExitStack
+from functools import partial
 
+from fastapi import Depends, Request
+from sqlalchemy import event
+from sqlalchemy.engine.default import CACHE_HIT
+from sqlalchemy.ext.asyncio import (
+    AsyncConnection,
+    AsyncEngine,
+    AsyncSession,
+    create_async_engine,
+)
+
+from src import queries
+from src.metrics import hit_rate, metrics
+from src.models import TodoState
 from src.settings import Settings
+from src.sharding import ShardMap
+from src.slow_queries import (
+    EXPLAINABLE,
+    SlowQuery,
+    explain,
+    redact,
+    slow_query_log,
+)
+from src.tracing import current_route, instrument_tracing
+
+
+def build_engine(settings: Settings, url: str | None = None) -> AsyncEngine:
+    url = url or settings.DATABASE_URL
+    options: dict = {}
+
+    if url.startswith('postgresql'):
+        options.update(
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+        )
+
+    if url.startswith('postgresql+psycopg'):
+        options['connect_args'] = {
+            'prepare_threshold': settings.DB_PREPARE_THRESHOLD
+        }
+
+    engine = create_async_engine(url, **options)
+    instrument_statement_cache(engine, settings.DB_PREPARE_THRESHOLD)
+    instrument_tracing(engine)
+    if settings.SLOW_QUERY_LOG_ENABLED:
+        instrument_slow_queries(engine, settings)
+    return engine
+
+
+def build_shards(settings: Settings) -> ShardMap:
+    urls = [settings.DATABASE_URL, *settings.DATABASE_SHARD_URLS]
+    return ShardMap([build_engine(settings, url) for url in urls])
+
+
+def instrument_statement_cache(
+    engine: AsyncEngine, prepare_threshold: int | None
+):
+    track_prepared = (
+        engine.dialect.driver == 'psycopg' and prepare_threshold is not None
+    )
+
+    @event.listens_for(engine.sync_engine, 'after_cursor_execute')
+    def count_cache_hits(  # noqa: PLR0913, PLR0917
+        conn, cursor, statement, parameters, context, executemany
+    ):
+        if context.cache_hit == CACHE_HIT:
+            metrics.incr('db.compile_cache.hit')
+        else:
+            metrics.incr('db.compile_cache.miss')
+
+        if not track_prepared:
+            return
+
+        # psycopg prepares a statement server side once it has run more
+        # than prepare_threshold times on the same connection; mirror
+        # that count per DBAPI connection.
+        seen = conn.connection.info.setdefault('statement_counts', Counter())
+        seen[statement] += 1
+
+        if seen[statement] > prepare_threshold:
+            metrics.incr('db.prepared.hit')
+        else:
+            metrics.incr('db.prepared.miss')
+
+
+def instrument_slow_queries(engine: AsyncEngine, settings: Settings):
+    threshold = settings.SLOW_QUERY_THRESHOLD_MS
+    analyze = settings.SLOW_QUERY_EXPLAIN_ANALYZE
+
+    @event.listens_for(engine.sync_engine, 'before_cursor_execute')
+    def start_timer(  # noqa: PLR0913, PLR0917
+        conn, cursor, statement, parameters, context, executemany
+    ):
+        context._query_started = time.perf_counter()
+
+    @event.listens_for(engine.sync_engine, 'after_cursor_execute')
+    def log_slow_query(  # noqa: PLR0913, PLR0917
+        conn, cursor, statement, parameters, context, executemany
+    ):
+        elapsed_ms = (time.perf_counter() - context._query_started) * 1000
+        if elapsed_ms < threshold:
+            return
+        if not context.execution_options.get('slow_query_log', True):
+            return
+
+        entry = SlowQuery(
+            statement,
+            redact(parameters),
+            round(elapsed_ms, 3),
+            current_route.get(),
+            time.time(),
+        )
+        plan = None
+        if not executemany and statement.lstrip().upper().startswith(
+            EXPLAINABLE
+        ):
+            plan = partial(explain, engine, statement, parameters, analyze)
 
-engine = create_async_engine(Settings().DATABASE_URL)  # type: ignore
+        slow_query_log.record(entry, plan)
 
 
-async def get_session():  # pragma: no cover
-    async with AsyncSession(engine, expire_on_commit=False) as session:
+def statement_cache_stats() -> dict:
+    return {
+        'db.compile_cache.hit_rate': hit_rate(
+            metrics.get('db.compile_cache.hit'),
+            metrics.get('db.compile_cache.miss'),
+        ),
+        'db.prepared.hit_rate': hit_rate(
+            metrics.get('db.prepared.hit'), metrics.get('db.prepared.miss')
+        ),
+    }
+
+
+metrics.register(statement_cache_stats)
+
+
+def warmup_statements():
+    # The same cached statements the routers run; the bound values do
+    # not matter.
+    return [
+        queries.user_by_username('-'),
+        queries.user_by_id(0),
+        queries.user_by_username_or_email('-', '-'),
+        queries.users_page(0, 1),
+        queries.user_todos(0, 0, 1),
+        queries.user_todos(0, 0, 1, state=TodoState.todo),
+        queries.user_todos(0, 0, 1, order_by='created_at', descending=True),
+        queries.user_todo(0, 0),
+    ]
+
+
+async def warm_up(engine: AsyncEngine, connections: int, repeat: int = 1):
+    async with AsyncExitStack() as stack:
+        conns = await asyncio.gather(*[
+            stack.enter_async_context(engine.connect())
+            for _ in range(connections)
+        ])
+
+        for conn in conns:
+            async with AsyncSession(bind=conn) as session:
+                for _ in range(repeat):
+                    for statement in warmup_statements():
+                        await session.execute(statement)
+                await session.rollback()
+
+
+# Scope key under which POST /batch hands its session to sub-requests.
+BATCH_SESSION = 'batch.session'
+
+
+async def get_session(request: Request):  # pragma: no cover
+    shards: ShardMap = request.app.state.shards
+
+    async with AsyncSession(
+        request.app.state.engine,
+        expire_on_commit=False,
+        **shards.session_options(),
+    ) as session:
         yield session
+
+
+def get_request_session(
+    request: Request, session: AsyncSession = Depends(get_session)
+) -> AsyncSession:
+    return request.scope.get(BATCH_SESSION, session)
+
+
+async def begin_outer_transaction(session: AsyncSession) -> AsyncConnection:
+    conn = await session.connection()
+
+    if conn.dialect.name == 'sqlite':
+        # pysqlite only opens a transaction before DML; a SAVEPOINT issued
+        # first would be the outermost transaction and RELEASE would commit.
+        raw = await conn.get_raw_connection()
+        if not raw.driver_connection.in_transaction:
+            await conn.exec_driver_sql('BEGIN')
+
+    return conn
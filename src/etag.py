@@ -0,0 +1,50 @@
+from http import HTTPStatus
+from typing import Annotated
+
+from fastapi import Header, HTTPException, Response
+
+
+class PreconditionFailed(HTTPException):
+    def __init__(self):
+        super().__init__(
+            status_code=HTTPStatus.PRECONDITION_FAILED,
+            detail='resource was modified',
+        )
+
+
+def etag(version: int) -> str:
+    return f'"{version}"'
+
+
+def strip_coding(tag: str) -> str:
+    # Compressed responses carry "<version>-<coding>"; every coding of a
+    # version stands for the same state.
+    if tag.startswith('"') and '-' in tag:
+        return tag.split('-', 1)[0] + '"'
+    return tag
+
+
+class Precondition:
+    def __init__(
+        self,
+        response: Response,
+        if_match: Annotated[str | None, Header()] = None,
+    ):
+        self.response = response
+        self.if_match = if_match
+
+    def check(self, version: int):
+        if self.if_match is None or self.if_match.strip() == '*':
+            return
+
+        # If-Match uses the strong comparison: weak tags never match.
+        candidates = {
+            strip_coding(candidate.strip())
+            for candidate in self.if_match.split(',')
+        }
+
+        if etag(version) not in candidates:
+            raise PreconditionFailed()
+
+    def set_etag(self, version: int):
+        self.response.headers['ETag'] = etag(version)
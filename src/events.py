@@ -0,0 +1,354 @@
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict, defaultdict, deque
+from contextlib import contextmanager, suppress
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from sqlalchemy.engine import make_url
+
+logger = logging.getLogger(__name__)
+
+PG_CHANNEL = 'todo_events'
+PG_PAYLOAD_LIMIT = 7900
+RECONNECT_MIN_SECONDS = 0.5
+RECONNECT_MAX_SECONDS = 30.0
+
+
+@dataclass(frozen=True, slots=True)
+class Event:
+    id: int
+    user_id: int
+    type: str
+    data: dict
+
+    def encode(self) -> str:
+        return (
+            f'id: {self.id}\n'
+            f'event: {self.type}\n'
+            f'data: {json.dumps(self.data)}\n\n'
+        )
+
+
+@dataclass(eq=False)
+class Subscription:
+    user_id: int
+    queue: asyncio.Queue = field(repr=False)
+    overflowed: bool = False
+
+
+@dataclass(eq=False, slots=True)
+class Backlog:
+    events: deque[Event]
+    # The newest id no longer retained; resuming before it loses events.
+    floor: int
+
+
+# Set while a caller holds back events until its transaction commits.
+_held: ContextVar[list[tuple[int, str, dict]] | None] = ContextVar(
+    'held_events', default=None
+)
+
+
+class Broker:
+    def __init__(
+        self,
+        queue_size: int = 100,
+        backlog: int = 500,
+        backlog_users: int = 10_000,
+        backlog_idle: float = 60 * 60,
+    ):
+        self.queue_size = queue_size
+        self.backlog = backlog
+        self.backlog_users = backlog_users
+        self.backlog_idle = backlog_idle
+        self.transport = None
+        self._subscribers: dict[int, set[Subscription]] = defaultdict(set)
+        # Least recently written first, so idle users are evicted first.
+        self._history: OrderedDict[int, Backlog] = OrderedDict()
+        # Whatever happened before this worker started is not retained.
+        self._last_id = self._floor = time.time_ns()
+
+    def configure(
+        self,
+        queue_size: int,
+        backlog: int,
+        backlog_users: int = 10_000,
+        backlog_idle: float = 60 * 60,
+    ):
+        self.queue_size = queue_size
+        self.backlog_users = backlog_users
+        self.backlog_idle = backlog_idle
+        if backlog != self.backlog:
+            self.backlog = backlog
+            self._history.clear()
+            self._floor = self._last_id
+
+    def next_id(self) -> int:
+        # Wall-clock based so ids from several workers sharing the
+        # LISTEN/NOTIFY transport stay comparable for Last-Event-ID resume.
+        self._last_id = max(time.time_ns(), self._last_id + 1)
+        return self._last_id
+
+    @staticmethod
+    @contextmanager
+    def held():
+        # Publishes inside the block are collected instead of sent; ids are
+        # only assigned once the caller publishes them after its commit.
+        pending: list[tuple[int, str, dict]] = []
+        token = _held.set(pending)
+        try:
+            yield pending
+        finally:
+            _held.reset(token)
+
+    async def publish(self, user_id: int, type: str, data: dict):
+        if (pending := _held.get()) is not None:
+            pending.append((user_id, type, data))
+            return None
+
+        event = Event(self.next_id(), user_id, type, data)
+
+        if self.transport:
+            try:
+                await self.transport.send(event)
+            except Exception:
+                # The write is already committed; other workers miss the
+                # event, but subscribers here still get it.
+                logger.exception('sending %s event failed', type)
+                self.deliver(event)
+        else:
+            self.deliver(event)
+
+        return event
+
+    def deliver(self, event: Event):
+        self._last_id = max(self._last_id, event.id)
+        self._remember(event)
+
+        for subscription in list(self._subscribers.get(event.user_id, ())):
+            try:
+                subscription.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # A slow consumer is cut off instead of buffering without
+                # bound; it reconnects with Last-Event-ID and replays.
+                subscription.overflowed = True
+                self.unsubscribe(subscription)
+
+    def _remember(self, event: Event):
+        backlog = self._history.get(event.user_id)
+        if backlog is None:
+            backlog = self._history[event.user_id] = Backlog(
+                deque(maxlen=self.backlog), self._floor
+            )
+        else:
+            self._history.move_to_end(event.user_id)
+
+        if len(backlog.events) == backlog.events.maxlen:
+            backlog.floor = (
+                backlog.events[0].id if backlog.events else event.id
+            )
+        backlog.events.append(event)
+
+        idle = time.time_ns() - int(self.backlog_idle * 1_000_000_000)
+        # The user just written to is always kept.
+        while len(self._history) > 1:
+            user_id, oldest = next(iter(self._history.items()))
+            newest = oldest.events[-1].id if oldest.events else oldest.floor
+            if len(self._history) <= self.backlog_users and newest > idle:
+                break
+            del self._history[user_id]
+            self._floor = max(self._floor, newest)
+
+    def replay(self, user_id: int, last_event_id: int | None):
+        if last_event_id is None:
+            return []
+
+        backlog = self._history.get(user_id)
+        floor = self._floor if backlog is None else backlog.floor
+        events = [
+            event
+            for event in (backlog.events if backlog else ())
+            if event.id > last_event_id
+        ]
+        if last_event_id < floor:
+            # Events in between were dropped; the client has to resync,
+            # e.g. from /todos/changes, before applying the rest.
+            return [Event(floor, user_id, 'reset', {}), *events]
+        return events
+
+    def reset(self):
+        # Events were lost: cut every subscriber off so it resumes, and
+        # resuming from before now starts with a reset.
+        self._floor = self.next_id()
+        for backlog in self._history.values():
+            backlog.floor = self._floor
+        for subscribers in list(self._subscribers.values()):
+            for subscription in list(subscribers):
+                subscription.overflowed = True
+                self.unsubscribe(subscription)
+
+    def subscribe(self, user_id: int) -> Subscription:
+        subscription = Subscription(
+            user_id, asyncio.Queue(maxsize=self.queue_size)
+        )
+        self._subscribers[user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscribers = self._subscribers.get(subscription.user_id)
+        if subscribers is None:
+            return
+
+        subscribers.discard(subscription)
+        if not subscribers:
+            del self._subscribers[subscription.user_id]
+
+    def subscriber_count(self, user_id: int) -> int:
+        return len(self._subscribers.get(user_id, ()))
+
+
+async def event_stream(
+    broker: Broker,
+    user_id: int,
+    last_event_id: int | None = None,
+    heartbeat: float = 15.0,
+):
+    subscription = broker.subscribe(user_id)
+    last_sent = last_event_id or 0
+
+    try:
+        for event in broker.replay(user_id, last_event_id):
+            last_sent = event.id
+            yield event.encode()
+
+        while not subscription.overflowed or not subscription.queue.empty():
+            try:
+                event = await asyncio.wait_for(
+                    subscription.queue.get(),
+                    timeout=heartbeat,
+                )
+            except TimeoutError:
+                yield ': ping\n\n'
+                continue
+
+            if event.id <= last_sent:
+                continue
+
+            last_sent = event.id
+            yield event.encode()
+    finally:
+        broker.unsubscribe(subscription)
+
+
+class PostgresTransport:
+    def __init__(self, broker: Broker, database_url: str):
+        self.broker = broker
+        self.conninfo = (
+            make_url(database_url)
+            .set(drivername='postgresql')
+            .render_as_string(hide_password=False)
+        )
+        self._send_conn = None
+        self._listen_conn = None
+        self._listener = None
+
+    async def _connect(self, *, listen: bool = False):
+        import psycopg  # noqa: PLC0415
+
+        conn = await psycopg.AsyncConnection.connect(
+            self.conninfo, autocommit=True
+        )
+        if listen:
+            await conn.execute(f'LISTEN {PG_CHANNEL}')
+        return conn
+
+    async def start(self):
+        self._send_conn = await self._connect()
+        self._listen_conn = await self._connect(listen=True)
+        self._listener = asyncio.create_task(self._listen())
+        self._listener.add_done_callback(self._listener_done)
+        self.broker.transport = self
+
+    async def stop(self):
+        self.broker.transport = None
+
+        if self._listener:
+            self._listener.cancel()
+        for conn in (self._listen_conn, self._send_conn):
+            if conn:
+                await conn.close()
+
+    async def send(self, event: Event):
+        payload = json.dumps({
+            'id': event.id,
+            'user_id': event.user_id,
+            'type': event.type,
+            'data': event.data,
+        })
+
+        if len(payload.encode()) > PG_PAYLOAD_LIMIT:
+            # NOTIFY payloads are capped at 8000 bytes; fall back to the
+            # id so clients can re-read the todo themselves.
+            payload = json.dumps({
+                'id': event.id,
+                'user_id': event.user_id,
+                'type': event.type,
+                'data': {'id': event.data.get('id')},
+            })
+
+        if self._send_conn.closed:  # type: ignore
+            self._send_conn = await self._connect()
+        await self._send_conn.execute(  # type: ignore
+            'SELECT pg_notify(%s, %s)', (PG_CHANNEL, payload)
+        )
+
+    async def _listen(self):
+        delay = RECONNECT_MIN_SECONDS
+        while True:
+            try:
+                if self._listen_conn is None:
+                    await self._reconnect()
+                    delay = RECONNECT_MIN_SECONDS
+                async for notify in self._listen_conn.notifies():
+                    self._receive(notify.payload)
+            except Exception:
+                logger.exception(
+                    'listening for events failed, reconnecting in %.1f s',
+                    delay,
+                )
+
+            # Sent events only come back through LISTEN; until it is
+            # back, publishes here are delivered directly.
+            self.broker.transport = None
+            conn, self._listen_conn = self._listen_conn, None
+            if conn is not None:
+                with suppress(Exception):
+                    await conn.close()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RECONNECT_MAX_SECONDS)
+
+    async def _reconnect(self):
+        self._listen_conn = await self._connect(listen=True)
+        # Whatever other workers sent meanwhile never arrived.
+        self.broker.reset()
+        self.broker.transport = self
+
+    def _receive(self, payload: str):
+        try:
+            self.broker.deliver(Event(**json.loads(payload)))
+        except Exception:
+            logger.exception('dropping malformed event %.200r', payload)
+
+    def _listener_done(self, task: asyncio.Task):
+        if task.cancelled() or task.exception() is None:
+            return
+        self.broker.transport = None
+        logger.error('event listener stopped', exc_info=task.exception())
+
+
+# Process-wide hub: subscribers and publishers of every app instance in
+# this worker meet here, and the optional transport links the workers.
+broker = Broker()
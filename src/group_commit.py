@@ -0,0 +1,149 @@
+import asyncio
+
+from sqlalchemy import insert
+from sqlalchemy.exc import DataError, IntegrityError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from src.database import begin_outer_transaction
+from src.metrics import metrics
+
+type Pending = list[tuple[dict, asyncio.Future]]
+
+
+def session_engine(session: AsyncSession) -> AsyncEngine:
+    # The engine a request session is routed to, shard included.
+    shards = session.info.get('shards')
+    if shards is not None:
+        return shards.engines[session.info.get('shard', 0)]
+    return session.bind  # type: ignore
+
+
+class GroupInsert:
+    def __init__(self, model: type, name: str):
+        self.model = model
+        self.name = name
+        self._pending: dict[AsyncEngine, Pending] = {}
+        self._timers: dict[AsyncEngine, asyncio.TimerHandle] = {}
+        self._tasks: set[asyncio.Task] = set()
+        self.configure(window=0.002, max_size=100)
+
+    def configure(self, window: float, max_size: int):
+        self.window = window
+        self.max_size = max_size
+
+    async def insert(self, engine: AsyncEngine, values: dict):
+        # Waits for the batch this row lands in; the row comes back loaded
+        # and detached, the same as after commit with expire_on_commit off.
+        future = asyncio.get_running_loop().create_future()
+        pending = self._pending.setdefault(engine, [])
+        pending.append((values, future))
+
+        if len(pending) >= self.max_size:
+            self._flush(engine)
+        elif len(pending) == 1:
+            self._timers[engine] = asyncio.get_running_loop().call_later(
+                self.window, self._flush, engine
+            )
+
+        # The batch is written even if this request goes away meanwhile.
+        return await asyncio.shield(future)
+
+    def _flush(self, engine: AsyncEngine):
+        if timer := self._timers.pop(engine, None):
+            timer.cancel()
+
+        pending = self._pending.pop(engine, [])
+        if not pending:
+            return
+
+        task = asyncio.get_running_loop().create_task(
+            self._write(engine, pending)
+        )
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _execute(self, engine: AsyncEngine, rows: list[dict]) -> list:
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            # One multi-row INSERT ... RETURNING on PostgreSQL. On SQLite the
+            # version default is a SQL expression, which SQLAlchemy cannot
+            # batch, so each row gets its own INSERT; still one commit.
+            result = await session.scalars(
+                insert(self.model).returning(
+                    self.model, sort_by_parameter_order=True
+                ),
+                rows,
+            )
+            objects = result.all()
+            try:
+                await session.commit()
+            except Exception as exc:
+                # The rows may or may not have been written; retrying could
+                # write them twice.
+                return [exc] * len(rows)
+
+        metrics.incr(f'{self.name}.batches')
+        metrics.incr(f'{self.name}.rows', len(rows))
+        return objects
+
+    async def _execute_each(
+        self, engine: AsyncEngine, rows: list[dict]
+    ) -> list:
+        # One row after another on a single connection, each in its own
+        # savepoint: a bad row fails alone without a checkout per row.
+        results: list = []
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            await begin_outer_transaction(session)
+            for row in rows:
+                try:
+                    async with session.begin_nested():
+                        result = await session.scalars(
+                            insert(self.model).returning(self.model), [row]
+                        )
+                        results.append(result.one())
+                except (IntegrityError, DataError) as exc:
+                    results.append(exc)
+            try:
+                await session.commit()
+            except Exception as exc:
+                return [exc] * len(rows)
+
+        written = sum(not isinstance(obj, Exception) for obj in results)
+        metrics.incr(f'{self.name}.rows', written)
+        return results
+
+    async def _retry(
+        self, engine: AsyncEngine, rows: list[dict], exc: Exception
+    ) -> list:
+        if len(rows) == 1:
+            return [exc]
+
+        # The INSERT was refused, so nothing was written and one bad row
+        # must not fail its neighbours.
+        metrics.incr(f'{self.name}.retried')
+        try:
+            return await self._execute_each(engine, rows)
+        except Exception as error:
+            return [error] * len(rows)
+
+    async def _write(self, engine: AsyncEngine, pending: Pending):
+        rows = [values for values, _ in pending]
+        try:
+            objects = await self._execute(engine, rows)
+        except (IntegrityError, DataError) as exc:
+            objects = await self._retry(engine, rows, exc)
+        except Exception as exc:
+            objects = [exc] * len(rows)
+
+        for (_, future), obj in zip(pending, objects, strict=True):
+            if future.done():
+                continue
+            if isinstance(obj, Exception):
+                # The request sees the same error a direct insert raises.
+                future.set_exception(obj)
+            else:
+                future.set_result(obj)
+
+    async def drain(self):
+        for engine in list(self._pending):
+            self._flush(engine)
+        await asyncio.gather(*self._tasks)
@@ -0,0 +1,403 @@
+import asyncio
+import hashlib
+import logging
+import time
+from dataclasses import dataclass
+from datetime import UTC, datetime, timedelta
+from http import HTTPStatus
+from typing import Annotated
+
+from fastapi import Depends, Header, HTTPException, Request
+from sqlalchemy import Row, delete, update
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src import queries
+from src.database import BATCH_SESSION, get_request_session
+from src.group_commit import session_engine
+from src.metrics import metrics
+from src.models import IdempotencyKey, User
+from src.security import get_current_user
+
+logger = logging.getLogger(__name__)
+
+# The claim a request holds; IdempotencyMiddleware stores its response.
+IDEMPOTENCY_CLAIM = 'app.idempotency_claim'
+POLL_SECONDS = 0.05
+PURGE_INTERVAL_SECONDS = 60.0
+PURGE_BATCH = 1000
+
+type RawHeaders = list[tuple[bytes, bytes]]
+
+
+def _now() -> datetime:
+    return datetime.now(UTC).replace(tzinfo=None)
+
+
+@dataclass(frozen=True, slots=True)
+class Claim:
+    engine: AsyncEngine
+    user_id: int
+    key: str
+    fingerprint: str
+
+
+@dataclass(frozen=True, slots=True)
+class StoredResponse:
+    fingerprint: str
+    status_code: int
+    headers: list
+    body: bytes
+    expires_at: datetime
+
+    def response(self) -> Response:
+        response = Response(self.body, self.status_code)
+        response.raw_headers = [
+            (name.encode('latin-1'), value.encode('latin-1'))
+            for name, value in self.headers
+        ] + [(b'idempotent-replayed', b'true')]
+        return response
+
+
+class IdempotentReplay(Exception):
+    def __init__(self, response: Response):
+        super().__init__()
+        self.response = response
+
+
+async def replay_response(request: Request, exc: IdempotentReplay):
+    return exc.response
+
+
+class IdempotencyStore:
+    def __init__(self):
+        self.configure()
+
+    def configure(
+        self,
+        *,
+        ttl: float = 24 * 60 * 60,
+        lock_timeout: float = 60.0,
+        wait_timeout: float = 10.0,
+        cache_size: int = 10_000,
+    ):
+        self.ttl = timedelta(seconds=ttl)
+        self.lock_timeout = timedelta(seconds=lock_timeout)
+        self.wait_timeout = wait_timeout
+        self.cache_size = cache_size
+        # Finished responses never change, so every worker may keep them.
+        self._cache: dict[tuple[int, str], StoredResponse] = {}
+        self._flights: dict[tuple[int, str], asyncio.Future] = {}
+        self._purged_at = 0.0
+
+    def _cached(self, user_id: int, key: str) -> StoredResponse | None:
+        stored = self._cache.get((user_id, key))
+        if stored is not None and stored.expires_at <= _now():
+            del self._cache[user_id, key]
+            return None
+        return stored
+
+    def _remember(self, user_id: int, key: str, stored: StoredResponse):
+        if len(self._cache) >= self.cache_size:
+            del self._cache[next(iter(self._cache))]
+        self._cache[user_id, key] = stored
+
+    async def _load(
+        self, session: AsyncSession, user_id: int, key: str
+    ) -> StoredResponse | Row | None:
+        # A finished response, a claim still waiting for one, or None.
+        result = await session.execute(queries.idempotency_key(user_id, key))
+        record = result.first()
+
+        if record is None or record.expires_at <= _now():
+            return None
+        if record.status_code is None:
+            return record
+
+        stored = StoredResponse(
+            record.fingerprint,
+            record.status_code,
+            record.headers or [],
+            record.body or b'',
+            record.expires_at,
+        )
+        self._remember(user_id, key, stored)
+        return stored
+
+    async def _claim(
+        self, session: AsyncSession, user_id: int, key: str, fingerprint: str
+    ) -> bool:
+        # Left uncommitted: the request's own commit publishes the claim
+        # together with what it wrote, and a rollback takes both back.
+        now = _now()
+        await session.execute(
+            delete(IdempotencyKey).where(
+                IdempotencyKey.user_id == user_id,
+                IdempotencyKey.key == key,
+                IdempotencyKey.expires_at <= now,
+            )
+        )
+        claimed = await session.scalar(
+            queries.claim_idempotency_key(
+                session.get_bind().dialect.name,
+                {
+                    'user_id': user_id,
+                    'key': key,
+                    'fingerprint': fingerprint,
+                    'expires_at': now + self.ttl,
+                },
+            )
+        )
+        return claimed is not None
+
+    async def _wait(self, user_id: int, key: str, remaining: float):
+        flight = self._flights.get((user_id, key))
+        if flight is None:
+            await asyncio.sleep(min(POLL_SECONDS, remaining))
+            return
+
+        try:
+            async with asyncio.timeout(remaining):
+                await asyncio.shield(flight)
+        except TimeoutError:
+            pass
+
+    async def begin(
+        self, request: Request, session: AsyncSession, user_id: int, key: str
+    ):
+        body = await request.body()
+        fingerprint = hashlib.sha256(
+            b'\0'.join((
+                request.method.encode(),
+                request.url.path.encode(),
+                request.url.query.encode(),
+                body,
+            ))
+        ).hexdigest()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.wait_timeout
+        waited = False
+
+        while True:
+            found = self._cached(user_id, key)
+            if found is None and (user_id, key) not in self._flights:
+                # Duplicates in this worker wait above without a query.
+                found = await self._load(session, user_id, key)
+                if found is None and await self._claim(
+                    session, user_id, key, fingerprint
+                ):
+                    metrics.incr('idempotency.claimed')
+                    self._flights[user_id, key] = loop.create_future()
+                    request.scope[IDEMPOTENCY_CLAIM] = Claim(
+                        session_engine(session), user_id, key, fingerprint
+                    )
+                    return
+
+            if found is not None and found.fingerprint != fingerprint:
+                raise HTTPException(
+                    status_code=HTTPStatus.UNPROCESSABLE_ENTITY,
+                    detail='idempotency key reused for another request',
+                )
+
+            if isinstance(found, StoredResponse):
+                metrics.incr('idempotency.replayed')
+                raise IdempotentReplay(found.response())
+
+            if (
+                found is not None
+                and found.expires_at - self.ttl + self.lock_timeout <= _now()
+            ):
+                # Its request committed, then died before storing the
+                # response; running it again would repeat what it did.
+                metrics.incr('idempotency.lost')
+                raise HTTPException(
+                    status_code=HTTPStatus.CONFLICT,
+                    detail='a request with this idempotency key already '
+                    'ran; its response was not kept',
+                )
+
+            # Still running, here or in another worker.
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                metrics.incr('idempotency.conflicts')
+                raise HTTPException(
+                    status_code=HTTPStatus.CONFLICT,
+                    detail='a request with this idempotency key is running',
+                    headers={'Retry-After': '1'},
+                )
+
+            if not waited:
+                metrics.incr('idempotency.waited')
+                waited = True
+            await self._wait(user_id, key, remaining)
+
+    async def complete(
+        self, claim: Claim, status_code: int, headers: RawHeaders, body: bytes
+    ):
+        # The request's session is closed by now, so this is the only
+        # connection the request holds. Only a claim that committed with
+        # the request is there to update; one rolled back with a failure
+        # is gone, and a retry runs the request again.
+        try:
+            stored_headers = [
+                [name.decode('latin-1'), value.decode('latin-1')]
+                for name, value in headers
+            ]
+            expires_at = _now() + self.ttl
+            async with AsyncSession(claim.engine) as session:
+                result = await session.execute(
+                    update(IdempotencyKey)
+                    .where(
+                        IdempotencyKey.user_id == claim.user_id,
+                        IdempotencyKey.key == claim.key,
+                        IdempotencyKey.fingerprint == claim.fingerprint,
+                        IdempotencyKey.status_code.is_(None),
+                    )
+                    .values(
+                        status_code=status_code,
+                        headers=stored_headers,
+                        body=body,
+                        expires_at=expires_at,
+                    )
+                )
+                await self._purge(session)
+                await session.commit()
+
+            if result.rowcount:  # type: ignore
+                self._remember(
+                    claim.user_id,
+                    claim.key,
+                    StoredResponse(
+                        claim.fingerprint,
+                        status_code,
+                        stored_headers,
+                        body,
+                        expires_at,
+                    ),
+                )
+        finally:
+            self._land(claim)
+
+    async def _purge(self, session: AsyncSession):
+        # Once a minute per worker, after the response has been sent.
+        if time.monotonic() - self._purged_at < PURGE_INTERVAL_SECONDS:
+            return
+        self._purged_at = time.monotonic()
+        await session.execute(
+            queries.purge_idempotency_keys(_now(), PURGE_BATCH)
+        )
+
+    def release(self, claim: Claim):
+        # The request failed: its claim went with its rollback, or
+        # committed with its writes and stays, so only wake duplicates.
+        self._land(claim)
+
+    def _land(self, claim: Claim):
+        # Wakes duplicates waiting in this worker.
+        flight = self._flights.pop((claim.user_id, claim.key), None)
+        if flight is not None and not flight.done():
+            flight.set_result(None)
+
+
+def get_idempotency(request: Request) -> IdempotencyStore:
+    # Keys belong to a user id of this app's database; another app in
+    # the process may have a user with the same id.
+    return request.app.state.idempotency
+
+
+IdempotencyKeyHeader = Annotated[
+    str | None, Header(alias='Idempotency-Key', max_length=255)
+]
+
+
+async def idempotent(
+    request: Request,
+    session: AsyncSession = Depends(get_request_session),
+    idempotency_key: IdempotencyKeyHeader = None,
+):
+    # Batched operations run inside the batch's transaction instead.
+    if idempotency_key is None or BATCH_SESSION in request.scope:
+        return
+    await get_idempotency(request).begin(request, session, 0, idempotency_key)
+
+
+async def idempotent_for_user(
+    request: Request,
+    session: AsyncSession = Depends(get_request_session),
+    user: User = Depends(get_current_user),
+    idempotency_key: IdempotencyKeyHeader = None,
+):
+    if idempotency_key is None or BATCH_SESSION in request.scope:
+        return
+    await get_idempotency(request).begin(
+        request, session, user.id, idempotency_key
+    )
+
+
+class IdempotencyMiddleware:
+    # Innermost, so stored responses are never compressed for one client.
+    def __init__(self, app: ASGIApp, max_body_size: int = 64 * 1024):
+        self.app = app
+        self.max_body_size = max_body_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http' or not any(
+            name == b'idempotency-key' for name, _ in scope['headers']
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        store: IdempotencyStore = scope['app'].state.idempotency
+        start: Message = {}
+        chunks: list[bytes] = []
+        size = 0
+        capturing = too_large = False
+
+        async def capture(message: Message):
+            nonlocal size, capturing, too_large
+            if message['type'] == 'http.response.start':
+                # Only a claimed request keeps its response; any other,
+                # an event stream included, passes straight through.
+                capturing = IDEMPOTENCY_CLAIM in scope
+                start.update(message)
+            elif capturing and message['type'] == 'http.response.body':
+                body = message.get('body', b'')
+                size += len(body)
+                if size > self.max_body_size:
+                    capturing, too_large = False, True
+                    chunks.clear()
+                else:
+                    chunks.append(body)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, capture)
+        except BaseException:
+            if (claim := scope.get(IDEMPOTENCY_CLAIM)) is not None:
+                store.release(claim)
+            raise
+
+        if (claim := scope.get(IDEMPOTENCY_CLAIM)) is None:
+            return
+
+        if too_large:
+            # Its claim stays without a response, like a failed store.
+            metrics.incr('idempotency.too_large')
+            logger.warning('idempotent response over %d bytes not kept', size)
+            store.release(claim)
+            return
+
+        try:
+            await asyncio.shield(
+                store.complete(
+                    claim,
+                    start['status'],
+                    list(start.get('headers', [])),
+                    b''.join(chunks),
+                )
+            )
+        except Exception:
+            # The client already has its response; retries get a 409 once
+            # IDEMPOTENCY_LOCK_SECONDS have passed.
+            logger.exception('storing idempotent response failed')
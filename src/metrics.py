@@ -0,0 +1,34 @@
+from collections import Counter
+from collections.abc import Callable
+
+
+class Metrics:
+    def __init__(self):
+        self._counters: Counter[str] = Counter()
+        self._collectors: list[Callable[[], dict]] = []
+
+    def incr(self, name: str, value: int = 1):
+        self._counters[name] += value
+
+    def get(self, name: str) -> int:
+        return self._counters[name]
+
+    def register(self, collector: Callable[[], dict]):
+        self._collectors.append(collector)
+
+    def snapshot(self) -> dict:
+        data: dict = dict(sorted(self._counters.items()))
+        for collector in self._collectors:
+            data.update(collector())
+        return data
+
+    def reset(self):
+        self._counters.clear()
+
+
+def hit_rate(hits: int, misses: int) -> float | None:
+    total = hits + misses
+    return round(hits / total, 4) if total else None
+
+
+metrics = Metrics()
@@ -0,0 +1,123 @@
+import asyncio
+import zlib
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+from alembic import command
+from alembic.config import Config
+from alembic.script import ScriptDirectory
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+ALEMBIC_INI = Path(__file__).resolve().parent.parent / 'alembic.ini'
+LOCK_ID = zlib.crc32(b'alembic upgrade head')
+
+
+def alembic_config() -> Config:
+    config = Config(ALEMBIC_INI)
+    # Keep the host process' logging setup (uvicorn loggers included).
+    config.attributes['configure_logger'] = False
+    return config
+
+
+def script_head(config: Config) -> str | None:
+    return ScriptDirectory.from_config(config).get_current_head()
+
+
+async def current_revision(conn: AsyncConnection) -> str | None:
+    try:
+        result = await conn.execute(
+            text('SELECT version_num FROM alembic_version')
+        )
+        return result.scalar()
+    except DBAPIError:
+        # Fresh database: alembic has not created its table yet.
+        await conn.rollback()
+        return None
+    finally:
+        if conn.in_transaction():
+            await conn.commit()
+
+
+@asynccontextmanager
+async def migration_lock(conn: AsyncConnection):
+    if conn.dialect.name == 'postgresql':
+        await conn.execute(
+            text('SELECT pg_advisory_lock(:id)'), {'id': LOCK_ID}
+        )
+        await conn.commit()
+        try:
+            yield
+        finally:
+            await conn.rollback()
+            await conn.execute(
+                text('SELECT pg_advisory_unlock(:id)'), {'id': LOCK_ID}
+            )
+            await conn.commit()
+        return
+
+    database = conn.engine.url.database
+    if conn.dialect.name != 'sqlite' or not database or fcntl is None:
+        yield
+        return
+
+    if database == ':memory:' or database.startswith('file:'):
+        yield
+        return
+
+    with open(f'{database}.migrate.lock', 'w', encoding='utf-8') as lock:
+        await asyncio.to_thread(fcntl.flock, lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _upgrade(connection, config: Config):
+    config.attributes['connection'] = connection
+    command.upgrade(config, 'head')
+
+
+async def upgrade_to_head(
+    engine: AsyncEngine, config: Config | None = None
+) -> bool:
+    config = config or alembic_config()
+    head = script_head(config)
+
+    async with engine.connect() as conn:
+        if await current_revision(conn) == head:
+            return False
+
+        async with migration_lock(conn):
+            # Another replica may have finished while we waited.
+            if await current_revision(conn) == head:
+                return False
+
+            await conn.run_sync(_upgrade, config)
+            await conn.commit()
+
+    return True
+
+
+async def main():
+    from src.database import build_engine  # noqa: PLC0415
+    from src.settings import get_settings  # noqa: PLC0415
+
+    engine = build_engine(get_settings())
+
+    try:
+        migrated = await upgrade_to_head(engine)
+    finally:
+        await engine.dispose()
+
+    print('migrated to head' if migrated else 'already at head')
+
+
+if __name__ == '__main__':  # pragma: no cover
+    asyncio.run(main())
@@ -1,11 +1,97 @@
 from datetime import datetime
 from enum import Enum
 
-from sqlalchemy import ForeignKey, func
+from sqlalchemy import (
+    JSON,
+    BigInteger,
+    ForeignKey,
+    Index,
+    LargeBinary,
+    Sequence,
+    func,
+)
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.orm import Mapped, mapped_column, registry, relationship
+from sqlalchemy.sql.functions import FunctionElement
 
 table_registry = registry()
 
+change_version_seq = Sequence(
+    'change_version_seq', metadata=table_registry.metadata
+)
+
+
+class next_change_version(FunctionElement):
+    type = BigInteger()
+    inherit_cache = True
+
+
+@compiles(next_change_version, 'postgresql')
+def _next_change_version_postgresql(element, compiler, **kw):
+    # The transaction gets its xid before its version, so every version
+    # still in flight belongs to an xid at or above snapshot_xmin().
+    return (
+        f'(SELECT {compiler.process(change_version_seq.next_value(), **kw)}'
+        ' WHERE pg_current_xact_id() IS NOT NULL)'
+    )
+
+
+@compiles(next_change_version)
+def _next_change_version(element, compiler, **kw):
+    # Backends without sequences serialize writers, so max() + 1 over
+    # every versioned table is still monotonic.
+    return (
+        '(SELECT coalesce(max(version), 0) + 1 FROM ('
+        'SELECT max(version) AS version FROM todos UNION ALL '
+        'SELECT max(version) FROM todo_tombstones))'
+    )
+
+
+class current_xid(FunctionElement):
+    type = BigInteger()
+    inherit_cache = True
+
+
+@compiles(current_xid, 'postgresql')
+def _current_xid_postgresql(element, compiler, **kw):
+    return '(pg_current_xact_id()::text::bigint)'
+
+
+@compiles(current_xid)
+def _current_xid(element, compiler, **kw):
+    return '0'
+
+
+class snapshot_xmin(FunctionElement):
+    type = BigInteger()
+    inherit_cache = True
+
+
+@compiles(snapshot_xmin, 'postgresql')
+def _snapshot_xmin_postgresql(element, compiler, **kw):
+    return 'pg_snapshot_xmin(pg_current_snapshot())::text::bigint'
+
+
+@compiles(snapshot_xmin)
+def _snapshot_xmin(element, compiler, **kw):
+    # Writers commit in version order where they are serialized.
+    return '1'
+
+
+class snapshot_xmax(FunctionElement):
+    type = BigInteger()
+    inherit_cache = True
+
+
+@compiles(snapshot_xmax, 'postgresql')
+def _snapshot_xmax_postgresql(element, compiler, **kw):
+    return 'pg_snapshot_xmax(pg_current_snapshot())::text::bigint'
+
+
+@compiles(snapshot_xmax)
+def _snapshot_xmax(element, compiler, **kw):
+    return '1'
+
 
 @table_registry.mapped_as_dataclass
 class User:
@@ -15,6 +101,7 @@ class User:
     username: Mapped[str] = mapped_column(unique=True)
     email: Mapped[str] = mapped_column(unique=True)
     password: Mapped[str]
+    version: Mapped[int] = mapped_column(init=False)
     created_at: Mapped[datetime] = mapped_column(
         init=False, server_default=func.now()
     )
@@ -26,6 +113,25 @@ class User:
         init=False, cascade='all, delete-orphan', lazy='selectin'
     )
 
+    __mapper_args__ = {'version_id_col': version}
+
+
+@table_registry.mapped_as_dataclass
+class UserDirectory:
+    __tablename__ = 'user_directory'
+    # Only used when sharded, on shard 0: it hands out user ids and keeps
+    # usernames and emails (stored lowercased) unique across every shard.
+    id: Mapped[int] = mapped_column(init=False, primary_key=True)
+    username: Mapped[str] = mapped_column(unique=True)
+    email: Mapped[str] = mapped_column(unique=True)
+    reserved_at: Mapped[datetime]
+
+
+# Case-insensitive uniqueness; registration relies on them with a single
+# INSERT ... ON CONFLICT DO NOTHING.
+Index('ix_users_username_lower', func.lower(User.username), unique=True)
+Index('ix_users_email_lower', func.lower(User.email), unique=True)
+
 
 class TodoState(str, Enum):
     draft = 'draft'
@@ -50,3 +156,80 @@ class Todo:
     )
 
     user_id: Mapped[int] = mapped_column(ForeignKey('users.id'))
+    version: Mapped[int] = mapped_column(
+        BigInteger,
+        init=False,
+        insert_default=next_change_version(),
+        onupdate=next_change_version(),
+    )
+    # Sequence values are taken before commit, so a version is only served
+    # once every transaction that could still commit a lower one is done.
+    writer_xid: Mapped[int] = mapped_column(
+        BigInteger,
+        init=False,
+        repr=False,
+        server_default=current_xid(),
+        onupdate=current_xid(),
+    )
+
+    __table_args__ = (
+        Index('ix_todos_user_id_version', 'user_id', 'version'),
+        # One per GET /todos order_by; see FilterTodo.check_indexed.
+        Index('ix_todos_user_id_created_at', 'user_id', 'created_at', 'id'),
+        Index('ix_todos_user_id_updated_at', 'user_id', 'updated_at', 'id'),
+        Index('ix_todos_user_id_title', 'user_id', 'title', 'id'),
+        Index('ix_todos_user_id_state', 'user_id', 'state', 'id'),
+        # next_change_version's max(version) without a sequence.
+        Index('ix_todos_version', 'version').ddl_if(dialect='sqlite'),
+    )
+    # The change version doubles as the optimistic lock: the UPDATE is
+    # guarded by the loaded value and the new one comes from onupdate.
+    # On Postgres todos is hash partitioned on user_id with a (user_id, id)
+    # key, so the ORM identity carries user_id too and every flushed
+    # UPDATE/DELETE prunes to a single partition.
+    __mapper_args__ = {
+        'primary_key': [id, user_id],
+        'version_id_col': version,
+        'version_id_generator': False,
+    }
+
+
+@table_registry.mapped_as_dataclass
+class TodoTombstone:
+    __tablename__ = 'todo_tombstones'
+    id: Mapped[int] = mapped_column(init=False, primary_key=True)
+    todo_id: Mapped[int]
+    user_id: Mapped[int] = mapped_column(
+        ForeignKey('users.id', ondelete='CASCADE')
+    )
+    version: Mapped[int] = mapped_column(
+        BigInteger, init=False, insert_default=next_change_version()
+    )
+    writer_xid: Mapped[int] = mapped_column(
+        BigInteger, init=False, repr=False, server_default=current_xid()
+    )
+    deleted_at: Mapped[datetime] = mapped_column(
+        init=False, server_default=func.now()
+    )
+
+    __table_args__ = (
+        Index('ix_todo_tombstones_user_id_version', 'user_id', 'version'),
+        Index('ix_todo_tombstones_version', 'version').ddl_if(
+            dialect='sqlite'
+        ),
+    )
+
+
+@table_registry.mapped_as_dataclass
+class IdempotencyKey:
+    __tablename__ = 'idempotency_keys'
+    # 0 for requests made before signing in, i.e. POST /users/.
+    user_id: Mapped[int] = mapped_column(primary_key=True)
+    key: Mapped[str] = mapped_column(primary_key=True)
+    fingerprint: Mapped[str]
+    # Claimed in the first request's transaction, so the key only exists
+    # once what that request wrote has committed.
+    expires_at: Mapped[datetime] = mapped_column(index=True)
+    status_code: Mapped[int | None] = mapped_column(default=None)
+    headers: Mapped[list | None] = mapped_column(JSON, default=None)
+    body: Mapped[bytes | None] = mapped_column(LargeBinary, default=None)
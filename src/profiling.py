@@ -0,0 +1,197 @@
+import asyncio
+import json
+import secrets
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from types import FrameType
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+AWAIT = ('[await]', '', 0)
+
+type Frame = tuple[str, str, int]
+type Stack = tuple[Frame, ...]
+
+
+def frame_key(frame: FrameType) -> Frame:
+    code = frame.f_code
+    return code.co_qualname, code.co_filename, code.co_firstlineno
+
+
+def coroutine_frames(coro) -> list[FrameType]:
+    # Outermost first, following whatever each coroutine is awaiting.
+    frames = []
+    while coro is not None:
+        frame = getattr(coro, 'cr_frame', None) or getattr(
+            coro, 'gi_frame', None
+        )
+        if frame is None:
+            break
+        frames.append(frame)
+        coro = getattr(coro, 'cr_await', None) or getattr(
+            coro, 'gi_yieldfrom', None
+        )
+    return frames
+
+
+def thread_frames(thread_id: int) -> list[FrameType]:
+    frame = sys._current_frames().get(thread_id)
+    frames = []
+    while frame is not None:
+        frames.append(frame)
+        frame = frame.f_back
+    return frames[::-1]
+
+
+class StackSampler:
+    # Samples one asyncio task. While the task runs, the loop thread's
+    # stack is recorded, so sync work such as hashing or serializing shows
+    # up; while it is suspended, its await chain is recorded, which puts
+    # time spent waiting on the database under the code awaiting it.
+    def __init__(self, task: asyncio.Task, interval: float = 0.001):
+        self.task = task
+        self.interval = interval
+        self.thread_id = threading.get_ident()
+        self.weights: Counter[Stack] = Counter()
+        self.started = self.stopped = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.stopped = time.perf_counter()
+
+    def sample(self) -> Stack:
+        awaited = coroutine_frames(self.task.get_coro())
+        if not awaited:
+            return ()
+
+        running = thread_frames(self.thread_id)
+        if awaited[0] in running:
+            frames = running[running.index(awaited[0]) :]
+            return tuple(map(frame_key, frames))
+
+        return (*map(frame_key, awaited), AWAIT)
+
+    def _run(self):
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            if stack := self.sample():
+                self.weights[stack] += now - last
+            last = now
+
+    def collapsed(self) -> str:
+        lines = []
+        for stack, seconds in self.weights.items():
+            names = ';'.join(name.replace(';', ':') for name, *_ in stack)
+            lines.append(f'{names} {round(seconds * 1_000_000)}')
+        return '\n'.join(lines) + '\n'
+
+    def speedscope(self, name: str) -> dict:
+        frames: dict[Frame, int] = {}
+        samples, weights = [], []
+        for stack, seconds in self.weights.items():
+            samples.append([frames.setdefault(f, len(frames)) for f in stack])
+            weights.append(seconds)
+
+        return {
+            '$schema': 'https://www.speedscope.app/file-format-schema.json',
+            'shared': {
+                'frames': [
+                    {'name': name, 'file': file, 'line': line}
+                    for name, file, line in frames
+                ]
+            },
+            'profiles': [
+                {
+                    'type': 'sampled',
+                    'name': name,
+                    'unit': 'seconds',
+                    'startValue': 0,
+                    'endValue': self.stopped - self.started,
+                    'samples': samples,
+                    'weights': weights,
+                }
+            ],
+            'name': name,
+            'exporter': 'src.profiling',
+        }
+
+
+def write_profile(
+    directory: Path, profile_id: str, name: str, sampler: StackSampler
+):
+    directory.mkdir(parents=True, exist_ok=True)
+    (directory / f'{profile_id}.collapsed').write_text(sampler.collapsed())
+    (directory / f'{profile_id}.speedscope.json').write_text(
+        json.dumps(sampler.speedscope(name))
+    )
+
+
+def prune_profiles(directory: Path, retention: int):
+    profiles = sorted(
+        directory.glob('*.collapsed'), key=lambda path: path.stat().st_mtime_ns
+    )
+    for path in profiles[: max(len(profiles) - retention, 0)]:
+        path.unlink(missing_ok=True)
+        path.with_suffix('.speedscope.json').unlink(missing_ok=True)
+
+
+class ProfilingMiddleware:
+    def __init__(  # noqa: PLR0913, PLR0917
+        self,
+        app: ASGIApp,
+        token: str,
+        directory: str,
+        retention: int = 20,
+        interval: float = 0.001,
+    ):
+        self.app = app
+        self.token = token
+        self.directory = Path(directory)
+        self.retention = retention
+        self.interval = interval
+
+    def authorized(self, scope: Scope) -> bool:
+        given = Headers(scope=scope).get('x-profile', '')
+        return bool(self.token) and secrets.compare_digest(
+            given.encode(), self.token.encode()
+        )
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http' or not self.authorized(scope):
+            await self.app(scope, receive, send)
+            return
+
+        stamp = time.strftime('%Y%m%dT%H%M%S')
+        profile_id = f'{stamp}-{secrets.token_hex(4)}'
+
+        async def send_with_profile_id(message: Message):
+            if message['type'] == 'http.response.start':
+                headers = MutableHeaders(raw=message['headers'])
+                headers.append('X-Profile-Id', profile_id)
+            await send(message)
+
+        sampler = StackSampler(asyncio.current_task(), self.interval)
+        sampler.start()
+
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            sampler.stop()
+            name = f'{scope["method"]} {scope["path"]}'
+            await asyncio.to_thread(self.save, profile_id, name, sampler)
+
+    def save(self, profile_id: str, name: str, sampler: StackSampler):
+        write_profile(self.directory, profile_id, name, sampler)
+        prune_profiles(self.directory, self.retention)
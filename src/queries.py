@@ -0,0 +1,365 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from dataclasses import dataclass, fields
+from datetime import datetime
+
+from sqlalchemy import (
+    Delete,
+    Insert,
+    Result,
+    Select,
+    Update,
+    cast,
+    delete,
+    false,
+    func,
+    lambda_stmt,
+    null,
+    select,
+    true,
+    tuple_,
+    union_all,
+    update,
+)
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import lazyload, noload
+from sqlalchemy.sql.lambdas import StatementLambdaElement
+
+from src.models import (
+    IdempotencyKey,
+    Todo,
+    TodoState,
+    TodoTombstone,
+    User,
+    UserDirectory,
+    snapshot_xmax,
+    snapshot_xmin,
+)
+
+
+# Read-only endpoints select just these columns and map rows into plain
+# records: no entity, identity map entry or attribute state per row.
+@dataclass(slots=True)
+class UserRecord:
+    id: int
+    username: str
+    email: str
+    version: int
+
+
+@dataclass(slots=True)
+class TodoRecord:
+    id: int
+    title: str
+    description: str
+    state: TodoState
+    created_at: datetime
+    updated_at: datetime
+
+
+USER_COLUMNS = tuple(getattr(User, f.name) for f in fields(UserRecord))
+TODO_COLUMNS = tuple(getattr(Todo, f.name) for f in fields(TodoRecord))
+
+
+def records[T](record: type[T], result: Result) -> list[T]:
+    return [record(*row) for row in result]
+
+
+def user_by_username(username: str) -> StatementLambdaElement:
+    # Every authenticated request runs this; the selectin load of all the
+    # user's todos is left to the few places that touch User.todos.
+    return lambda_stmt(
+        lambda: (
+            select(User)
+            .where(User.username == username)
+            .options(lazyload(User.todos))
+        )
+    )
+
+
+def user_by_id(user_id: int) -> StatementLambdaElement:
+    return lambda_stmt(lambda: select(*USER_COLUMNS).where(User.id == user_id))
+
+
+def user_by_username_or_email(
+    username: str, email: str
+) -> StatementLambdaElement:
+    # Matches the lower() unique indexes, so both sides use the index.
+    return lambda_stmt(
+        lambda: (
+            select(User)
+            .where(
+                (func.lower(User.username) == func.lower(username))
+                | (func.lower(User.email) == func.lower(email))
+            )
+            .options(lazyload(User.todos))
+        )
+    )
+
+
+def insert_user(dialect_name: str, values: dict) -> Insert:
+    insert = (
+        postgresql.insert if dialect_name == 'postgresql' else sqlite.insert
+    )
+    # Only a taken username is skipped, through its lower() index; ON
+    # CONFLICT takes one target, so a taken email raises IntegrityError
+    # like every other violation. A new user has no todos to load.
+    return (
+        insert(User)
+        .values(**values)
+        .on_conflict_do_nothing(index_elements=[func.lower(User.username)])
+        .returning(User)
+        .options(noload(User.todos))
+    )
+
+
+def directory_entry(username: str, email: str) -> StatementLambdaElement:
+    username, email = username.lower(), email.lower()
+    # Plain rows, so they outlive the rollbacks around reclaiming.
+    return lambda_stmt(
+        lambda: select(
+            UserDirectory.id,
+            UserDirectory.username,
+            UserDirectory.email,
+            UserDirectory.reserved_at,
+        ).where(
+            (UserDirectory.username == username)
+            | (UserDirectory.email == email)
+        )
+    )
+
+
+def directory_user_id(username: str) -> StatementLambdaElement:
+    username = username.lower()
+    return lambda_stmt(
+        lambda: select(UserDirectory.id).where(
+            UserDirectory.username == username
+        )
+    )
+
+
+def reserve_user(
+    dialect_name: str, username: str, email: str, reserved_at: datetime
+) -> Insert:
+    insert = (
+        postgresql.insert if dialect_name == 'postgresql' else sqlite.insert
+    )
+    # The id comes from shard 0's sequence, so it is never handed out
+    # twice; only the username and email constraints can conflict.
+    return (
+        insert(UserDirectory)
+        .values(
+            username=username.lower(),
+            email=email.lower(),
+            reserved_at=reserved_at,
+        )
+        .on_conflict_do_nothing()
+        .returning(UserDirectory.id)
+    )
+
+
+def rename_directory_entry(user_id: int, username: str, email: str) -> Update:
+    return (
+        update(UserDirectory)
+        .where(UserDirectory.id == user_id)
+        .values(username=username.lower(), email=email.lower())
+    )
+
+
+def release_directory_entry(user_id: int) -> Delete:
+    return delete(UserDirectory).where(UserDirectory.id == user_id)
+
+
+def rehash_user_password(user_id: int, old: str, new: str) -> Update:
+    # Guarded by the old hash: a password changed since the login read it
+    # is left alone.
+    return (
+        update(User)
+        .where(User.id == user_id, User.password == old)
+        .values(password=new, version=User.version + 1)
+    )
+
+
+def users_page(offset: int, limit: int) -> StatementLambdaElement:
+    return lambda_stmt(
+        lambda: (
+            select(*USER_COLUMNS).order_by(User.id).limit(limit).offset(offset)
+        )
+    )
+
+
+def user_todo(user_id: int, todo_id: int) -> StatementLambdaElement:
+    return lambda_stmt(
+        lambda: select(Todo).where(Todo.user_id == user_id, Todo.id == todo_id)
+    )
+
+
+def encode_cursor(todo: TodoRecord, order_by: str) -> str:
+    value = getattr(todo, order_by)
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    elif isinstance(value, TodoState):
+        value = value.value
+
+    return urlsafe_b64encode(json.dumps([value, todo.id]).encode()).decode()
+
+
+def _cursor_value(value: object, order_by: str):
+    if not isinstance(value, str):
+        raise ValueError('malformed cursor')
+
+    if order_by in {'created_at', 'updated_at'}:
+        value = datetime.fromisoformat(value)
+        # The columns are naive UTC, as encode_cursor wrote them.
+        if value.tzinfo is not None:
+            raise ValueError('malformed cursor')
+    elif order_by == 'state':
+        value = TodoState(value)
+    return value
+
+
+def decode_cursor(cursor: str, order_by: str) -> tuple:
+    # Raises ValueError for anything encode_cursor did not produce.
+    try:
+        value, todo_id = json.loads(urlsafe_b64decode(cursor))
+    except TypeError as exc:
+        raise ValueError('malformed cursor') from exc
+
+    if type(todo_id) is not int:
+        raise ValueError('malformed cursor')
+    return _cursor_value(value, order_by), todo_id
+
+
+def user_todos(  # noqa: PLR0913, PLR0917
+    user_id: int,
+    offset: int,
+    limit: int,
+    title: str | None = None,
+    description: str | None = None,
+    state: TodoState | None = None,
+    *,
+    order_by: str | None = None,
+    descending: bool = False,
+    after: datetime | None = None,
+    cursor: tuple | None = None,
+) -> StatementLambdaElement:
+    # Each optional filter is its own lambda, so every combination of
+    # filters gets its own cache entry and the values stay bound params.
+    stmt = lambda_stmt(
+        lambda: select(*TODO_COLUMNS).where(Todo.user_id == user_id)
+    )
+
+    if title:
+        stmt += lambda s: s.filter(Todo.title.contains(title))
+
+    if description:
+        stmt += lambda s: s.filter(Todo.description.contains(description))
+
+    if state:
+        stmt += lambda s: s.filter(Todo.state == state)
+
+    if order_by:
+        # Walks ix_todos_user_id_<order_by> in either direction; the id
+        # breaks ties so the cursor position is exact.
+        column = getattr(Todo, order_by)
+
+        if after is not None:
+            stmt += lambda s: s.filter(column > after)
+
+        if cursor:
+            value, todo_id = cursor
+            position = tuple_(value, todo_id)
+
+        if cursor and descending:
+            stmt += lambda s: s.filter(tuple_(column, Todo.id) < position)
+        elif cursor:
+            stmt += lambda s: s.filter(tuple_(column, Todo.id) > position)
+
+        if descending:
+            stmt += lambda s: s.order_by(column.desc(), Todo.id.desc())
+        else:
+            stmt += lambda s: s.order_by(column, Todo.id)
+
+    stmt += lambda s: s.offset(offset).limit(limit)
+
+    return stmt
+
+
+def todo_changes(user_id: int, since: int, limit: int) -> Select:
+    # One statement, so todos and tombstones come from the same snapshot,
+    # and only versions no running transaction can undercut any more.
+    todos = (
+        select(*TODO_COLUMNS, Todo.version, false().label('deleted'))
+        .where(
+            Todo.user_id == user_id,
+            Todo.version > since,
+            Todo.writer_xid < snapshot_xmin(),
+        )
+        .order_by(Todo.version)
+        .limit(limit)
+        .subquery()
+    )
+    tombstones = (
+        select(
+            TodoTombstone.todo_id.label('id'),
+            *(cast(null(), c.type).label(c.name) for c in TODO_COLUMNS[1:]),
+            TodoTombstone.version,
+            true().label('deleted'),
+        )
+        .where(
+            TodoTombstone.user_id == user_id,
+            TodoTombstone.version > since,
+            TodoTombstone.writer_xid < snapshot_xmin(),
+        )
+        .order_by(TodoTombstone.version)
+        .limit(limit)
+        .subquery()
+    )
+    changes = union_all(select(todos), select(tombstones)).subquery()
+
+    return select(changes).order_by(changes.c.version).limit(limit)
+
+
+def changes_watermark_lag() -> Select:
+    # Transaction ids started since the oldest one still running; the
+    # changes feed cannot move past that one until it ends.
+    return select(snapshot_xmax() - snapshot_xmin())
+
+
+def idempotency_key(user_id: int, key: str) -> StatementLambdaElement:
+    # Plain rows: polled in the request's session, where entities would
+    # keep showing the first state they were loaded in.
+    return lambda_stmt(
+        lambda: select(
+            IdempotencyKey.fingerprint,
+            IdempotencyKey.expires_at,
+            IdempotencyKey.status_code,
+            IdempotencyKey.headers,
+            IdempotencyKey.body,
+        ).where(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key)
+    )
+
+
+def claim_idempotency_key(dialect_name: str, values: dict) -> Insert:
+    insert = (
+        postgresql.insert if dialect_name == 'postgresql' else sqlite.insert
+    )
+    # Returns nothing when another request holds the key.
+    return (
+        insert(IdempotencyKey)
+        .values(**values)
+        .on_conflict_do_nothing()
+        .returning(IdempotencyKey.key)
+    )
+
+
+def purge_idempotency_keys(now: datetime, limit: int) -> Delete:
+    # A bounded batch, so a purge never holds its locks for long.
+    expired = (
+        select(IdempotencyKey.user_id, IdempotencyKey.key)
+        .where(IdempotencyKey.expires_at <= now)
+        .limit(limit)
+    )
+    return delete(IdempotencyKey).where(
+        tuple_(IdempotencyKey.user_id, IdempotencyKey.key).in_(expired)
+    )
@@ -0,0 +1,53 @@
+from http import HTTPStatus
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+
+from src.metrics import metrics
+from src.models import User
+from src.schemas import FilterSlowQueries, FilterTraces
+from src.security import get_admin_user
+from src.slow_queries import slow_query_log
+from src.tracing import TracedRoute
+
+router = APIRouter(prefix='/admin', tags=['admin'], route_class=TracedRoute)
+
+AdminUserAnnotated = Annotated[User, Depends(get_admin_user)]
+
+
+@router.get('/metrics', status_code=HTTPStatus.OK)
+def read_metrics(admin_user: AdminUserAnnotated):
+    return metrics.snapshot()
+
+
+@router.get('/traces', status_code=HTTPStatus.OK)
+def read_traces(
+    request: Request,
+    admin_user: AdminUserAnnotated,
+    traces_filter: Annotated[FilterTraces, Query()],
+):
+    return request.app.state.traces.traces(
+        traces_filter.limit, traces_filter.min_duration_ms
+    )
+
+
+@router.get('/traces/{trace_id}', status_code=HTTPStatus.OK)
+def read_trace(
+    trace_id: str, request: Request, admin_user: AdminUserAnnotated
+):
+    trace = request.app.state.traces.get(trace_id)
+
+    if not trace:
+        raise HTTPException(
+            status_code=HTTPStatus.NOT_FOUND, detail='trace not found'
+        )
+
+    return trace
+
+
+@router.get('/slow-queries', status_code=HTTPStatus.OK)
+def read_slow_queries(
+    admin_user: AdminUserAnnotated,
+    slow_queries_filter: Annotated[FilterSlowQueries, Query()],
+):
+    return slow_query_log.entries(slow_queries_filter.limit)
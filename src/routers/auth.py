@@ -3,33 +3,44 @@ from typing import Annotated
 
 from fastapi import APIRouter, Depends, HTTPException
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy import select
+from pwdlib import PasswordHash
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.database import get_session
+from src import queries
+from src.database import get_request_session
+from src.metrics import metrics
 from src.models import User
 from src.schemas import Token
 from src.security import (
     create_access_token,
+    find_user_by_username,
+    get_app_password_hasher,
     get_current_user,
-    verify_password,
+    verify_and_update_password,
 )
+from src.settings import Settings, get_app_settings
+from src.sharding import ShardMap, get_shards
+from src.tracing import TracedRoute
 
-router = APIRouter(prefix='/auth', tags=['auth'])
+router = APIRouter(prefix='/auth', tags=['auth'], route_class=TracedRoute)
 
 OAuth2FormAnnotated = Annotated[OAuth2PasswordRequestForm, Depends()]
-SessionAnnotated = Annotated[AsyncSession, Depends(get_session)]
+SessionAnnotated = Annotated[AsyncSession, Depends(get_request_session)]
 CurrentUserAnnotated = Annotated[User, Depends(get_current_user)]
+SettingsAnnotated = Annotated[Settings, Depends(get_app_settings)]
+ShardsAnnotated = Annotated[ShardMap, Depends(get_shards)]
+HasherAnnotated = Annotated[PasswordHash, Depends(get_app_password_hasher)]
 
 
 @router.post('/token', status_code=HTTPStatus.OK, response_model=Token)
 async def login_for_access_token(
     form_data: OAuth2FormAnnotated,
     session: SessionAnnotated,
+    settings: SettingsAnnotated,
+    shards: ShardsAnnotated,
+    hasher: HasherAnnotated,
 ):
-    user = await session.scalar(
-        select(User).where(User.username == form_data.username)
-    )
+    user = await find_user_by_username(session, shards, form_data.username)
 
     if not user:
         raise HTTPException(
@@ -37,19 +48,40 @@ async def login_for_access_token(
             detail='incorrect username or password',
         )
 
-    if not verify_password(form_data.password, user.password):
+    valid, updated_hash = verify_and_update_password(
+        form_data.password, user.password, hasher
+    )
+
+    if not valid:
         raise HTTPException(
             status_code=HTTPStatus.UNAUTHORIZED,
             detail='incorrect username or password',
         )
 
-    access_token = create_access_token({'sub': user.username})
+    if updated_hash is not None:
+        # Stored hashes move to the current Argon2 profile as their owners
+        # log in.
+        shards.route(session, user.id)
+        await session.execute(
+            queries.rehash_user_password(user.id, user.password, updated_hash)
+        )
+        await session.commit()
+        metrics.incr('argon2.rehashed')
+
+    access_token = create_access_token(
+        {'sub': user.username, 'uid': user.id}, settings
+    )
 
     return {'access_token': access_token, 'token_type': 'Bearer'}
 
 
 @router.post('/refresh_token', status_code=HTTPStatus.OK, response_model=Token)
-def refresh_token(current_user: CurrentUserAnnotated):
-    new_access_token = create_access_token(data={'sub': current_user.username})
+def refresh_token(
+    current_user: CurrentUserAnnotated, settings: SettingsAnnotated
+):
+    new_access_token = create_access_token(
+        data={'sub': current_user.username, 'uid': current_user.id},
+        settings=settings,
+    )
 
     return {'access_token': new_access_token, 'token_type': 'Bearer'}
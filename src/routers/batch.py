@@ -0,0 +1,238 @@
+import json
+import logging
+from http import HTTPStatus
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import lazyload
+from starlette.exceptions import HTTPException
+from starlette.types import Message
+
+from src.database import (
+    BATCH_SESSION,
+    begin_outer_transaction,
+    get_request_session,
+)
+from src.events import broker
+from src.models import User
+from src.schemas import (
+    BatchOperation,
+    BatchRequest,
+    BatchResponse,
+    BatchResult,
+)
+from src.security import BATCH_USER, get_current_user
+from src.tracing import TracedRoute, tracer
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix='/batch', tags=['batch'], route_class=TracedRoute)
+
+SessionAnnotated = Annotated[AsyncSession, Depends(get_request_session)]
+CurrentUserAnnotated = Annotated[User, Depends(get_current_user)]
+
+# Sub-requests only see the connection-level parts of the batch request.
+INHERITED_SCOPE = (
+    'type',
+    'asgi',
+    'http_version',
+    'scheme',
+    'server',
+    'client',
+    'root_path',
+    'app',
+    'state',
+    'starlette.exception_handlers',
+)
+# Streams never finish and a nested batch would reuse the transaction.
+UNBATCHABLE = ('/batch', '/todos/events')
+# Signups commit on a shard of their own, and renames and deletes, when
+# sharded, commit to shard 0's user directory mid-batch.
+SIGNUP = ('POST', '/users')
+SHARDED_USER_WRITES = ('PUT', 'DELETE')
+
+
+def _result(status: int, raw_headers: list, body: bytes) -> BatchResult:
+    headers = {
+        name.decode('latin-1'): value.decode('latin-1')
+        for name, value in raw_headers
+    }
+    headers.pop('content-length', None)
+    content_type = headers.pop('content-type', '')
+
+    if not body:
+        payload = None
+    elif content_type.startswith('application/json'):
+        payload = json.loads(body)
+    else:
+        payload = body.decode()
+
+    return BatchResult(status=status, headers=headers, body=payload)
+
+
+def _unbatchable(request: Request, method: str, path: str) -> bool:
+    path = path.rstrip('/')
+    if path in UNBATCHABLE or (method, path) == SIGNUP:
+        return True
+    return (
+        request.app.state.shards.sharded
+        and method in SHARDED_USER_WRITES
+        and path.startswith('/users/')
+    )
+
+
+def _sub_scope(
+    request: Request,
+    operation: BatchOperation,
+    session: AsyncSession,
+    user: User | None,
+    body: bytes,
+) -> dict:
+    path, _, query = operation.path.partition('?')
+    headers = [
+        (name.lower().encode('latin-1'), value.encode('latin-1'))
+        for name, value in operation.headers.items()
+    ]
+    # get_current_user returns the batch's user, but the bearer scheme
+    # still wants to see a header.
+    headers.append((
+        b'authorization',
+        request.headers['authorization'].encode('latin-1'),
+    ))
+    if body:
+        headers.append((b'content-type', b'application/json'))
+        headers.append((b'content-length', str(len(body)).encode()))
+
+    return {
+        **{
+            key: value
+            for key, value in request.scope.items()
+            if key in INHERITED_SCOPE
+        },
+        'method': operation.method,
+        'path': path,
+        'raw_path': path.encode(),
+        'query_string': query.encode(),
+        'headers': headers,
+        BATCH_SESSION: session,
+        BATCH_USER: user,
+    }
+
+
+async def _dispatch(
+    request: Request,
+    operation: BatchOperation,
+    session: AsyncSession,
+    user: User | None,
+) -> BatchResult:
+    path = operation.path.partition('?')[0]
+    if _unbatchable(request, operation.method, path):
+        return BatchResult(
+            status=HTTPStatus.BAD_REQUEST,
+            body={'detail': f'{path} cannot be batched'},
+        )
+
+    body = b''
+    if operation.body is not None:
+        body = json.dumps(operation.body).encode()
+
+    scope = _sub_scope(request, operation, session, user, body)
+    requests: list[Message] = [{'type': 'http.request', 'body': body}]
+    start: Message = {}
+    chunks: list[bytes] = []
+
+    async def receive() -> Message:
+        return requests.pop() if requests else {'type': 'http.disconnect'}
+
+    async def send(message: Message):
+        if message['type'] == 'http.response.start':
+            start.update(message)
+        elif message['type'] == 'http.response.body':
+            chunks.append(message.get('body', b''))
+
+    with tracer.span('batch.operation', method=operation.method, path=path):
+        try:
+            # The router, not the app: no compression or tracing middleware
+            # around each result.
+            await request.app.router(scope, receive, send)
+        except HTTPException as exc:
+            # Raised by the router itself for unknown paths and methods.
+            return BatchResult(
+                status=exc.status_code, body={'detail': exc.detail}
+            )
+        except Exception:
+            logger.exception(
+                'batch operation %s %s failed', operation.method, path
+            )
+            return BatchResult(
+                status=HTTPStatus.INTERNAL_SERVER_ERROR,
+                body={'detail': 'Internal Server Error'},
+            )
+
+    return _result(start['status'], start.get('headers', []), b''.join(chunks))
+
+
+def _failed(result: BatchResult) -> bool:
+    return result.status >= HTTPStatus.BAD_REQUEST
+
+
+@router.post('/', status_code=HTTPStatus.OK, response_model=BatchResponse)
+async def run_batch(
+    batch: BatchRequest,
+    request: Request,
+    session: SessionAnnotated,
+    user: CurrentUserAnnotated,
+):
+    results: list[BatchResult] = []
+    user_id = user.id
+
+    if not batch.atomic:
+        for operation in batch.operations:
+            result = await _dispatch(request, operation, session, user)
+            results.append(result)
+            if _failed(result):
+                # A failed flush leaves the session unusable until rolled
+                # back, which also expires the authenticated user.
+                await session.rollback()
+                user = await session.get(
+                    User, user_id, options=[lazyload(User.todos)]
+                )
+
+        return {'results': results, 'committed': True}
+
+    # Each sub-request's commit only releases a savepoint; the batch
+    # commits or rolls back the transaction around all of them.
+    conn = await begin_outer_transaction(session)
+
+    with broker.held() as events:
+        async with AsyncSession(
+            bind=conn,
+            join_transaction_mode='create_savepoint',
+            expire_on_commit=False,
+        ) as batch_session:
+            # Sub-requests may change the user, e.g. PUT /users/{id}.
+            user = await batch_session.merge(user, load=False)
+            for operation in batch.operations:
+                result = await _dispatch(
+                    request, operation, batch_session, user
+                )
+                results.append(result)
+                if _failed(result):
+                    break
+
+    if _failed(results[-1]):
+        await session.rollback()
+        skipped = BatchResult(
+            status=HTTPStatus.FAILED_DEPENDENCY,
+            body={'detail': 'not run: an earlier operation failed'},
+        )
+        results += [skipped] * (len(batch.operations) - len(results))
+        return {'results': results, 'committed': False}
+
+    await session.commit()
+    # Subscribers only hear about changes that were committed.
+    for event in events:
+        await broker.publish(*event)
+
+    return {'results': results, 'committed': True}
@@ -1,108 +1,279 @@
 from http import HTTPStatus
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy import select
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
+from fastapi.responses import Response, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.exc import StaleDataError
 
-from src.database import get_session
-from src.models import Todo, User
+from src import queries
+from src.database import BATCH_SESSION, get_request_session
+from src.etag import Precondition, PreconditionFailed
+from src.events import broker, event_stream
+from src.group_commit import GroupInsert, session_engine
+from src.idempotency import IDEMPOTENCY_CLAIM, idempotent_for_user
+from src.metrics import metrics
+from src.models import Todo, TodoTombstone, User
 from src.schemas import (
+    FilterChanges,
     FilterTodo,
     Message,
+    SortOrder,
+    TodoChanges,
     TodoList,
     TodoPublic,
     TodoSchema,
     TodoUpdated,
 )
 from src.security import get_current_user
+from src.settings import Settings, get_app_settings
+from src.singleflight import SingleFlight
+from src.tracing import TracedRoute
 
-router = APIRouter(prefix='/todos', tags=['todos'])
+router = APIRouter(prefix='/todos', tags=['todos'], route_class=TracedRoute)
 
-SessionAnnotated = Annotated[AsyncSession, Depends(get_session)]
+SessionAnnotated = Annotated[AsyncSession, Depends(get_request_session)]
 CurrentUserAnnotated = Annotated[User, Depends(get_current_user)]
+PreconditionAnnotated = Annotated[Precondition, Depends()]
+SettingsAnnotated = Annotated[Settings, Depends(get_app_settings)]
 
+# As of the last changes read; see read_todo_changes.
+watermark = {'lag_xids': 0}
+metrics.register(
+    lambda: {'todos.changes.watermark_lag_xids': watermark['lag_xids']}
+)
+# With TODO_GROUP_COMMIT, concurrent creates share one transaction and
+# commit, and on PostgreSQL one INSERT.
+inserts = GroupInsert(Todo, 'todos.group_commit')
 
-@router.post('/', status_code=HTTPStatus.CREATED, response_model=TodoPublic)
-async def create_todo(
-    todo: TodoSchema, session: SessionAnnotated, user: CurrentUserAnnotated
-):
-    new_todo = Todo(
-        title=todo.title,
-        description=todo.description,
-        state=todo.state,
-        user_id=user.id,
+
+def get_reads(request: Request) -> SingleFlight:
+    # One per app: user ids from different databases must not meet.
+    return request.app.state.reads
+
+
+ReadsAnnotated = Annotated[SingleFlight, Depends(get_reads)]
+
+
+def _read_key(user: User, route: str, params):
+    return (user.id, route, *sorted(params.model_dump(mode='json').items()))
+
+
+def _json(body: bytes) -> Response:
+    return Response(content=body, media_type='application/json')
+
+
+async def _read(request: Request, key, fetch) -> Response:
+    # A batched read may see the batch's uncommitted writes, which must not
+    # be handed to other requests.
+    if BATCH_SESSION in request.scope:
+        return _json(await fetch())
+
+    return _json(await get_reads(request).do(key, fetch))
+
+
+def _todo_payload(todo: Todo):
+    return TodoPublic.model_validate(todo, from_attributes=True).model_dump(
+        mode='json'
     )
 
-    session.add(new_todo)
-    await session.commit()
-    await session.refresh(new_todo)
 
+@router.post(
+    '/',
+    status_code=HTTPStatus.CREATED,
+    response_model=TodoPublic,
+    dependencies=[Depends(idempotent_for_user)],
+)
+async def create_todo(  # noqa: PLR0913, PLR0917
+    request: Request,
+    todo: TodoSchema,
+    session: SessionAnnotated,
+    user: CurrentUserAnnotated,
+    precondition: PreconditionAnnotated,
+    settings: SettingsAnnotated,
+):
+    values = todo.model_dump() | {'user_id': user.id}
+
+    # A batch, or an idempotency claim, needs the row inside its own
+    # transaction.
+    if (
+        settings.TODO_GROUP_COMMIT
+        and BATCH_SESSION not in request.scope
+        and IDEMPOTENCY_CLAIM not in request.scope
+    ):
+        engine = session_engine(session)
+        # The group writes on a connection of its own; holding this one
+        # while waiting could leave the pool empty for the group.
+        await session.close()
+        new_todo = await inserts.insert(engine, values)
+    else:
+        new_todo = Todo(**values)
+        session.add(new_todo)
+        await session.commit()
+        await session.refresh(new_todo)
+
+    get_reads(request).forget(user.id)
+    await broker.publish(user.id, 'todo.created', _todo_payload(new_todo))
+
+    precondition.set_etag(new_todo.version)
     return new_todo
 
 
 @router.get('/', status_code=HTTPStatus.OK, response_model=TodoList)
 async def read_todos(
+    request: Request,
     todo_filter: Annotated[FilterTodo, Query()],
     session: SessionAnnotated,
     user: CurrentUserAnnotated,
 ):
-    query = select(Todo).where(Todo.user_id == user.id)
+    order_by = todo_filter.order_by.value if todo_filter.order_by else None
+    after = todo_filter.created_after or todo_filter.updated_after
+    cursor = None
 
-    if todo_filter.title:
-        query = query.filter(Todo.title.contains(todo_filter.title))
+    if todo_filter.cursor is not None:
+        try:
+            cursor = queries.decode_cursor(todo_filter.cursor, order_by)
+        except ValueError:
+            raise HTTPException(
+                status_code=HTTPStatus.UNPROCESSABLE_ENTITY,
+                detail='invalid cursor',
+            )
 
-    if todo_filter.description:
-        query = query.filter(
-            Todo.description.contains(todo_filter.description)
+    async def fetch() -> bytes:
+        result = await session.execute(
+            queries.user_todos(
+                user.id,
+                todo_filter.offset,
+                todo_filter.limit,
+                title=todo_filter.title,
+                description=todo_filter.description,
+                state=todo_filter.state,
+                order_by=order_by,
+                descending=todo_filter.order == SortOrder.desc,
+                after=after,
+                cursor=cursor,
+            )
         )
+        page = queries.records(queries.TodoRecord, result)
+        next_cursor = None
+        if order_by and len(page) == todo_filter.limit:
+            next_cursor = queries.encode_cursor(page[-1], order_by)
 
-    if todo_filter.state:
-        query = query.filter(Todo.state == todo_filter.state)
+        todo_list = TodoList.model_validate(
+            {'todos': page, 'next_cursor': next_cursor}, from_attributes=True
+        )
+        # Unordered pages have no cursor and keep their old shape.
+        return todo_list.model_dump_json(exclude_none=True).encode()
 
-    todos = await session.scalars(
-        query.offset(todo_filter.offset).limit(todo_filter.limit)
-    )
+    key = _read_key(user, 'todos', todo_filter)
+    return await _read(request, key, fetch)
 
-    return {'todos': todos.all()}
+
+@router.get('/changes', status_code=HTTPStatus.OK, response_model=TodoChanges)
+async def read_todo_changes(
+    request: Request,
+    changes_filter: Annotated[FilterChanges, Query()],
+    session: SessionAnnotated,
+    user: CurrentUserAnnotated,
+):
+    """Changes after `since`, oldest version first.
+
+    A change is only listed once every transaction that started before
+    its writer has ended, so a later page never reveals a lower version.
+    Any long-running transaction in the database, even one that never
+    touches todos, therefore holds the feed back: it returns nothing new
+    until that transaction ends. The todos.changes.watermark_lag_xids
+    metric shows how far behind the feed is.
+    """
+    since, limit = changes_filter.since, changes_filter.limit
+
+    async def fetch() -> bytes:
+        result = await session.execute(
+            queries.todo_changes(user.id, since, limit + 1)
+        )
+        changes = result.all()
+        watermark['lag_xids'] = await session.scalar(
+            queries.changes_watermark_lag()
+        )
+        page = changes[:limit]
+
+        todo_changes = TodoChanges.model_validate(
+            {
+                'todos': [c for c in page if not c.deleted],
+                'deleted': [c for c in page if c.deleted],
+                'version': page[-1].version if page else since,
+                'has_more': len(changes) > limit,
+            },
+            from_attributes=True,
+        )
+        return todo_changes.model_dump_json().encode()
+
+    key = _read_key(user, 'changes', changes_filter)
+    return await _read(request, key, fetch)
+
+
+@router.get('/events', status_code=HTTPStatus.OK)
+async def stream_todo_events(
+    request: Request,
+    user: CurrentUserAnnotated,
+    last_event_id: Annotated[int | None, Header()] = None,
+):
+    heartbeat = request.app.state.settings.EVENTS_HEARTBEAT_SECONDS
+
+    return StreamingResponse(
+        event_stream(broker, user.id, last_event_id, heartbeat),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
 
 
 @router.patch(
     '/{todo_id}', status_code=HTTPStatus.OK, response_model=TodoPublic
 )
-async def patch_todo(
+async def patch_todo(  # noqa: PLR0913, PLR0917
     todo_id: int,
     todo: TodoUpdated,
     session: SessionAnnotated,
     user: CurrentUserAnnotated,
+    precondition: PreconditionAnnotated,
+    reads: ReadsAnnotated,
 ):
-    db_todo = await session.scalar(
-        select(Todo).where(Todo.user_id == user.id, Todo.id == todo_id)
-    )
+    db_todo = await session.scalar(queries.user_todo(user.id, todo_id))
 
     if not db_todo:
         raise HTTPException(
             status_code=HTTPStatus.NOT_FOUND, detail='task not found'
         )
 
+    precondition.check(db_todo.version)
+
     todo_data = todo.model_dump(exclude_unset=True)
     for key, value in todo_data.items():
         setattr(db_todo, key, value)
 
-    session.add(db_todo)
-    await session.commit()
+    try:
+        session.add(db_todo)
+        await session.commit()
+    except StaleDataError:
+        raise PreconditionFailed()
+
     await session.refresh(db_todo)
 
+    reads.forget(user.id)
+    await broker.publish(user.id, 'todo.updated', _todo_payload(db_todo))
+
+    precondition.set_etag(db_todo.version)
     return db_todo
 
 
 @router.delete('/{todo_id}', status_code=HTTPStatus.OK, response_model=Message)
 async def delete_todo(
-    todo_id: int, session: SessionAnnotated, user: CurrentUserAnnotated
+    todo_id: int,
+    session: SessionAnnotated,
+    user: CurrentUserAnnotated,
+    reads: ReadsAnnotated,
 ):
-    todo = await session.scalar(
-        select(Todo).where(Todo.user_id == user.id, Todo.id == todo_id)
-    )
+    todo = await session.scalar(queries.user_todo(user.id, todo_id))
 
     if not todo:
         raise HTTPException(
@@ -110,6 +281,10 @@ async def delete_todo(
         )
 
     await session.delete(todo)
+    session.add(TodoTombstone(todo_id=todo.id, user_id=user.id))
     await session.commit()
 
+    reads.forget(user.id)
+    await broker.publish(user.id, 'todo.deleted', {'id': todo_id})
+
     return {'message': 'task deleted'}
@@ -1,49 +1,210 @@
+from datetime import UTC, datetime, timedelta
 from http import HTTPStatus
 from typing import Annotated
 
 from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy import select
+from pwdlib import PasswordHash
+from sqlalchemy import Row
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.exc import StaleDataError
 
-from src.database import get_session
+from src import queries
+from src.database import get_request_session
+from src.etag import Precondition, PreconditionFailed
+from src.idempotency import idempotent
 from src.models import User
 from src.schemas import FilterPage, Message, UserList, UserPublic, UserSchema
 from src.security import (
+    get_app_password_hasher,
     get_current_user,
     get_password_hash,
 )
+from src.sharding import ShardMap, get_shards, merge_pages
+from src.tracing import TracedRoute
 
-router = APIRouter(prefix='/users', tags=['users'])
+router = APIRouter(prefix='/users', tags=['users'], route_class=TracedRoute)
 
-SessionAnnotated = Annotated[AsyncSession, Depends(get_session)]
+SessionAnnotated = Annotated[AsyncSession, Depends(get_request_session)]
 CurrentUserAnnotated = Annotated[User, Depends(get_current_user)]
+PreconditionAnnotated = Annotated[Precondition, Depends()]
+ShardsAnnotated = Annotated[ShardMap, Depends(get_shards)]
+HasherAnnotated = Annotated[PasswordHash, Depends(get_app_password_hasher)]
 
 
-@router.post('/', status_code=HTTPStatus.CREATED, response_model=UserPublic)
-async def create_user(user: UserSchema, session: SessionAnnotated):
-    db_user = await session.scalar(
-        select(User).where(
-            (User.username == user.username) | (User.email == user.email)
+# A reservation this old whose user is not on its shard was left by a
+# signup that died in between; its username and email are free again.
+RESERVATION_GRACE = timedelta(minutes=5)
+
+
+def _now() -> datetime:
+    return datetime.now(UTC).replace(tzinfo=None)
+
+
+def _check_available(user: UserSchema, db_user: User | Row | None):
+    if db_user is None:
+        return
+
+    if db_user.username.lower() == user.username.lower():
+        raise HTTPException(
+            status_code=HTTPStatus.CONFLICT, detail='username already exists'
+        )
+
+    if db_user.email.lower() == user.email.lower():
+        raise HTTPException(
+            status_code=HTTPStatus.CONFLICT, detail='email already exists'
+        )
+
+
+async def _find_taken(
+    session: AsyncSession, shards: ShardMap, user: UserSchema
+) -> User | Row | None:
+    if shards.sharded:
+        shards.route_directory(session)
+        result = await session.execute(
+            queries.directory_entry(user.username, user.email)
         )
+        return result.first()
+
+    return await session.scalar(
+        queries.user_by_username_or_email(user.username, user.email)
     )
 
-    if db_user:
-        if db_user.username == user.username:
-            raise HTTPException(
-                status_code=HTTPStatus.CONFLICT,
-                detail='username already exists',
+
+async def _reclaim(
+    session: AsyncSession, shards: ShardMap, user: UserSchema
+) -> bool:
+    # Frees names held by signups that died; the deletes commit with
+    # this request, like everything else a signup writes.
+    shards.route_directory(session)
+    entries = await session.execute(
+        queries.directory_entry(user.username, user.email)
+    )
+    stale = [
+        entry.id
+        for entry in entries
+        if entry.reserved_at < _now() - RESERVATION_GRACE
+    ]
+
+    reclaimed = False
+    for user_id in stale:
+        shards.route(session, user_id)
+        found = (await session.execute(queries.user_by_id(user_id))).first()
+        if found is None:
+            shards.route_directory(session)
+            await session.execute(queries.release_directory_entry(user_id))
+            reclaimed = True
+    return reclaimed
+
+
+async def _reserve(
+    session: AsyncSession, shards: ShardMap, user: UserSchema
+) -> int:
+    # Left uncommitted, so the signup never commits or rolls back halfway
+    # and its idempotency claim stays with it. Concurrent signups for the
+    # same names wait on the row; shard 0 was joined first and commits
+    # first, and a user whose own shard then fails leaves a reservation
+    # that a later signup reclaims.
+    for _ in range(2):
+        shards.route_directory(session)
+        user_id = await session.scalar(
+            queries.reserve_user(
+                session.get_bind().dialect.name,
+                user.username,
+                user.email,
+                _now(),
             )
-        elif db_user.email == user.email:
-            raise HTTPException(
-                status_code=HTTPStatus.CONFLICT, detail='email already exists'
+        )
+        if user_id is not None:
+            return user_id
+        if not await _reclaim(session, shards, user):
+            break
+
+    _check_available(user, await _find_taken(session, shards, user))
+    raise HTTPException(
+        status_code=HTTPStatus.CONFLICT,
+        detail='username or email already exists',
+    )
+
+
+async def _sync_directory(
+    session: AsyncSession, shards: ShardMap, user_id: int
+):
+    # Points the directory back at whatever the user's row holds.
+    await session.rollback()
+    shards.route(session, user_id)
+    found = (await session.execute(queries.user_by_id(user_id))).first()
+    await session.rollback()
+    if found is not None:
+        shards.route_directory(session)
+        await session.execute(
+            queries.rename_directory_entry(
+                user_id, found.username, found.email
             )
+        )
+        await session.commit()
+    shards.route(session, user_id)
+
+
+async def _undo_signup(session: AsyncSession, user: UserSchema):
+    # A concurrent signup won between the check and the insert; only now
+    # look up which field collided. The rollback also takes back the
+    # reservation and the idempotency claim.
+    await session.rollback()
+    _check_available(
+        user,
+        await session.scalar(
+            queries.user_by_username_or_email(user.username, user.email)
+        ),
+    )
+
+
+@router.post(
+    '/',
+    status_code=HTTPStatus.CREATED,
+    response_model=UserPublic,
+    dependencies=[Depends(idempotent)],
+)
+async def create_user(
+    user: UserSchema,
+    session: SessionAnnotated,
+    shards: ShardsAnnotated,
+    hasher: HasherAnnotated,
+):
+    # Cheap index lookup first, so taken names never pay for Argon2.
+    taken = await _find_taken(session, shards, user)
+    if taken is not None and shards.sharded:
+        if await _reclaim(session, shards, user):
+            taken = await _find_taken(session, shards, user)
+    _check_available(user, taken)
+
+    values = user.model_dump() | {
+        'password': get_password_hash(user.password, hasher),
+        'version': 1,
+    }
+
+    if shards.sharded:
+        values['id'] = await _reserve(session, shards, user)
+        shards.route(session, values['id'])
+
+    dialect_name = session.get_bind().dialect.name
+    try:
+        db_user = await session.scalar(
+            queries.insert_user(dialect_name, values)
+        )
+    except IntegrityError:
+        # A taken email, or a violation that is no conflict at all.
+        await _undo_signup(session, user)
+        raise
+
+    if db_user is None:
+        await _undo_signup(session, user)
+        raise HTTPException(
+            status_code=HTTPStatus.CONFLICT,
+            detail='username or email already exists',
+        )
 
-    user.password = get_password_hash(user.password)
-    db_user = User(**user.model_dump())
-    session.add(db_user)
     await session.commit()
-    await session.refresh(db_user)
     return db_user
 
 
@@ -52,11 +213,22 @@ async def read_users(
     session: SessionAnnotated,
     current_user: CurrentUserAnnotated,
     filter_users: Annotated[FilterPage, Query()],
+    shards: ShardsAnnotated,
 ):
-    users = await session.scalars(
-        select(User).limit(filter_users.limit).offset(filter_users.offset)
+    offset, limit = filter_users.offset, filter_users.limit
+
+    if not shards.sharded:
+        users = await session.execute(queries.users_page(offset, limit))
+        return {'users': queries.records(queries.UserRecord, users)}
+
+    # Every shard returns its first offset + limit users by id; merging
+    # the sorted pages gives the same page a single database would.
+    pages = await shards.scatter(
+        session,
+        lambda s: s.execute(queries.users_page(0, offset + limit)),
     )
-    return {'users': users}
+    pages = [queries.records(queries.UserRecord, page) for page in pages]
+    return {'users': merge_pages(pages, offset, limit)}
 
 
 @router.get('/{user_id}', status_code=HTTPStatus.OK, response_model=UserPublic)
@@ -64,41 +236,79 @@ async def read_user(
     user_id: int,
     session: SessionAnnotated,
     current_user: CurrentUserAnnotated,
+    precondition: PreconditionAnnotated,
+    shards: ShardsAnnotated,
 ):
-    user = await session.scalar(select(User).where(User.id == user_id))
+    async with shards.session_for(user_id, session) as shard_session:
+        result = await shard_session.execute(queries.user_by_id(user_id))
+        user = result.first()
     if not user:
         raise HTTPException(
             status_code=HTTPStatus.NOT_FOUND, detail='user not found'
         )
+    precondition.set_etag(user.version)
     return user
 
 
 @router.put('/{user_id}', status_code=HTTPStatus.OK, response_model=UserPublic)
-async def update_user(
+async def update_user(  # noqa: PLR0913, PLR0917
     user_id: int,
     user: UserSchema,
     session: SessionAnnotated,
     current_user: CurrentUserAnnotated,
+    precondition: PreconditionAnnotated,
+    hasher: HasherAnnotated,
+    shards: ShardsAnnotated,
 ):
     if current_user.id != user_id:
         raise HTTPException(
             status_code=HTTPStatus.FORBIDDEN, detail='not enough permissions'
         )
 
+    precondition.check(current_user.version)
+
+    if shards.sharded:
+        # The directory takes the new names first, so no other shard can.
+        shards.route_directory(session)
+        try:
+            await session.execute(
+                queries.rename_directory_entry(
+                    user_id, user.username, user.email
+                )
+            )
+            await session.commit()
+        except IntegrityError:
+            await session.rollback()
+            raise HTTPException(
+                status_code=HTTPStatus.CONFLICT,
+                detail='username or email already exists',
+            )
+        finally:
+            shards.route(session, user_id)
+
+    user.password = get_password_hash(user.password, hasher)
+    user_data = user.model_dump(exclude_unset=True)
+    for key, value in user_data.items():
+        setattr(current_user, key, value)
+
     try:
-        user.password = get_password_hash(user.password)
-        user_data = user.model_dump(exclude_unset=True)
-        for key, value in user_data.items():
-            setattr(current_user, key, value)
         session.add(current_user)
         await session.commit()
-        await session.refresh(current_user)
-        return current_user
     except IntegrityError:
+        if shards.sharded:
+            await _sync_directory(session, shards, user_id)
         raise HTTPException(
             status_code=HTTPStatus.CONFLICT,
             detail='username or email already exists',
         )
+    except StaleDataError:
+        if shards.sharded:
+            await _sync_directory(session, shards, user_id)
+        raise PreconditionFailed()
+
+    await session.refresh(current_user)
+    precondition.set_etag(current_user.version)
+    return current_user
 
 
 @router.delete('/{user_id}', status_code=HTTPStatus.OK, response_model=Message)
@@ -106,6 +316,7 @@ async def delete_user(
     user_id: int,
     session: SessionAnnotated,
     current_user: CurrentUserAnnotated,
+    shards: ShardsAnnotated,
 ):
     if current_user.id != user_id:
         raise HTTPException(
@@ -114,4 +325,11 @@ async def delete_user(
 
     await session.delete(current_user)
     await session.commit()
+
+    if shards.sharded:
+        # Left behind if this fails; a later signup reclaims the names.
+        shards.route_directory(session)
+        await session.execute(queries.release_directory_entry(user_id))
+        await session.commit()
+
     return {'message': 'user deleted'}
@@ -1,6 +1,15 @@
-from datetime import datetime
-
-from pydantic import BaseModel, ConfigDict, EmailStr, Field
+from datetime import UTC, datetime
+from enum import Enum
+from typing import Any, Literal
+
+from pydantic import (
+    BaseModel,
+    ConfigDict,
+    EmailStr,
+    Field,
+    field_validator,
+    model_validator,
+)
 
 from src.models import TodoState
 
@@ -50,15 +59,140 @@ class TodoPublic(TodoSchema):
 
 class TodoList(BaseModel):
     todos: list[TodoPublic]
+    next_cursor: str | None = None
+
+
+class TodoOrderBy(str, Enum):
+    created_at = 'created_at'
+    updated_at = 'updated_at'
+    title = 'title'
+    state = 'state'
+
+
+class SortOrder(str, Enum):
+    asc = 'asc'
+    desc = 'desc'
 
 
 class FilterTodo(FilterPage):
     title: str | None = None
     description: str | None = None
     state: TodoState | None = None
+    order_by: TodoOrderBy | None = None
+    order: SortOrder = SortOrder.asc
+    created_after: datetime | None = None
+    updated_after: datetime | None = None
+    cursor: str | None = None
+
+    @field_validator('created_after', 'updated_after')
+    @classmethod
+    def naive_utc(cls, value: datetime | None):
+        # The columns are naive UTC timestamps.
+        if value is not None and value.tzinfo is not None:
+            return value.astimezone(UTC).replace(tzinfo=None)
+        return value
+
+    @model_validator(mode='after')
+    def check_indexed(self):
+        # Every (user_id, <order_by>, id) combination has an index; a range
+        # is only served by the index of the column it bounds.
+        bounded = [
+            column
+            for column, after in (
+                (TodoOrderBy.created_at, self.created_after),
+                (TodoOrderBy.updated_at, self.updated_after),
+            )
+            if after is not None
+        ]
+
+        if len(bounded) > 1:
+            raise ValueError(
+                'created_after and updated_after cannot be combined'
+            )
+
+        if bounded and self.order_by is None:
+            self.order_by = bounded[0]
+        elif bounded and self.order_by != bounded[0]:
+            raise ValueError(
+                f'{bounded[0].value.removesuffix("_at")}_after requires '
+                f'order_by={bounded[0].value}'
+            )
+
+        # Filters would walk the ordered index row by row to fill a page.
+        if self.order_by is not None and (
+            self.title or self.description or self.state
+        ):
+            raise ValueError(
+                'order_by cannot be combined with title, description or '
+                'state filters'
+            )
+
+        if self.cursor is not None and self.order_by is None:
+            raise ValueError('cursor requires order_by')
+
+        if self.cursor is not None and self.offset:
+            raise ValueError('cursor and offset cannot be combined')
+
+        return self
 
 
 class TodoUpdated(BaseModel):
     title: str | None = None
     description: str | None = None
     state: TodoState | None = None
+
+
+class FilterTraces(BaseModel):
+    limit: int = Field(20, ge=1)
+    min_duration_ms: float = Field(0, ge=0)
+
+
+class FilterSlowQueries(BaseModel):
+    limit: int = Field(20, ge=1)
+
+
+class FilterChanges(BaseModel):
+    since: int = Field(0, ge=0)
+    limit: int = Field(100, ge=1)
+
+
+class TodoChange(TodoPublic):
+    version: int
+
+
+class TodoTombstonePublic(BaseModel):
+    id: int
+    version: int
+
+
+class TodoChanges(BaseModel):
+    todos: list[TodoChange]
+    deleted: list[TodoTombstonePublic]
+    version: int
+    has_more: bool
+
+
+class BatchOperation(BaseModel):
+    method: Literal['GET', 'POST', 'PUT', 'PATCH', 'DELETE']
+    # Path and query string, e.g. /todos/?state=todo
+    path: str = Field(pattern=r'^/')
+    body: Any = None
+    headers: dict[str, str] = {}
+
+
+class BatchRequest(BaseModel):
+    operations: list[BatchOperation] = Field(min_length=1, max_length=50)
+    # One transaction for all operations, stopping at the first failure;
+    # otherwise each operation commits on its own.
+    atomic: bool = True
+
+
+class BatchResult(BaseModel):
+    status: int
+    headers: dict[str, str] = {}
+    body: Any = None
+
+
+class BatchResponse(BaseModel):
+    results: list[BatchResult]
+    committed: bool
@@ -1,32 +1,151 @@
+import json
+from dataclasses import asdict, dataclass
 from datetime import datetime, timedelta
+from functools import cache
 from http import HTTPStatus
+from pathlib import Path
 from zoneinfo import ZoneInfo
 
-from fastapi import Depends, HTTPException
+from fastapi import Depends, HTTPException, Request
 from fastapi.security import OAuth2PasswordBearer
 from jwt import DecodeError, ExpiredSignatureError, decode, encode
 from pwdlib import PasswordHash
-from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from src import queries
 from src.database import get_session
-from src.models import User
-from src.settings import Settings
+from src.metrics import metrics
+from src.settings import Settings, get_app_settings, get_settings
+from src.sharding import ShardMap, get_shards
+from src.tracing import tracer
 
-pwd_context = PasswordHash.recommended()
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl='/auth/token')
-settings = Settings()  # type: ignore
 
+# Scope key under which POST /batch hands its user to sub-requests.
+BATCH_USER = 'batch.user'
 
-def get_password_hash(password: str):
-    return pwd_context.hash(password)
 
+@dataclass(frozen=True, slots=True)
+class Argon2Profile:
+    # argon2-cffi's defaults, used until the host has been calibrated
+    # with `python -m src.tools.calibrate`.
+    time_cost: int = 3
+    memory_cost: int = 64 * 1024
+    parallelism: int = 4
+    target_ms: float | None = None
+    verify_ms: float | None = None
+    host: str | None = None
 
-def verify_password(plain_password: str, hashed_password: str):
-    return pwd_context.verify(plain_password, hashed_password)
 
+def load_argon2_profile(path: str | None) -> Argon2Profile:
+    if not path or not Path(path).is_file():
+        return Argon2Profile()
 
-def create_access_token(data: dict):
+    return Argon2Profile(**json.loads(Path(path).read_text(encoding='utf-8')))
+
+
+def write_argon2_profile(path: str, profile: Argon2Profile):
+    Path(path).write_text(
+        json.dumps(asdict(profile), indent=2) + '\n', encoding='utf-8'
+    )
+
+
+@cache
+def get_argon2_profile() -> Argon2Profile:
+    return load_argon2_profile(get_settings().ARGON2_PROFILE_PATH)
+
+
+def build_password_hasher(profile: Argon2Profile) -> PasswordHash:
+    # argon2's cffi bindings are only loaded when something hashes.
+    from pwdlib.hashers.argon2 import Argon2Hasher  # noqa: PLC0415
+
+    return PasswordHash((
+        Argon2Hasher(
+            time_cost=profile.time_cost,
+            memory_cost=profile.memory_cost,
+            parallelism=profile.parallelism,
+        ),
+    ))
+
+
+@cache
+def get_password_hasher() -> PasswordHash:
+    # For code running outside an app, such as the tools and tests.
+    return build_password_hasher(get_argon2_profile())
+
+
+def get_app_password_hasher(request: Request) -> PasswordHash:
+    return request.app.state.password_hasher
+
+
+def get_password_hash(password: str, hasher: PasswordHash | None = None):
+    with tracer.span('argon2.hash'):
+        return (hasher or get_password_hasher()).hash(password)
+
+
+def verify_password(
+    plain_password: str,
+    hashed_password: str,
+    hasher: PasswordHash | None = None,
+):
+    with tracer.span('argon2.verify'):
+        return (hasher or get_password_hasher()).verify(
+            plain_password, hashed_password
+        )
+
+
+def verify_and_update_password(
+    plain_password: str,
+    hashed_password: str,
+    hasher: PasswordHash | None = None,
+) -> tuple[bool, str | None]:
+    # The second item is a new hash when the stored one was made with
+    # weaker parameters than the current profile.
+    with tracer.span('argon2.verify'):
+        valid, updated_hash = (
+            hasher or get_password_hasher()
+        ).verify_and_update(plain_password, hashed_password)
+
+    if updated_hash is not None and _at_least_as_strong(
+        hashed_password, updated_hash
+    ):
+        # A profile calibrated on a slower host never weakens stored hashes.
+        updated_hash = None
+    return valid, updated_hash
+
+
+def _at_least_as_strong(hashed_password: str, updated_hash: str) -> bool:
+    from argon2 import extract_parameters  # noqa: PLC0415
+    from argon2.exceptions import InvalidHashError  # noqa: PLC0415
+
+    try:
+        stored = extract_parameters(hashed_password)
+    except InvalidHashError:
+        return False
+
+    current = extract_parameters(updated_hash)
+    return (
+        stored.memory_cost >= current.memory_cost
+        and stored.time_cost >= current.time_cost
+    )
+
+
+def argon2_stats() -> dict:
+    profile = get_argon2_profile()
+    return {
+        'argon2.time_cost': profile.time_cost,
+        'argon2.memory_cost': profile.memory_cost,
+        'argon2.parallelism': profile.parallelism,
+        'argon2.target_ms': profile.target_ms,
+        'argon2.verify_ms': profile.verify_ms,
+    }
+
+
+metrics.register(argon2_stats)
+
+
+def create_access_token(data: dict, settings: Settings | None = None):
+    settings = settings or get_settings()
     to_enconde = data.copy()
 
     expire = datetime.now(tz=ZoneInfo('UTC')) + timedelta(
@@ -42,38 +161,83 @@ def create_access_token(data: dict):
     return encode_jwt
 
 
-async def get_current_user(
+async def find_user_by_username(
+    session: AsyncSession, shards: ShardMap, username: str
+):
+    if shards.sharded:
+        # The directory names the one shard to ask, whatever their number.
+        shards.route_directory(session)
+        user_id = await session.scalar(queries.directory_user_id(username))
+        if user_id is None:
+            return None
+        shards.route(session, user_id)
+
+    return await session.scalar(queries.user_by_username(username))
+
+
+async def get_current_user(  # noqa: PLR0913, PLR0917
+    request: Request,
     session: AsyncSession = Depends(get_session),
     token: str = Depends(oauth2_scheme),
+    settings: Settings = Depends(get_app_settings),
+    shards: ShardMap = Depends(get_shards),
 ):
+    if (user := request.scope.get(BATCH_USER)) is not None:
+        # Authenticated once by the batch.
+        return user
+
     credentials_exception = HTTPException(
         status_code=HTTPStatus.UNAUTHORIZED,
         detail='Could not validate credentials',
         headers={'WWW-Authenticate': 'Bearer'},
     )
 
-    try:
-        payload = decode(
-            token,
-            settings.SECRET_KEY,
-            algorithms=[settings.ALGORITHM],
-        )
-        subject_username = payload.get('sub')
+    with tracer.span('jwt.decode'):
+        try:
+            payload = decode(
+                token,
+                settings.SECRET_KEY,
+                algorithms=[settings.ALGORITHM],
+            )
+            subject_username = payload.get('sub')
+            subject_id = payload.get('uid')
+
+            if not subject_username:
+                raise credentials_exception
 
-        if not subject_username:
+        except DecodeError:
             raise credentials_exception
 
-    except DecodeError:
-        raise credentials_exception
+        except ExpiredSignatureError:
+            raise credentials_exception
 
-    except ExpiredSignatureError:
-        raise credentials_exception
+    with tracer.span('user.lookup'):
+        if subject_id is None and shards.sharded:
+            # Tokens without a uid claim have to look for the user first.
+            found = await find_user_by_username(
+                session, shards, subject_username
+            )
+            subject_id = found.id if found else None
 
-    user = await session.scalar(
-        select(User).where(User.username == subject_username)
-    )
+        if subject_id is not None:
+            # The rest of the request runs on the user's shard.
+            shards.route(session, subject_id)
+
+        user = await session.scalar(queries.user_by_username(subject_username))
 
     if not user:
         raise credentials_exception
 
     return user
+
+
+async def get_admin_user(
+    current_user=Depends(get_current_user),
+    settings: Settings = Depends(get_app_settings),
+):
+    if current_user.username not in settings.ADMIN_USERNAMES:
+        raise HTTPException(
+            status_code=HTTPStatus.FORBIDDEN, detail='not enough permissions'
+        )
+
+    return current_user
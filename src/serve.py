@@ -0,0 +1,75 @@
+import asyncio
+import os
+import sys
+from importlib.util import find_spec
+
+import uvicorn
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from src.settings import Settings, get_settings
+
+
+def worker_count(settings: Settings) -> int:
+    return settings.SERVER_WORKERS or os.process_cpu_count() or 1
+
+
+def server_options(settings: Settings) -> dict:
+    return {
+        'host': settings.SERVER_HOST,
+        'port': settings.SERVER_PORT,
+        'workers': worker_count(settings),
+        'loop': 'uvloop' if find_spec('uvloop') else 'asyncio',
+        'http': 'httptools' if find_spec('httptools') else 'h11',
+        'backlog': settings.SERVER_BACKLOG,
+        'timeout_keep_alive': settings.SERVER_KEEPALIVE_SECONDS,
+        # uvicorn stops accepting on SIGTERM and waits this long for
+        # in-flight requests; the supervisor forwards it to every worker.
+        'timeout_graceful_shutdown': settings.SERVER_GRACEFUL_TIMEOUT_SECONDS,
+        'proxy_headers': True,
+        'server_header': False,
+    }
+
+
+async def self_check(engine: AsyncEngine):
+    import src.app  # noqa: F401, PLC0415
+
+    async with engine.connect() as conn:
+        await conn.execute(text('SELECT 1'))
+
+
+async def startup(settings: Settings):
+    from src.database import build_shards  # noqa: PLC0415
+    from src.migrate import upgrade_to_head  # noqa: PLC0415
+
+    shards = build_shards(settings)
+
+    try:
+        for engine in shards.engines:
+            await asyncio.wait_for(
+                self_check(engine),
+                timeout=settings.SERVER_SELF_CHECK_TIMEOUT_SECONDS,
+            )
+
+            if settings.MIGRATE_ON_STARTUP:
+                await upgrade_to_head(engine)
+    finally:
+        # Workers are spawned with fresh interpreters; nothing from this
+        # pool may leak into them.
+        await shards.dispose()
+
+
+def main():
+    settings = get_settings()
+
+    try:
+        asyncio.run(startup(settings))
+    except Exception as exc:
+        print(f'startup failed: {exc!r}', file=sys.stderr)
+        sys.exit(1)
+
+    uvicorn.run('src.app:app', **server_options(settings))
+
+
+if __name__ == '__main__':  # pragma: no cover
+    main()
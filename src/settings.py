@@ -1,3 +1,6 @@
+from functools import cache
+
+from fastapi import Request
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -10,3 +13,104 @@ class Settings(BaseSettings):
     SECRET_KEY: str
     ALGORITHM: str
     ACCESS_TOKEN_EXPIRE_MINUTES: int
+
+    # Extra shards; DATABASE_URL is always shard 0.
+    DATABASE_SHARD_URLS: list[str] = []
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_WARMUP: int = 0
+    DB_PREPARE_THRESHOLD: int | None = 5
+
+    # Concurrent POST /todos/ rows are collected for up to the window or
+    # MAX_SIZE rows and written in one transaction and commit. PostgreSQL
+    # gets one INSERT ... RETURNING; SQLite one INSERT per row, since its
+    # version default is a SQL expression.
+    TODO_GROUP_COMMIT: bool = False
+    TODO_GROUP_COMMIT_WINDOW_MS: float = 2.0
+    TODO_GROUP_COMMIT_MAX_SIZE: int = 100
+
+    # POST /users/ and POST /todos/ with an Idempotency-Key header store
+    # their response for IDEMPOTENCY_TTL_SECONDS and replay it to retries;
+    # duplicates arriving meanwhile wait up to IDEMPOTENCY_WAIT_SECONDS.
+    # A key whose request committed but never stored its response answers
+    # 409 after IDEMPOTENCY_LOCK_SECONDS rather than running again, and
+    # so does one whose response was over IDEMPOTENCY_MAX_BODY_SIZE bytes.
+    IDEMPOTENCY_TTL_SECONDS: float = 24 * 60 * 60
+    IDEMPOTENCY_LOCK_SECONDS: float = 60.0
+    IDEMPOTENCY_WAIT_SECONDS: float = 10.0
+    IDEMPOTENCY_CACHE_SIZE: int = 10_000
+    IDEMPOTENCY_MAX_BODY_SIZE: int = 64 * 1024
+
+    EVENTS_HEARTBEAT_SECONDS: float = 15.0
+    EVENTS_QUEUE_SIZE: int = 100
+    # Replayed to Last-Event-ID resumes; users idle for longer than
+    # EVENTS_BACKLOG_IDLE_SECONDS, or beyond the EVENTS_BACKLOG_USERS most
+    # recent writers, are forgotten and their resumes get a reset event.
+    EVENTS_BACKLOG: int = 500
+    EVENTS_BACKLOG_USERS: int = 10_000
+    EVENTS_BACKLOG_IDLE_SECONDS: float = 60 * 60
+    EVENTS_PG_NOTIFY: bool = False
+
+    SERVER_HOST: str = '0.0.0.0'
+    SERVER_PORT: int = 8080
+    SERVER_WORKERS: int | None = None
+    SERVER_KEEPALIVE_SECONDS: int = 5
+    SERVER_BACKLOG: int = 2048
+    SERVER_GRACEFUL_TIMEOUT_SECONDS: int = 30
+    SERVER_SELF_CHECK_TIMEOUT_SECONDS: float = 10.0
+    MIGRATE_ON_STARTUP: bool = True
+
+    # Off by default. Across all routes at most ADMISSION_LIMIT requests
+    # run (DB_POOL_SIZE + DB_MAX_OVERFLOW when unset) and
+    # ADMISSION_QUEUE_SIZE wait up to ADMISSION_QUEUE_TIMEOUT_SECONDS; the
+    # rest get a 503. ADMISSION_ROUTE_LIMITS, e.g. {'GET /todos/': 5}, cap
+    # single routes within that.
+    ADMISSION_ENABLED: bool = False
+    ADMISSION_LIMIT: int | None = None
+    ADMISSION_ROUTE_LIMITS: dict[str, int] = {}
+    ADMISSION_QUEUE_SIZE: int = 64
+    ADMISSION_QUEUE_TIMEOUT_SECONDS: float = 2.0
+    ADMISSION_RETRY_AFTER_SECONDS: int = 1
+    ADMISSION_EXEMPT: list[str] = ['GET /todos/events']
+    # Shrinks the limits while requests take longer than this.
+    ADMISSION_ADAPTIVE: bool = False
+    ADMISSION_TARGET_LATENCY_MS: float = 250.0
+    ADMISSION_MIN_LIMIT: int = 1
+
+    COMPRESSION_MINIMUM_SIZE: int = 1024
+    COMPRESSION_OFFLOAD_SIZE: int = 64 * 1024
+
+    # Requests carrying X-Profile: <PROFILING_TOKEN> are sampled and
+    # written to PROFILING_DIR.
+    PROFILING_ENABLED: bool = False
+    PROFILING_TOKEN: str = ''
+    PROFILING_DIR: str = 'profiles'
+    PROFILING_RETENTION: int = 20
+    PROFILING_INTERVAL_SECONDS: float = 0.001
+
+    TRACING_ENABLED: bool = True
+    TRACING_BUFFER_SIZE: int = 256
+    TRACING_JSONL_PATH: str | None = None
+    TRACING_JSONL_BUFFER_SIZE: int = 1024
+    TRACING_MAX_SPANS: int = 1000
+
+    SLOW_QUERY_LOG_ENABLED: bool = True
+    SLOW_QUERY_THRESHOLD_MS: float = 200.0
+    SLOW_QUERY_EXPLAIN_ANALYZE: bool = False
+    SLOW_QUERY_LOG_SIZE: int = 100
+    SLOW_QUERY_LOG_PER_MINUTE: int = 30
+
+    # Written by `python -m src.tools.calibrate`; argon2-cffi's defaults
+    # are used while it does not exist.
+    ARGON2_PROFILE_PATH: str | None = 'argon2_profile.json'
+
+    ADMIN_USERNAMES: list[str] = []
+
+
+@cache
+def get_settings() -> Settings:
+    return Settings()  # type: ignore
+
+
+def get_app_settings(request: Request) -> Settings:
+    return request.app.state.settings
@@ -0,0 +1,97 @@
+import asyncio
+import heapq
+import zlib
+from collections.abc import Awaitable, Callable, Iterable
+from contextlib import asynccontextmanager
+from itertools import islice
+from operator import attrgetter
+
+from fastapi import Request
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from sqlalchemy.orm import Session
+
+# Shard 0 also holds the user directory.
+DIRECTORY_SHARD = 0
+
+
+class ShardRoutingSession(Session):
+    # Binds to the shard stored in session.info; get_current_user sets it
+    # before the first query of the request.
+    def get_bind(self, mapper=None, clause=None, **kw):
+        shards = self.info.get('shards')
+        if shards is None:
+            return super().get_bind(mapper, clause, **kw)
+
+        return shards.engines[self.info.get('shard', 0)].sync_engine
+
+
+class ShardMap:
+    def __init__(self, engines: list[AsyncEngine]):
+        self.engines = engines
+
+    @property
+    def sharded(self) -> bool:
+        return len(self.engines) > 1
+
+    def index(self, user_id: int) -> int:
+        key = user_id.to_bytes(8, 'big', signed=True)
+        return zlib.crc32(key) % len(self.engines)
+
+    def engine_for(self, user_id: int) -> AsyncEngine:
+        return self.engines[self.index(user_id)]
+
+    def route(self, session: AsyncSession, user_id: int):
+        if self.sharded:
+            session.info['shard'] = self.index(user_id)
+
+    def route_directory(self, session: AsyncSession):
+        if self.sharded:
+            session.info['shard'] = DIRECTORY_SHARD
+
+    def session_options(self) -> dict:
+        if not self.sharded:
+            return {}
+
+        return {
+            'sync_session_class': ShardRoutingSession,
+            'info': {'shards': self},
+        }
+
+    @asynccontextmanager
+    async def session_for(self, user_id: int, session: AsyncSession):
+        if not self.sharded:
+            yield session
+            return
+
+        async with AsyncSession(
+            self.engine_for(user_id), expire_on_commit=False
+        ) as shard_session:
+            yield shard_session
+
+    async def scatter[T](
+        self,
+        session: AsyncSession,
+        query: Callable[[AsyncSession], Awaitable[T]],
+    ) -> list[T]:
+        if not self.sharded:
+            return [await query(session)]
+
+        async def run(engine: AsyncEngine) -> T:
+            async with AsyncSession(
+                engine, expire_on_commit=False
+            ) as shard_session:
+                return await query(shard_session)
+
+        return await asyncio.gather(*map(run, self.engines))
+
+    async def dispose(self):
+        await asyncio.gather(*(engine.dispose() for engine in self.engines))
+
+
+def merge_pages(pages: Iterable[Iterable], offset: int, limit: int) -> list:
+    merged = heapq.merge(*pages, key=attrgetter('id'))
+    return list(islice(merged, offset, offset + limit))
+
+
+def get_shards(request: Request) -> ShardMap:
+    return request.app.state.shards
@@ -0,0 +1,56 @@
+import asyncio
+from collections.abc import Awaitable, Callable, Hashable
+
+from src.metrics import metrics
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._flights: dict[Hashable, asyncio.Future] = {}
+
+    async def do[T](
+        self, key: tuple[Hashable, ...], fn: Callable[[], Awaitable[T]]
+    ) -> T:
+        while (flight := self._flights.get(key)) is not None:
+            try:
+                # A follower going away must not cancel the shared result.
+                result = await asyncio.shield(flight)
+            except asyncio.CancelledError:
+                # Only the leader was cancelled: take over the flight.
+                task = asyncio.current_task()
+                if not flight.cancelled() or (task and task.cancelling()):
+                    raise
+            else:
+                metrics.incr(f'{self.name}.coalesced')
+                return result
+
+        metrics.incr(f'{self.name}.executed')
+        flight = asyncio.get_running_loop().create_future()
+        self._flights[key] = flight
+
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            flight.cancel()
+            raise
+        except Exception as exc:
+            flight.set_exception(exc)
+            # Mark it retrieved, nobody may have joined this flight.
+            flight.exception()
+            raise
+        else:
+            flight.set_result(result)
+            return result
+        finally:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+    def forget(self, owner: Hashable):
+        # Requests arriving after a write must not join a flight that
+        # started before it; keys start with the owner they belong to.
+        for key in [key for key in self._flights if key[0] == owner]:
+            del self._flights[key]
+
+    def in_flight(self) -> int:
+        return len(self._flights)
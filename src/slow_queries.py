@@ -0,0 +1,168 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from collections.abc import Awaitable, Callable
+from dataclasses import asdict, dataclass
+from itertools import islice
+
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from src.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+EXPLAINABLE = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE')
+SIDE_EFFECTS = ('nextval', 'setval', 'advisory', 'notify')
+MAX_PARAMETER_ROWS = 5
+WINDOW_SECONDS = 60
+
+
+@dataclass(slots=True)
+class SlowQuery:
+    statement: str
+    parameters: object
+    duration_ms: float
+    route: str | None
+    logged_at: float
+    plan: str | None = None
+
+
+def redact(parameters):
+    # Keep the shape and the numbers (ids, limits); any string may be a
+    # password hash, an email or a token.
+    if isinstance(parameters, dict):
+        return {key: redact(value) for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [redact(value) for value in parameters[:MAX_PARAMETER_ROWS]]
+    if parameters is None or isinstance(parameters, (bool, int, float)):
+        return parameters
+    return f'<{type(parameters).__name__}>'
+
+
+def _analyzable(statement: str) -> bool:
+    # ANALYZE runs the statement again. Besides writes, which the read-only
+    # transaction refuses, these keep their effects after its rollback.
+    lowered = statement.lower()
+    return lowered.lstrip().startswith('select') and not any(
+        call in lowered for call in SIDE_EFFECTS
+    )
+
+
+async def _plan(
+    engine: AsyncEngine, prefix: str, statement: str, parameters
+) -> str:
+    # Never committed; leaving connect() rolls back.
+    async with engine.connect() as conn:
+        if engine.dialect.name == 'postgresql':
+            await conn.exec_driver_sql(
+                'SET TRANSACTION READ ONLY',
+                execution_options={'slow_query_log': False},
+            )
+        result = await conn.exec_driver_sql(
+            prefix + statement,
+            parameters,
+            execution_options={'slow_query_log': False},
+        )
+        return '\n'.join(str(row[-1]) for row in result.all())
+
+
+async def explain(
+    engine: AsyncEngine, statement: str, parameters, analyze: bool
+) -> str:
+    if engine.dialect.name == 'postgresql':
+        if analyze and _analyzable(statement):
+            try:
+                return await _plan(
+                    engine,
+                    'EXPLAIN (ANALYZE, FORMAT TEXT) ',
+                    statement,
+                    parameters,
+                )
+            except DBAPIError:
+                # Refused as a write, e.g. SELECT ... FOR UPDATE.
+                pass
+        prefix = 'EXPLAIN (FORMAT TEXT) '
+    elif engine.dialect.name == 'sqlite':
+        prefix = 'EXPLAIN QUERY PLAN '
+    else:  # pragma: no cover
+        prefix = 'EXPLAIN '
+
+    return await _plan(engine, prefix, statement, parameters)
+
+
+class SlowQueryLog:
+    def __init__(self, size: int = 100, per_minute: int = 30):
+        self._tasks: set[asyncio.Task] = set()
+        self.configure(size, per_minute)
+
+    def configure(self, size: int, per_minute: int):
+        self._entries: deque[SlowQuery] = deque(maxlen=size)
+        self._logged_at: deque[float] = deque()
+        self.per_minute = per_minute
+
+    def _allow(self) -> bool:
+        now = time.monotonic()
+        while self._logged_at and now - self._logged_at[0] >= WINDOW_SECONDS:
+            self._logged_at.popleft()
+
+        if len(self._logged_at) >= self.per_minute:
+            return False
+
+        self._logged_at.append(now)
+        return True
+
+    def record(
+        self,
+        entry: SlowQuery,
+        plan: Callable[[], Awaitable[str]] | None = None,
+    ) -> bool:
+        metrics.incr('db.slow_queries')
+        if not self._allow():
+            metrics.incr('db.slow_queries.suppressed')
+            return False
+
+        self._entries.append(entry)
+        logger.warning(
+            'slow query (%.1f ms) from %s: %s %s',
+            entry.duration_ms,
+            entry.route or '-',
+            entry.statement,
+            entry.parameters,
+        )
+
+        if plan is not None:
+            # Called from inside a statement; the plan is fetched on its
+            # own connection once the loop gets to it.
+            task = asyncio.get_running_loop().create_task(
+                self._capture_plan(entry, plan)
+            )
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+        return True
+
+    @staticmethod
+    async def _capture_plan(
+        entry: SlowQuery, plan: Callable[[], Awaitable[str]]
+    ):
+        try:
+            entry.plan = await plan()
+        except Exception as exc:
+            entry.plan = f'explain failed: {exc}'
+
+        logger.warning(
+            'plan for slow query from %s:\n%s', entry.route or '-', entry.plan
+        )
+
+    def entries(self, limit: int) -> list[dict]:
+        return [
+            asdict(entry) for entry in islice(reversed(self._entries), limit)
+        ]
+
+    async def drain(self):
+        await asyncio.gather(*self._tasks)
+
+
+slow_query_log = SlowQueryLog()
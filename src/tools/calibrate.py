@@ -0,0 +1,121 @@
+import argparse
+import platform
+import statistics
+import time
+from collections.abc import Callable
+from dataclasses import replace
+
+from src.security import (
+    Argon2Profile,
+    build_password_hasher,
+    write_argon2_profile,
+)
+
+PASSWORD = 'correct horse battery staple'
+# OWASP's minimum for Argon2id; a slow host gets slower logins instead.
+MIN_MEMORY_COST = 19 * 1024
+MIN_TIME_COST = 2
+MAX_TIME_COST = 16
+
+type Measure = Callable[[Argon2Profile, int], float]
+
+
+def measure_verify(profile: Argon2Profile, rounds: int) -> float:
+    hasher = build_password_hasher(profile)
+    hashed = hasher.hash(PASSWORD)
+
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        hasher.verify(PASSWORD, hashed)
+        samples.append((time.perf_counter() - start) * 1000)
+
+    return statistics.median(samples)
+
+
+def calibrate(  # noqa: PLR0913
+    target_ms: float,
+    max_memory_cost: int,
+    parallelism: int,
+    rounds: int = 5,
+    *,
+    measure: Measure = measure_verify,
+    report: Callable[[Argon2Profile, float], None] | None = None,
+) -> Argon2Profile:
+    def run(profile: Argon2Profile) -> float:
+        elapsed = measure(profile, rounds)
+        if report is not None:
+            report(profile, elapsed)
+        return elapsed
+
+    # Memory is what makes guessing expensive on GPUs, so keep as much of
+    # it as the target allows and spend what is left on extra passes.
+    profile = Argon2Profile(
+        time_cost=MIN_TIME_COST,
+        memory_cost=max(max_memory_cost, MIN_MEMORY_COST),
+        parallelism=parallelism,
+    )
+    elapsed = run(profile)
+    while elapsed > target_ms and profile.memory_cost > MIN_MEMORY_COST:
+        profile = replace(
+            profile,
+            memory_cost=max(profile.memory_cost // 2, MIN_MEMORY_COST),
+        )
+        elapsed = run(profile)
+
+    while profile.time_cost < MAX_TIME_COST:
+        candidate = replace(profile, time_cost=profile.time_cost + 1)
+        candidate_ms = run(candidate)
+        if candidate_ms > target_ms:
+            break
+        profile, elapsed = candidate, candidate_ms
+
+    return replace(
+        profile,
+        target_ms=target_ms,
+        verify_ms=round(elapsed, 3),
+        host=platform.node(),
+    )
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(
+        prog='python -m src.tools.calibrate',
+        description='Find Argon2 costs that verify in about --target-ms.',
+    )
+    parser.add_argument('--target-ms', type=float, default=250.0)
+    parser.add_argument('--max-memory-mib', type=int, default=64)
+    parser.add_argument('--parallelism', type=int, default=4)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--output', help='defaults to ARGON2_PROFILE_PATH')
+    args = parser.parse_args(argv)
+
+    def report(profile: Argon2Profile, elapsed: float):
+        print(
+            f't={profile.time_cost:<3} m={profile.memory_cost // 1024:>5} MiB'
+            f' p={profile.parallelism:<3} {elapsed:8.1f} ms'
+        )
+
+    profile = calibrate(
+        args.target_ms,
+        args.max_memory_mib * 1024,
+        args.parallelism,
+        args.rounds,
+        report=report,
+    )
+
+    if args.output is None:
+        from src.settings import get_settings  # noqa: PLC0415
+
+        args.output = get_settings().ARGON2_PROFILE_PATH
+
+    write_argon2_profile(args.output, profile)
+    print(
+        f'wrote {args.output}: time_cost={profile.time_cost} '
+        f'memory_cost={profile.memory_cost} parallelism={profile.parallelism}'
+        f' ({profile.verify_ms} ms)'
+    )
+
+
+if __name__ == '__main__':  # pragma: no cover
+    main()
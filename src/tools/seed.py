@@ -0,0 +1,320 @@
+import argparse
+import asyncio
+import random
+import time
+from collections.abc import Callable, Sequence
+from dataclasses import dataclass, field
+from datetime import UTC, datetime, timedelta
+from itertools import accumulate
+
+from sqlalchemy import func, insert, select, text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from src.database import build_shards
+from src.models import (
+    TodoState,
+    User,
+    UserDirectory,
+    next_change_version,
+    table_registry,
+)
+from src.security import get_password_hash
+from src.settings import get_settings
+from src.sharding import DIRECTORY_SHARD, ShardMap
+
+USER_COLUMNS = ('id', 'username', 'email', 'password', 'version')
+DIRECTORY_COLUMNS = ('id', 'username', 'email', 'reserved_at')
+TODO_COLUMNS = (
+    'title',
+    'description',
+    'state',
+    'user_id',
+    'created_at',
+    'updated_at',
+    'version',
+)
+WORDS = (
+    'buy milk call review draft send plan fix clean book pay update write '
+    'read check order move sort file prepare renew cancel schedule pick up '
+    'the a for with report invoice meeting groceries dentist car tax '
+    'kitchen garden email slides budget notes ticket release backup '
+    'friday monday weekly urgent later today tomorrow before after'
+).split()
+TEXT_WORDS = 100_000
+MAX_WORD = max(map(len, WORDS)) + 1
+DEFAULT_STATES = 'draft=1,todo=4,doing=2,done=8,trash=1'
+
+type Report = Callable[[int, int], None]
+
+
+@dataclass(frozen=True, slots=True)
+class SeedOptions:
+    users: int
+    todos_per_user: int
+    seed: int = 0
+    states: dict[TodoState, float] = field(
+        default_factory=lambda: parse_states(DEFAULT_STATES)
+    )
+    title_length: tuple[int, int] = (10, 60)
+    description_length: tuple[int, int] = (0, 400)
+    since: datetime = datetime(2025, 1, 1)
+    days: int = 365
+    password: str = 'secret'
+    batch_size: int = 50_000
+
+
+class Generator:
+    def __init__(self, options: SeedOptions):
+        self.options = options
+        self.rng = random.Random(options.seed)
+        self._states = list(options.states)
+        self._cum_weights = list(accumulate(options.states.values()))
+        self._span = timedelta(days=options.days).total_seconds()
+        # Slices of one long text are far cheaper than building every
+        # title and description word by word.
+        self._text = ' '.join(self.rng.choices(WORDS, k=TEXT_WORDS))
+
+    def text(self, bounds: tuple[int, int]) -> str:
+        length = self.rng.randint(*bounds)
+        offset = self.rng.randrange(len(self._text) - length - MAX_WORD)
+        start = self._text.index(' ', offset) + 1
+        return self._text[start : start + length].rstrip()
+
+    def user(self, user_id: int, password: str) -> tuple:
+        name = f'seed{self.options.seed}_{user_id}'
+        return (user_id, name, f'{name}@example.com', password, 1)
+
+    def directory_entry(self, user_id: int, reserved_at: datetime) -> tuple:
+        name = f'seed{self.options.seed}_{user_id}'
+        return (
+            user_id,
+            name.lower(),
+            f'{name}@example.com'.lower(),
+            reserved_at,
+        )
+
+    def todos(self, user_id: int) -> list[tuple]:
+        count = self.options.todos_per_user
+        states = self.rng.choices(
+            self._states, cum_weights=self._cum_weights, k=count
+        )
+        rows = []
+        for state in states:
+            offset = self.rng.random() * self._span
+            created_at = self.options.since + timedelta(seconds=offset)
+            updated_at = created_at + timedelta(
+                seconds=(self._span - offset) * self.rng.random()
+            )
+            rows.append((
+                self.text(self.options.title_length),
+                self.text(self.options.description_length),
+                state,
+                user_id,
+                created_at,
+                updated_at,
+            ))
+        return rows
+
+
+async def copy_rows(
+    conn: AsyncConnection, table: str, columns: Sequence[str], rows: list
+):
+    raw = await conn.get_raw_connection()
+    cursor = raw.driver_connection.cursor()  # type: ignore
+    statement = f'COPY {table} ({", ".join(columns)}) FROM STDIN'
+    async with cursor.copy(statement) as copy:
+        for row in rows:
+            await copy.write_row(row)
+
+
+async def insert_rows(
+    conn: AsyncConnection, table: str, columns: Sequence[str], rows: list
+):
+    if not rows:
+        return
+
+    if conn.dialect.name == 'postgresql':
+        await copy_rows(conn, table, columns, rows)
+        return
+
+    await conn.execute(
+        insert(table_registry.metadata.tables[table]).execution_options(
+            slow_query_log=False
+        ),
+        [dict(zip(columns, row)) for row in rows],
+    )
+
+
+async def write_chunk(
+    engine: AsyncEngine, users: list, todos: list, directory: list
+):
+    async with engine.begin() as conn:
+        if todos:
+            # Reserve one block of change versions for the whole chunk.
+            first = await conn.scalar(select(next_change_version()))
+            if conn.dialect.name == 'postgresql':
+                await conn.execute(
+                    text("SELECT setval('change_version_seq', :last)"),
+                    {'last': first + len(todos) - 1},
+                )
+            todos = [(*row, first + n) for n, row in enumerate(todos)]
+
+        await insert_rows(conn, 'user_directory', DIRECTORY_COLUMNS, directory)
+        await insert_rows(conn, 'users', USER_COLUMNS, users)
+        await insert_rows(conn, 'todos', TODO_COLUMNS, todos)
+
+
+async def finish(engine: AsyncEngine, id_table: str | None):
+    if engine.dialect.name != 'postgresql':
+        return
+
+    engine = engine.execution_options(slow_query_log=False)
+    async with engine.begin() as conn:
+        if id_table:
+            # Ids were given explicitly; signups continue after them.
+            await conn.execute(
+                text(
+                    f"SELECT setval(pg_get_serial_sequence('{id_table}', "
+                    f"'id'), max(id)) FROM {id_table}"
+                )
+            )
+        await conn.execute(text('ANALYZE users'))
+        await conn.execute(text('ANALYZE todos'))
+
+
+async def seed(
+    shards: ShardMap, options: SeedOptions, report: Report | None = None
+) -> tuple[int, int]:
+    generator = Generator(options)
+    password = get_password_hash(options.password)
+
+    # Sharded ids come from shard 0's user directory, like signups.
+    id_table = UserDirectory if shards.sharded else User
+    async with shards.engines[DIRECTORY_SHARD].connect() as conn:
+        first = 1 + await conn.scalar(
+            select(func.coalesce(func.max(id_table.id), 0))
+        )
+
+    user_ids = range(first, first + options.users)
+    chunk_size = max(1, options.batch_size // max(1, options.todos_per_user))
+    reserved_at = datetime.now(UTC).replace(tzinfo=None)
+    users_written = todos_written = 0
+
+    for start in range(0, len(user_ids), chunk_size):
+        chunks: dict[int, tuple[list, list, list]] = {
+            DIRECTORY_SHARD: ([], [], [])
+        }
+        for user_id in user_ids[start : start + chunk_size]:
+            users, todos, _ = chunks.setdefault(
+                shards.index(user_id), ([], [], [])
+            )
+            users.append(generator.user(user_id, password))
+            todos.extend(generator.todos(user_id))
+            if shards.sharded:
+                chunks[DIRECTORY_SHARD][2].append(
+                    generator.directory_entry(user_id, reserved_at)
+                )
+
+        await asyncio.gather(
+            *(
+                write_chunk(shards.engines[index], *chunk)
+                for index, chunk in chunks.items()
+            )
+        )
+        for users, todos, _ in chunks.values():
+            users_written += len(users)
+            todos_written += len(todos)
+
+        if report is not None:
+            report(users_written, todos_written)
+
+    await asyncio.gather(
+        *(
+            finish(
+                engine,
+                id_table.__tablename__ if index == DIRECTORY_SHARD else None,
+            )
+            for index, engine in enumerate(shards.engines)
+        )
+    )
+    return users_written, todos_written
+
+
+def parse_states(value: str) -> dict[TodoState, float]:
+    states = {}
+    for item in value.split(','):
+        name, _, weight = item.partition('=')
+        states[TodoState(name.strip())] = float(weight or 1)
+    return states
+
+
+def parse_range(value: str) -> tuple[int, int]:
+    low, _, high = value.partition(':')
+    return int(low), int(high or low)
+
+
+async def run(options: SeedOptions):
+    shards = build_shards(get_settings())
+    started = time.perf_counter()
+
+    def report(users: int, todos: int):
+        elapsed = time.perf_counter() - started
+        print(
+            f'{users} users {todos} todos in {elapsed:.1f} s'
+            f' ({(users + todos) / elapsed:,.0f} rows/s)'
+        )
+
+    try:
+        await seed(shards, options, report)
+    finally:
+        await shards.dispose()
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(
+        prog='python -m src.tools.seed',
+        description='Load a deterministic synthetic dataset.',
+    )
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--todos-per-user', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument(
+        '--states',
+        type=parse_states,
+        default=DEFAULT_STATES,
+        help='relative weights, states left out are not generated',
+    )
+    parser.add_argument(
+        '--title-length', type=parse_range, default='10:60', help='MIN:MAX'
+    )
+    parser.add_argument(
+        '--description-length',
+        type=parse_range,
+        default='0:400',
+        help='MIN:MAX',
+    )
+    parser.add_argument(
+        '--since', type=datetime.fromisoformat, default='2025-01-01'
+    )
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--password', default='secret')
+    parser.add_argument('--batch-size', type=int, default=50_000)
+    args = parser.parse_args(argv)
+
+    options = SeedOptions(
+        users=args.users,
+        todos_per_user=args.todos_per_user,
+        seed=args.seed,
+        states=args.states,
+        title_length=args.title_length,
+        description_length=args.description_length,
+        since=args.since,
+        days=args.days,
+        password=args.password,
+        batch_size=args.batch_size,
+    )
+    asyncio.run(run(options))
+
+
+if __name__ == '__main__':  # pragma: no cover
+    main()
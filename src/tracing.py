@@ -0,0 +1,341 @@
+import asyncio
+import inspect
+import json
+import logging
+import secrets
+import time
+from collections import deque
+from collections.abc import Callable, Iterable
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from functools import wraps
+from pathlib import Path
+from typing import Protocol
+
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+SQL_PREVIEW = 200
+
+
+@dataclass(slots=True)
+class Span:
+    id: int
+    parent_id: int | None
+    name: str
+    start: float
+    end: float | None = None
+    attributes: dict = field(default_factory=dict)
+
+    @property
+    def duration(self) -> float:
+        return (self.end or time.perf_counter()) - self.start
+
+
+@dataclass(slots=True)
+class Trace:
+    id: str
+    started_at: float
+    max_spans: int = 1000
+    spans: list[Span] = field(default_factory=list)
+    dropped_spans: int = 0
+
+    @property
+    def root(self) -> Span:
+        return self.spans[0]
+
+    def add(self, name: str, parent: Span | None, **attributes) -> Span | None:
+        # A request looping over the database stops growing its trace.
+        if len(self.spans) >= self.max_spans:
+            self.dropped_spans += 1
+            return None
+
+        span = Span(
+            len(self.spans),
+            parent.id if parent else None,
+            name,
+            time.perf_counter(),
+            attributes=attributes,
+        )
+        self.spans.append(span)
+        return span
+
+    def to_dict(self) -> dict:
+        origin = self.root.start
+        return {
+            'trace_id': self.id,
+            'name': self.root.name,
+            'started_at': self.started_at,
+            'duration_ms': round(self.root.duration * 1000, 3),
+            'dropped_spans': self.dropped_spans,
+            'spans': [
+                {
+                    'id': span.id,
+                    'parent_id': span.parent_id,
+                    'name': span.name,
+                    'offset_ms': round((span.start - origin) * 1000, 3),
+                    'duration_ms': round(span.duration * 1000, 3),
+                    'attributes': span.attributes,
+                }
+                for span in self.spans
+            ],
+        }
+
+
+class Collector(Protocol):
+    def export(self, trace: Trace) -> None: ...
+
+
+class RingBufferCollector:
+    def __init__(self, size: int = 256):
+        self._traces: deque[Trace] = deque(maxlen=size)
+
+    def export(self, trace: Trace):
+        self._traces.append(trace)
+
+    def traces(self, limit: int, min_duration_ms: float = 0) -> list[dict]:
+        found = []
+        for trace in reversed(self._traces):
+            if trace.root.duration * 1000 >= min_duration_ms:
+                found.append(trace.to_dict())
+            if len(found) == limit:
+                break
+        return found
+
+    def get(self, trace_id: str) -> dict | None:
+        for trace in self._traces:
+            if trace.id == trace_id:
+                return trace.to_dict()
+        return None
+
+
+class JsonLinesExporter:
+    # Traces wait here and are written in batches on a worker thread; when
+    # the disk falls behind, the oldest waiting ones are dropped.
+    def __init__(self, path: str, buffer_size: int = 1024):
+        self.path = Path(path)
+        self._pending: deque[Trace] = deque(maxlen=buffer_size)
+        self._flush: asyncio.Task | None = None
+
+    def export(self, trace: Trace):
+        if len(self._pending) == self._pending.maxlen:
+            metrics.incr('tracing.dropped')
+        self._pending.append(trace)
+
+        if self._flush is None or self._flush.done():
+            self._flush = asyncio.get_running_loop().create_task(
+                self._write_pending()
+            )
+
+    async def _write_pending(self):
+        while self._pending:
+            traces = list(self._pending)
+            self._pending.clear()
+            try:
+                await asyncio.to_thread(self._write, traces)
+            except Exception:
+                logger.exception('writing traces to %s failed', self.path)
+
+    def _write(self, traces: list[Trace]):
+        lines = [json.dumps(trace.to_dict()) + '\n' for trace in traces]
+        with self.path.open('a', encoding='utf-8') as file:
+            file.writelines(lines)
+
+    async def drain(self):
+        if self._flush is not None:
+            await self._flush
+
+
+_current: ContextVar[tuple[Trace, Span] | None] = ContextVar(
+    'current_span', default=None
+)
+
+
+class Tracer:
+    def __init__(self):
+        self.collectors: list[Collector] = []
+        self.max_spans = 1000
+
+    def configure(
+        self, collectors: Iterable[Collector], max_spans: int = 1000
+    ):
+        self.collectors = list(collectors)
+        self.max_spans = max_spans
+
+    @contextmanager
+    def trace(self, name: str, **attributes):
+        trace = Trace(secrets.token_hex(16), time.time(), self.max_spans)
+        trace.add(name, None, **attributes)
+        root = trace.root
+        token = _current.set((trace, root))
+        try:
+            yield trace
+        finally:
+            root.end = time.perf_counter()
+            _current.reset(token)
+            for collector in self.collectors:
+                collector.export(trace)
+
+    @staticmethod
+    @contextmanager
+    def span(name: str, **attributes):
+        # Outside of a traced request this costs one context lookup.
+        current = _current.get()
+        if current is None:
+            yield None
+            return
+
+        trace, parent = current
+        span = trace.add(name, parent, **attributes)
+        if span is None:
+            yield None
+            return
+
+        token = _current.set((trace, span))
+        try:
+            yield span
+        finally:
+            span.end = time.perf_counter()
+            _current.reset(token)
+
+    @staticmethod
+    def start_span(name: str, **attributes) -> Span | None:
+        # For callback pairs that cannot wrap a block, e.g. engine events.
+        current = _current.get()
+        if current is None:
+            return None
+
+        trace, parent = current
+        return trace.add(name, parent, **attributes)
+
+    @staticmethod
+    def end_span(span: Span | None, **attributes):
+        if span is not None:
+            span.end = time.perf_counter()
+            span.attributes.update(attributes)
+
+    def record(self, name: str, start: float, **attributes):
+        # A span that started before anything could open it.
+        if span := self.start_span(name, **attributes):
+            span.start = start
+            self.end_span(span)
+
+
+tracer = Tracer()
+
+
+def instrument_tracing(engine: AsyncEngine):
+    @event.listens_for(engine.sync_engine, 'before_cursor_execute')
+    def start_sql_span(  # noqa: PLR0913, PLR0917
+        conn, cursor, statement, parameters, context, executemany
+    ):
+        context._trace_span = tracer.start_span(
+            'sql', statement=statement[:SQL_PREVIEW]
+        )
+
+    @event.listens_for(engine.sync_engine, 'after_cursor_execute')
+    def end_sql_span(  # noqa: PLR0913, PLR0917
+        conn, cursor, statement, parameters, context, executemany
+    ):
+        tracer.end_span(getattr(context, '_trace_span', None))
+
+    @event.listens_for(engine.sync_engine, 'handle_error')
+    def end_failed_sql_span(exception_context):
+        context = exception_context.execution_context
+        tracer.end_span(
+            getattr(context, '_trace_span', None),
+            error=type(exception_context.original_exception).__name__,
+        )
+
+
+# Set per request by TracedRoute; the endpoint wrapper stores in it when
+# the endpoint returned, which may be on a threadpool worker.
+_endpoint_done: ContextVar[dict | None] = ContextVar(
+    'endpoint_done', default=None
+)
+# The matched route, e.g. 'GET /todos/{todo_id}', for code that only sees
+# the database side of a request.
+current_route: ContextVar[str | None] = ContextVar(
+    'current_route', default=None
+)
+
+
+def _mark_done(endpoint: Callable) -> Callable:
+    def done():
+        if (marker := _endpoint_done.get()) is not None:
+            marker['at'] = time.perf_counter()
+
+    if inspect.iscoroutinefunction(endpoint):
+
+        @wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            with tracer.span('endpoint'):
+                result = await endpoint(*args, **kwargs)
+            done()
+            return result
+
+    else:
+
+        @wraps(endpoint)
+        def wrapper(*args, **kwargs):
+            with tracer.span('endpoint'):
+                result = endpoint(*args, **kwargs)
+            done()
+            return result
+
+    return wrapper
+
+
+class TracedRoute(APIRoute):
+    # Splits the route into dependencies, the endpoint and serialization:
+    # whatever runs between the endpoint returning and the handler
+    # returning is FastAPI validating and encoding the response.
+    def get_route_handler(self):
+        self.dependant.call = _mark_done(self.dependant.call)
+        handler = super().get_route_handler()
+
+        async def traced_handler(request):
+            marker: dict = {}
+            token = _endpoint_done.set(marker)
+            route_token = current_route.set(f'{request.method} {self.path}')
+            try:
+                with tracer.span('route', route=self.path):
+                    response = await handler(request)
+                    if 'at' in marker:
+                        tracer.record('serialize', marker['at'])
+                return response
+            finally:
+                _endpoint_done.reset(token)
+                current_route.reset(route_token)
+
+        return traced_handler
+
+
+class TracingMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        name = f'{scope["method"]} {scope["path"]}'
+        with tracer.trace(name) as trace:
+
+            async def send_with_trace_id(message: Message):
+                if message['type'] == 'http.response.start':
+                    trace.root.attributes['status'] = message['status']
+                    headers = MutableHeaders(raw=message['headers'])
+                    headers.append('X-Trace-Id', trace.id)
+                await send(message)
+
+            await self.app(scope, receive, send_with_trace_id)
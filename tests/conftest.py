@@ -46,6 +46,10 @@ async def session(engine):
     async with engine.begin() as conn:
         await conn.run_sync(table_registry.metadata.drop_all)
 
+    # Pooled connections keep prepared statements for types that were just
+    # dropped; the next test's tables get new ones.
+    await engine.dispose()
+
 
 @contextmanager
 def _mock_db_time(*, model, time=datetime.now()):
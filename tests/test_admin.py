@@ -0,0 +1,25 @@
+from http import HTTPStatus
+
+from src.app import app
+
+
+def test_read_metrics(client, user, token, monkeypatch):
+    monkeypatch.setattr(app.state.settings, 'ADMIN_USERNAMES', [user.username])
+
+    response = client.get(
+        '/admin/metrics', headers={'Authorization': f'Bearer {token}'}
+    )
+
+    assert response.status_code == HTTPStatus.OK
+    assert 'db.compile_cache.hit_rate' in response.json()
+    assert 'db.prepared.hit_rate' in response.json()
+    assert 'argon2.memory_cost' in response.json()
+
+
+def test_read_metrics_not_admin(client, token):
+    response = client.get(
+        '/admin/metrics', headers={'Authorization': f'Bearer {token}'}
+    )
+
+    assert response.status_code == HTTPStatus.FORBIDDEN
+    assert response.json() == {'detail': 'not enough permissions'}
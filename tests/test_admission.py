@@ -0,0 +1,147 @@
+import asyncio
+import time
+from http import HTTPStatus
+
+import pytest
+from fastapi.testclient import TestClient
+
+from src.admission import AdmissionMiddleware, Limiter, Overloaded, admission
+from src.app import app, create_app
+from src.database import get_session
+
+
+@pytest.mark.asyncio
+async def test_limiter_queues_then_sheds():
+    limiter = Limiter(limit=1, queue_size=1, timeout=1)
+    await limiter.acquire()
+
+    queued = asyncio.create_task(limiter.acquire())
+    await asyncio.sleep(0)
+
+    with pytest.raises(Overloaded, match='queue_full'):
+        await limiter.acquire()
+
+    assert limiter.queued == 1
+    limiter.release()
+    await queued
+
+    assert limiter.in_flight == 1
+    assert limiter.queued == 0
+    assert limiter.shed == 1
+
+
+@pytest.mark.asyncio
+async def test_limiter_sheds_after_deadline():
+    limiter = Limiter(limit=1, queue_size=1, timeout=0.01)
+    await limiter.acquire()
+
+    with pytest.raises(Overloaded, match='deadline'):
+        await limiter.acquire()
+
+    limiter.release()
+
+    assert limiter.queued == 0
+    assert limiter.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_leaves_the_queue():
+    limiter = Limiter(limit=1, queue_size=1, timeout=1)
+    await limiter.acquire()
+
+    waiter = asyncio.create_task(limiter.acquire())
+    await asyncio.sleep(0)
+    waiter.cancel()
+    await asyncio.gather(waiter, return_exceptions=True)
+    limiter.release()
+
+    assert limiter.queued == 0
+    assert limiter.in_flight == 0
+
+
+def test_aimd_backs_off_once_per_overload():
+    limit = 10
+    limiter = Limiter(limit, queue_size=1, timeout=1, target_latency=0.1)
+    started = time.monotonic()
+
+    limiter.observe(started, 0.5)
+    limiter.observe(started, 0.5)
+
+    assert limiter.limit == limit * 0.9
+
+    for _ in range(limit):
+        limiter.observe(time.monotonic(), 0.01)
+
+    assert limiter.limit == limit
+
+
+@pytest.fixture
+def admitted_client(client, session, settings):
+    # Started after the shared client, so its lifespan configures admission.
+    admitted = create_app(
+        settings.model_copy(
+            update={
+                'ADMISSION_ENABLED': True,
+                'ADMISSION_ROUTE_LIMITS': {'GET /todos/': 2},
+            }
+        )
+    )
+    admitted.dependency_overrides[get_session] = lambda: session
+
+    with TestClient(admitted) as admitted_client:
+        yield admitted_client
+
+
+def test_admission_is_off_by_default(settings):
+    assert not settings.ADMISSION_ENABLED
+    assert not any(
+        middleware.cls is AdmissionMiddleware
+        for middleware in app.user_middleware
+    )
+
+
+def test_overloaded_routes_return_503(admitted_client, token):
+    shared = admission.shared
+    shared.in_flight, shared.queue_size = int(shared.limit), 0
+
+    response = admitted_client.get(
+        '/todos/', headers={'Authorization': f'Bearer {token}'}
+    )
+    other = admitted_client.get('/')
+
+    assert response.status_code == HTTPStatus.SERVICE_UNAVAILABLE
+    assert response.headers['retry-after'] == str(
+        admitted_client.app.state.settings.ADMISSION_RETRY_AFTER_SECONDS
+    )
+    assert other.status_code == HTTPStatus.SERVICE_UNAVAILABLE
+    assert admission.limiters('GET /todos/')[0].in_flight == 0
+
+
+def test_route_limit_only_holds_back_its_route(admitted_client, token):
+    route, shared = admission.limiters('GET /todos/')
+    route.in_flight, route.queue_size = int(route.limit), 0
+
+    response = admitted_client.get(
+        '/todos/', headers={'Authorization': f'Bearer {token}'}
+    )
+    other = admitted_client.get('/')
+
+    assert response.status_code == HTTPStatus.SERVICE_UNAVAILABLE
+    assert other.status_code == HTTPStatus.OK
+    assert shared.in_flight == 0
+    assert admission.limiters('GET /') == [shared]
+    assert admission.limiters('GET /todos/events') == []
+
+
+def test_admission_metrics(admitted_client, user, token, monkeypatch):
+    monkeypatch.setattr(
+        admitted_client.app.state.settings, 'ADMIN_USERNAMES', [user.username]
+    )
+
+    response = admitted_client.get(
+        '/admin/metrics', headers={'Authorization': f'Bearer {token}'}
+    )
+
+    assert response.json()['admission.all.in_flight'] == 1
+    assert response.json()['admission.all.queued'] == 0
+    assert 'admission.GET /admin/metrics.in_flight' not in response.json()
@@ -1,8 +1,60 @@
 from http import HTTPStatus
 
+from fastapi.testclient import TestClient
+
+from src.app import create_app
+from src.security import (
+    Argon2Profile,
+    create_access_token,
+    write_argon2_profile,
+)
+
 
 def test_read_root(client):
     response = client.get('/')
 
     assert response.status_code == HTTPStatus.OK
     assert response.json() == {'message': 'Hello world!'}
+
+
+def test_create_app_isolated_instances(settings):
+    first_app = create_app(settings)
+    second_app = create_app(
+        settings.model_copy(update={'SECRET_KEY': 'other-secret'})
+    )
+
+    with TestClient(first_app), TestClient(second_app):
+        assert first_app.state.engine is not second_app.state.engine
+        assert first_app.state.reads is not second_app.state.reads
+        assert first_app.state.idempotency is not second_app.state.idempotency
+        assert first_app.state.settings.SECRET_KEY != 'other-secret'
+        assert second_app.state.settings.SECRET_KEY == 'other-secret'
+
+
+def test_create_app_uses_its_own_settings(settings):
+    token = create_access_token({'sub': 'test'}, settings)
+    other_app = create_app(
+        settings.model_copy(update={'SECRET_KEY': 'other-secret'})
+    )
+
+    with TestClient(other_app) as client:
+        response = client.post(
+            '/auth/refresh_token', headers={'Authorization': f'Bearer {token}'}
+        )
+
+    assert response.status_code == HTTPStatus.UNAUTHORIZED
+
+
+def test_create_app_hashes_with_its_own_argon2_profile(settings, tmp_path):
+    path = tmp_path / 'argon2_profile.json'
+    write_argon2_profile(
+        str(path), Argon2Profile(time_cost=2, memory_cost=19 * 1024)
+    )
+    app = create_app(
+        settings.model_copy(update={'ARGON2_PROFILE_PATH': str(path)})
+    )
+
+    with TestClient(app):
+        password_hash = app.state.password_hasher.hash('secret')
+
+    assert f'm={19 * 1024},t=2,' in password_hash
@@ -1,6 +1,16 @@
 from http import HTTPStatus
 
+import pytest
 from freezegun import freeze_time
+from sqlalchemy import select, update
+
+from src.metrics import metrics
+from src.models import User
+from src.security import (
+    Argon2Profile,
+    build_password_hasher,
+    get_password_hasher,
+)
 
 
 def test_get_token(client, user):
@@ -93,3 +103,63 @@ def test_refresh_token(client, user):
         assert response.status_code == HTTPStatus.OK
         assert 'access_token' in token
         assert token['token_type'] == 'Bearer'
+
+
+@pytest.mark.asyncio
+async def test_login_rehashes_onto_current_profile(client, session, user):
+    old_hash = build_password_hasher(
+        Argon2Profile(time_cost=1, memory_cost=8 * 1024, parallelism=1)
+    ).hash(user.clean_password)
+    await session.execute(
+        update(User).where(User.id == user.id).values(password=old_hash)
+    )
+    await session.commit()
+    metrics.reset()
+
+    response = client.post(
+        '/auth/token',
+        data={'username': user.username, 'password': user.clean_password},
+    )
+    stored = await session.scalar(
+        select(User.password).where(User.id == user.id)
+    )
+
+    assert response.status_code == HTTPStatus.OK
+    assert stored != old_hash
+    assert not get_password_hasher().current_hasher.check_needs_rehash(stored)
+    assert metrics.get('argon2.rehashed') == 1
+
+
+def test_login_keeps_current_hash(client, user):
+    metrics.reset()
+
+    client.post(
+        '/auth/token',
+        data={'username': user.username, 'password': user.clean_password},
+    )
+
+    assert metrics.get('argon2.rehashed') == 0
+
+
+@pytest.mark.asyncio
+async def test_login_keeps_stronger_hash(client, session, user):
+    strong_hash = build_password_hasher(
+        Argon2Profile(time_cost=4, memory_cost=64 * 1024, parallelism=4)
+    ).hash(user.clean_password)
+    await session.execute(
+        update(User).where(User.id == user.id).values(password=strong_hash)
+    )
+    await session.commit()
+    metrics.reset()
+
+    response = client.post(
+        '/auth/token',
+        data={'username': user.username, 'password': user.clean_password},
+    )
+    stored = await session.scalar(
+        select(User.password).where(User.id == user.id)
+    )
+
+    assert response.status_code == HTTPStatus.OK
+    assert stored == strong_hash
+    assert metrics.get('argon2.rehashed') == 0
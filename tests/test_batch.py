@@ -0,0 +1,178 @@
+from http import HTTPStatus
+
+import pytest
+from sqlalchemy import select
+
+from src.app import app
+from src.events import broker
+from src.models import User
+
+TODO = {'title': 'batched', 'description': 'batched', 'state': 'draft'}
+
+
+def post_batch(client, token, operations, **options):
+    return client.post(
+        '/batch',
+        headers={'Authorization': f'Bearer {token}'},
+        json={'operations': operations, **options},
+    )
+
+
+def list_todos(client, token):
+    response = client.get(
+        '/todos', headers={'Authorization': f'Bearer {token}'}
+    )
+    return response.json()['todos']
+
+
+def test_batch_runs_operations_in_order(client, token):
+    response = post_batch(
+        client,
+        token,
+        [
+            {'method': 'POST', 'path': '/todos/', 'body': TODO},
+            {'method': 'GET', 'path': '/todos/?state=draft'},
+        ],
+    )
+    created, listed = response.json()['results']
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.json()['committed'] is True
+    assert created['status'] == HTTPStatus.CREATED
+    assert 'etag' in created['headers']
+    assert listed['body']['todos'] == [created['body']]
+    assert list_todos(client, token) == [created['body']]
+
+
+def test_batch_authenticates_once(client, token):
+    response = post_batch(
+        client,
+        token,
+        [{'method': 'GET', 'path': '/todos/'}] * 2,
+    )
+    trace = app.state.traces.get(response.headers['x-trace-id'])
+    names = [span['name'] for span in trace['spans']]
+
+    assert names.count('jwt.decode') == 1
+    assert names.count('batch.operation') == len(response.json()['results'])
+
+
+def test_atomic_batch_rolls_back_on_failure(client, user, token):
+    last_event_id = broker.next_id()
+
+    response = post_batch(
+        client,
+        token,
+        [
+            {'method': 'POST', 'path': '/todos/', 'body': TODO},
+            {'method': 'PATCH', 'path': '/todos/999999', 'body': {}},
+            {'method': 'POST', 'path': '/todos/', 'body': TODO},
+        ],
+    )
+    statuses = [result['status'] for result in response.json()['results']]
+
+    assert response.json()['committed'] is False
+    assert statuses == [
+        HTTPStatus.CREATED,
+        HTTPStatus.NOT_FOUND,
+        HTTPStatus.FAILED_DEPENDENCY,
+    ]
+    assert list_todos(client, token) == []
+    assert broker.replay(user.id, last_event_id) == []
+
+
+def test_atomic_batch_publishes_after_commit(client, user, token):
+    last_event_id = broker.next_id()
+
+    post_batch(
+        client, token, [{'method': 'POST', 'path': '/todos/', 'body': TODO}]
+    )
+
+    assert [event.type for event in broker.replay(user.id, last_event_id)] == [
+        'todo.created'
+    ]
+
+
+def test_independent_batch_keeps_successes(client, token):
+    response = post_batch(
+        client,
+        token,
+        [
+            {'method': 'POST', 'path': '/todos/', 'body': TODO},
+            {'method': 'PATCH', 'path': '/todos/999999', 'body': {}},
+            {'method': 'POST', 'path': '/todos/', 'body': TODO},
+        ],
+        atomic=False,
+    )
+    statuses = [result['status'] for result in response.json()['results']]
+
+    assert statuses == [
+        HTTPStatus.CREATED,
+        HTTPStatus.NOT_FOUND,
+        HTTPStatus.CREATED,
+    ]
+    assert len(list_todos(client, token)) == statuses.count(HTTPStatus.CREATED)
+
+
+@pytest.mark.parametrize(
+    ('path', 'status'),
+    [
+        ('/todos/events', HTTPStatus.BAD_REQUEST),
+        ('/batch/', HTTPStatus.BAD_REQUEST),
+        ('/missing', HTTPStatus.NOT_FOUND),
+    ],
+)
+def test_batch_rejected_operations(client, token, path, status):
+    response = post_batch(
+        client, token, [{'method': 'GET', 'path': path}], atomic=False
+    )
+
+    assert response.json()['results'][0]['status'] == status
+
+
+@pytest.mark.parametrize('path', ['/users', '/users/'])
+def test_batch_rejects_signups(client, token, path):
+    user = {'username': 'new', 'email': 'new@test.com', 'password': 'x'}
+    response = post_batch(
+        client, token, [{'method': 'POST', 'path': path, 'body': user}]
+    )
+
+    assert response.json()['results'][0]['status'] == HTTPStatus.BAD_REQUEST
+    assert response.json()['committed'] is False
+
+
+def test_batch_requires_authentication(client):
+    response = client.post(
+        '/batch', json={'operations': [{'method': 'GET', 'path': '/'}]}
+    )
+
+    assert response.status_code == HTTPStatus.UNAUTHORIZED
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('fail', [False, True])
+async def test_atomic_batch_updates_current_user(
+    client, session, user, token, fail
+):
+    user_id = user.id
+    operations = [
+        {
+            'method': 'PUT',
+            'path': f'/users/{user_id}',
+            'body': {
+                'username': 'renamed',
+                'email': 'renamed@example.com',
+                'password': 'secret',
+            },
+        }
+    ]
+    if fail:
+        operations.append({'method': 'GET', 'path': '/todos/999999'})
+
+    response = post_batch(client, token, operations)
+    username = await session.scalar(
+        select(User.username).where(User.id == user_id)
+    )
+
+    assert response.json()['committed'] is not fail
+    assert (username == 'renamed') is not fail
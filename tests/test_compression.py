@@ -0,0 +1,169 @@
+import asyncio
+import gzip
+from http import HTTPStatus
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.testclient import TestClient
+
+from src.compression import CompressionMiddleware, gzip_encoder, negotiate
+from src.models import Todo, TodoState
+
+BODY = 'x' * 2048
+
+
+@pytest.fixture
+def compressed_app():
+    app = FastAPI()
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=1024,
+        offload_size=4096,
+        encoders={'gzip': gzip_encoder},
+    )
+
+    @app.get('/small')
+    def small():
+        return PlainTextResponse('small')
+
+    @app.get('/large')
+    def large():
+        return PlainTextResponse(BODY)
+
+    @app.get('/tagged')
+    def tagged():
+        return PlainTextResponse(BODY, headers={'ETag': '"7"'})
+
+    @app.get('/huge')
+    def huge():
+        return PlainTextResponse(BODY * 4)
+
+    @app.get('/stream')
+    def stream():
+        chunks = (BODY.encode() for _ in range(5))
+        return StreamingResponse(chunks, media_type='text/plain')
+
+    @app.get('/events')
+    def events():
+        chunks = iter([b'data: 1\n\n' * 200])
+        return StreamingResponse(chunks, media_type='text/event-stream')
+
+    return app
+
+
+def get_raw(app, path, accept_encoding='gzip'):
+    client = TestClient(app)
+    with client.stream(
+        'GET', path, headers={'Accept-Encoding': accept_encoding}
+    ) as response:
+        return response, b''.join(response.iter_raw())
+
+
+@pytest.mark.parametrize(
+    ('accept_encoding', 'expected'),
+    [
+        ('gzip', 'gzip'),
+        ('br;q=1.0, gzip;q=0.8', 'br'),
+        ('gzip;q=0.5, br', 'br'),
+        ('gzip, br', 'br'),
+        ('*', 'br'),
+        ('br;q=0, *;q=0.1', 'gzip'),
+        ('gzip;q=0', None),
+        ('identity', None),
+        ('', None),
+        ('gzip;q=invalid', None),
+    ],
+)
+def test_negotiate(accept_encoding, expected):
+    assert negotiate(accept_encoding, ['br', 'gzip']) == expected
+
+
+def test_compresses_large_response(compressed_app):
+    response, body = get_raw(compressed_app, '/large')
+
+    assert response.headers['content-encoding'] == 'gzip'
+    assert response.headers['vary'] == 'Accept-Encoding'
+    assert int(response.headers['content-length']) == len(body)
+    assert gzip.decompress(body).decode() == BODY
+
+
+def test_compressed_etag_names_the_encoding(compressed_app):
+    compressed, _ = get_raw(compressed_app, '/tagged')
+    identity, _ = get_raw(compressed_app, '/tagged', 'identity')
+
+    assert compressed.headers['etag'] == '"7-gzip"'
+    assert identity.headers['etag'] == '"7"'
+    assert identity.headers['vary'] == 'Accept-Encoding'
+
+
+def test_compresses_large_payload_off_loop(compressed_app, monkeypatch):
+    offloaded = []
+    to_thread = asyncio.to_thread
+
+    def spy(fn):
+        offloaded.append(fn)
+        return to_thread(fn)
+
+    monkeypatch.setattr(asyncio, 'to_thread', spy)
+
+    response, body = get_raw(compressed_app, '/huge')
+
+    assert len(offloaded) == 1
+    assert gzip.decompress(body).decode() == BODY * 4
+
+
+def test_skips_response_below_minimum_size(compressed_app):
+    response, body = get_raw(compressed_app, '/small')
+
+    assert 'content-encoding' not in response.headers
+    assert body == b'small'
+
+
+def test_skips_without_accepted_encoding(compressed_app):
+    response, body = get_raw(compressed_app, '/large', 'identity')
+
+    assert 'content-encoding' not in response.headers
+    assert body.decode() == BODY
+
+
+def test_compresses_streaming_response(compressed_app):
+    response, body = get_raw(compressed_app, '/stream')
+
+    assert response.headers['content-encoding'] == 'gzip'
+    assert 'content-length' not in response.headers
+    assert gzip.decompress(body).decode() == BODY * 5
+
+
+def test_skips_event_stream(compressed_app):
+    response, body = get_raw(compressed_app, '/events')
+
+    assert 'content-encoding' not in response.headers
+    assert body == b'data: 1\n\n' * 200
+
+
+@pytest.mark.asyncio
+async def test_compresses_todo_list(session, user, client, token):
+    expected_todos = 20
+    session.add_all(
+        Todo(
+            title=f'todo {n}',
+            description='d' * 100,
+            state=TodoState.todo,
+            user_id=user.id,
+        )
+        for n in range(expected_todos)
+    )
+    await session.commit()
+
+    response = client.get(
+        '/todos/',
+        headers={
+            'Authorization': f'Bearer {token}',
+            'Accept-Encoding': 'gzip',
+        },
+    )
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers['content-encoding'] == 'gzip'
+    assert len(response.json()['todos']) == expected_todos
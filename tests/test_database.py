@@ -0,0 +1,78 @@
+import pytest
+from sqlalchemy.engine.default import CACHE_HIT
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from src import queries
+from src.database import (
+    instrument_statement_cache,
+    statement_cache_stats,
+    warm_up,
+)
+from src.metrics import metrics
+from src.models import Todo, TodoState, User, table_registry
+
+
+@pytest.mark.asyncio
+async def test_warm_up_opens_connections_and_fills_cache(tmp_path):
+    expected_connections = 3
+    engine = create_async_engine(f'sqlite+aiosqlite:///{tmp_path}/app.db')
+    async with engine.begin() as conn:
+        await conn.run_sync(table_registry.metadata.create_all)
+
+    await warm_up(engine, expected_connections)
+
+    assert engine.pool.checkedin() == expected_connections  # type: ignore
+
+    async with AsyncSession(engine) as session:
+        result = await session.execute(queries.user_by_username('test'))
+
+    assert result.raw.context.cache_hit == CACHE_HIT  # type: ignore
+
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_cached_statements_hit_compile_cache(session: AsyncSession):
+    await session.execute(queries.user_todos(1, 0, 10, state=TodoState.todo))
+    result = await session.execute(
+        queries.user_todos(2, 5, 20, state=TodoState.done)
+    )
+
+    assert result.raw.context.cache_hit == CACHE_HIT  # type: ignore
+
+
+@pytest.mark.asyncio
+async def test_read_queries_skip_the_identity_map(
+    session: AsyncSession, user: User
+):
+    user_id = user.id
+    session.add(
+        Todo(title='t', description='d', state=TodoState.todo, user_id=user_id)
+    )
+    await session.commit()
+    session.expunge_all()
+
+    result = await session.execute(queries.user_todos(user_id, 0, 10))
+    todos = queries.records(queries.TodoRecord, result)
+
+    assert [todo.title for todo in todos] == ['t']
+    assert isinstance(todos[0], queries.TodoRecord)
+    assert not session.identity_map
+
+
+@pytest.mark.asyncio
+async def test_instrument_statement_cache_counts_hits(tmp_path):
+    engine = create_async_engine(f'sqlite+aiosqlite:///{tmp_path}/app.db')
+    async with engine.begin() as conn:
+        await conn.run_sync(table_registry.metadata.create_all)
+    instrument_statement_cache(engine, prepare_threshold=None)
+    hits = metrics.get('db.compile_cache.hit')
+
+    async with AsyncSession(engine) as session:
+        await session.execute(queries.user_by_id(1))
+        await session.execute(queries.user_by_id(2))
+
+    assert metrics.get('db.compile_cache.hit') == hits + 1
+    assert statement_cache_stats()['db.compile_cache.hit_rate'] is not None
+
+    await engine.dispose()
@@ -1,10 +1,12 @@
 from dataclasses import asdict
+from unittest.mock import ANY
 
 import pytest
 from sqlalchemy import select
-from sqlalchemy.exc import DataError
+from sqlalchemy.exc import DataError, IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from src import queries
 from src.models import Todo, TodoState, User
 
 
@@ -25,6 +27,7 @@ async def test_create_user(session: AsyncSession, mock_db_time):
         'username': 'test',
         'email': 'test@test.com',
         'password': 'secret',
+        'version': 1,
         'todos': [],
         'created_at': time,
         'updated_at': time,
@@ -54,6 +57,8 @@ async def test_create_todo(session: AsyncSession, user: User, mock_db_time):
         'description': 'teste desc',
         'state': 'draft',
         'user_id': 1,
+        'version': 1,
+        'writer_xid': ANY,
         'created_at': time,
         'updated_at': time,
     }
@@ -95,3 +100,28 @@ async def test_create_todo_state_field_error(
         await session.commit()
 
     await session.rollback()
+
+
+@pytest.mark.asyncio
+async def test_insert_user_skips_only_taken_usernames(
+    user: User, session: AsyncSession
+):
+    dialect_name = session.get_bind().dialect.name
+    values = {'password': 'secret', 'version': 1}
+
+    skipped = await session.scalar(
+        queries.insert_user(
+            dialect_name,
+            values | {'username': user.username.upper(), 'email': 'x@x.com'},
+        )
+    )
+    assert skipped is None
+
+    with pytest.raises(IntegrityError):
+        await session.scalar(
+            queries.insert_user(
+                dialect_name,
+                values | {'id': user.id, 'username': 'x', 'email': 'x@x.com'},
+            )
+        )
+    await session.rollback()
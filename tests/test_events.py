@@ -0,0 +1,247 @@
+import asyncio
+import json
+from dataclasses import asdict
+from http import HTTPStatus
+
+import pytest
+
+from src.events import (
+    Broker,
+    Event,
+    PostgresTransport,
+    broker,
+    event_stream,
+)
+
+
+def test_event_encode():
+    event = Event(id=1, user_id=1, type='todo.deleted', data={'id': 1})
+
+    assert event.encode() == (
+        'id: 1\nevent: todo.deleted\ndata: {"id": 1}\n\n'
+    )
+
+
+@pytest.mark.asyncio
+async def test_broker_fan_out_only_to_same_user():
+    _broker = Broker(queue_size=10, backlog=10)
+    first = _broker.subscribe(1)
+    second = _broker.subscribe(1)
+    other = _broker.subscribe(2)
+
+    event = await _broker.publish(1, 'todo.created', {'id': 1})
+
+    assert first.queue.get_nowait() == event
+    assert second.queue.get_nowait() == event
+    assert other.queue.empty()
+
+
+@pytest.mark.asyncio
+async def test_broker_event_ids_are_monotonic():
+    _broker = Broker(queue_size=10, backlog=10)
+
+    ids = [(await _broker.publish(1, 'todo.created', {})).id for _ in '123']
+
+    assert ids == sorted(set(ids))
+
+
+@pytest.mark.asyncio
+async def test_broker_replay_after_last_event_id():
+    _broker = Broker(queue_size=10, backlog=2)
+    first = await _broker.publish(1, 'todo.created', {'id': 1})
+    second = await _broker.publish(1, 'todo.created', {'id': 2})
+    third = await _broker.publish(1, 'todo.created', {'id': 3})
+
+    assert _broker.replay(1, None) == []
+    assert _broker.replay(1, first.id) == [second, third]
+    assert _broker.replay(1, third.id) == []
+
+
+@pytest.mark.asyncio
+async def test_broker_replay_sends_reset_before_the_backlog():
+    _broker = Broker(queue_size=10, backlog=2)
+    first = await _broker.publish(1, 'todo.created', {'id': 1})
+    second = await _broker.publish(1, 'todo.created', {'id': 2})
+    third = await _broker.publish(1, 'todo.created', {'id': 3})
+
+    reset, *events = _broker.replay(1, first.id - 1)
+
+    assert reset.type == 'reset'
+    assert reset.id == first.id
+    assert events == [second, third]
+
+
+@pytest.mark.asyncio
+async def test_broker_evicts_least_recent_users():
+    _broker = Broker(queue_size=10, backlog=10, backlog_users=2)
+    first = await _broker.publish(1, 'todo.created', {'id': 1})
+    await _broker.publish(2, 'todo.created', {'id': 2})
+    await _broker.publish(1, 'todo.created', {'id': 3})
+    await _broker.publish(3, 'todo.created', {'id': 4})
+
+    assert set(_broker._history) == {1, 3}
+    assert [event.type for event in _broker.replay(2, first.id)] == ['reset']
+    assert len(_broker.replay(1, first.id)) == 1
+
+
+@pytest.mark.asyncio
+async def test_broker_evicts_idle_users():
+    _broker = Broker(queue_size=10, backlog=10, backlog_idle=0)
+    await _broker.publish(1, 'todo.created', {'id': 1})
+    await _broker.publish(2, 'todo.created', {'id': 2})
+
+    assert list(_broker._history) == [2]
+
+
+@pytest.mark.asyncio
+async def test_broker_publish_survives_transport_errors():
+    class BrokenTransport:
+        @staticmethod
+        async def send(event):
+            raise OSError('connection lost')
+
+    _broker = Broker(queue_size=10, backlog=10)
+    _broker.transport = BrokenTransport()
+    subscription = _broker.subscribe(1)
+
+    event = await _broker.publish(1, 'todo.created', {'id': 1})
+
+    assert subscription.queue.get_nowait() == event
+
+
+class FakeNotify:
+    def __init__(self, payload):
+        self.payload = payload
+
+
+class FakeListenConnection:
+    def __init__(self, *payloads):
+        self.payloads = payloads
+        self.closed = False
+
+    async def notifies(self):
+        for payload in self.payloads:
+            yield FakeNotify(payload)
+        raise OSError('connection lost')
+
+    async def close(self):
+        self.closed = True
+
+
+@pytest.mark.asyncio
+async def test_transport_skips_bad_payloads_and_reconnects(monkeypatch):
+    _broker = Broker(queue_size=10, backlog=10)
+    transport = PostgresTransport(_broker, 'postgresql://localhost/todo')
+    event = Event(_broker.next_id(), 1, 'todo.created', {'id': 1})
+    later = Event(_broker.next_id() + 10, 1, 'todo.updated', {'id': 1})
+    first = FakeListenConnection(
+        'not json',
+        '{"id": 1}',
+        json.dumps(asdict(event)),
+    )
+    second = FakeListenConnection(json.dumps(asdict(later)))
+    reconnected = asyncio.Event()
+
+    async def connect(*, listen=False):
+        reconnected.set()
+        return second
+
+    monkeypatch.setattr('src.events.RECONNECT_MIN_SECONDS', 0)
+    monkeypatch.setattr(transport, '_connect', connect)
+    transport._listen_conn = first
+    subscription = _broker.subscribe(1)
+
+    listener = asyncio.create_task(transport._listen())
+    await asyncio.wait_for(reconnected.wait(), 1)
+    listener.cancel()
+
+    assert subscription.queue.get_nowait() == event
+    # The reconnect cut the subscriber off, so it resumes with a reset.
+    assert subscription.overflowed
+    assert first.closed
+    assert _broker.replay(1, event.id)[0].type == 'reset'
+
+
+@pytest.mark.asyncio
+async def test_broker_drops_slow_subscriber():
+    _broker = Broker(queue_size=1, backlog=10)
+    subscription = _broker.subscribe(1)
+
+    await _broker.publish(1, 'todo.created', {'id': 1})
+    await _broker.publish(1, 'todo.created', {'id': 2})
+
+    assert subscription.overflowed
+    assert _broker.subscriber_count(1) == 0
+
+
+@pytest.mark.asyncio
+async def test_event_stream_resume_and_heartbeat():
+    _broker = Broker(queue_size=10, backlog=10)
+    first = await _broker.publish(1, 'todo.created', {'id': 1})
+    second = await _broker.publish(1, 'todo.updated', {'id': 1})
+
+    stream = event_stream(_broker, 1, last_event_id=first.id, heartbeat=0.01)
+
+    assert await anext(stream) == second.encode()
+    assert await anext(stream) == ': ping\n\n'
+
+    third = await _broker.publish(1, 'todo.deleted', {'id': 1})
+
+    assert await anext(stream) == third.encode()
+
+    await stream.aclose()
+
+    assert _broker.subscriber_count(1) == 0
+
+
+@pytest.mark.asyncio
+async def test_event_stream_ends_after_overflow():
+    _broker = Broker(queue_size=1, backlog=10)
+    stream = event_stream(_broker, 1, heartbeat=1)
+    task = asyncio.ensure_future(anext(stream))
+    await asyncio.sleep(0)
+
+    first = await _broker.publish(1, 'todo.created', {'id': 1})
+    await _broker.publish(1, 'todo.created', {'id': 2})
+    await _broker.publish(1, 'todo.created', {'id': 3})
+
+    assert await task == first.encode()
+    with pytest.raises(StopAsyncIteration):
+        await anext(stream)
+
+
+def test_create_todo_publishes_event(client, user, token):
+    response = client.post(
+        '/todos',
+        headers={'Authorization': f'Bearer {token}'},
+        json={'title': 'test', 'description': 'test', 'state': 'draft'},
+    )
+
+    event = broker.replay(user.id, 0)[-1]
+
+    assert event.type == 'todo.created'
+    assert event.data == response.json()
+
+
+def test_delete_todo_publishes_event(client, user, token):
+    response = client.post(
+        '/todos',
+        headers={'Authorization': f'Bearer {token}'},
+        json={'title': 'test', 'description': 'test', 'state': 'draft'},
+    )
+    todo_id = response.json()['id']
+
+    client.delete(
+        f'/todos/{todo_id}', headers={'Authorization': f'Bearer {token}'}
+    )
+
+    event = broker.replay(user.id, 0)[-1]
+
+    assert event.type == 'todo.deleted'
+    assert event.data == {'id': todo_id}
+
+
+def test_stream_todo_events_unauthorized(client):
+    response = client.get('/todos/events')
+
+    assert response.status_code == HTTPStatus.UNAUTHORIZED
@@ -0,0 +1,138 @@
+import asyncio
+from http import HTTPStatus
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.app import app
+from src.group_commit import GroupInsert
+from src.metrics import metrics
+from src.models import Todo, TodoState
+
+
+def todo_values(user, title='grouped'):
+    return {
+        'title': title,
+        'description': 'grouped',
+        'state': TodoState.todo,
+        'user_id': user.id,
+    }
+
+
+@pytest.mark.asyncio
+async def test_concurrent_inserts_share_one_commit(session, user):
+    inserts = GroupInsert(Todo, 'test.group')
+    metrics.reset()
+    expected_rows = 5
+
+    todos = await asyncio.gather(
+        *(
+            inserts.insert(session.bind, todo_values(user, f'todo {n}'))
+            for n in range(expected_rows)
+        )
+    )
+
+    assert [todo.title for todo in todos] == [
+        f'todo {n}' for n in range(expected_rows)
+    ]
+    assert len({todo.id for todo in todos}) == expected_rows
+    assert len({todo.version for todo in todos}) == expected_rows
+    assert metrics.get('test.group.batches') == 1
+    assert metrics.get('test.group.rows') == expected_rows
+
+
+@pytest.mark.asyncio
+async def test_full_batch_is_written_without_waiting(session, user):
+    inserts = GroupInsert(Todo, 'test.group')
+    inserts.configure(window=60, max_size=2)
+
+    todos = await asyncio.wait_for(
+        asyncio.gather(
+            inserts.insert(session.bind, todo_values(user)),
+            inserts.insert(session.bind, todo_values(user)),
+        ),
+        timeout=5,
+    )
+
+    assert all(todo.id for todo in todos)
+
+
+@pytest.mark.asyncio
+async def test_bad_row_fails_alone(session, user):
+    inserts = GroupInsert(Todo, 'test.group')
+
+    good, bad = await asyncio.gather(
+        inserts.insert(session.bind, todo_values(user)),
+        inserts.insert(session.bind, todo_values(user, title=None)),
+        return_exceptions=True,
+    )
+
+    assert good.title == 'grouped'
+    assert isinstance(bad, IntegrityError)
+
+
+@pytest.mark.asyncio
+async def test_bad_row_is_retried_on_one_connection(session, user):
+    inserts = GroupInsert(Todo, 'test.group')
+    metrics.reset()
+    checkouts = []
+    pool = session.bind.sync_engine.pool
+
+    def count(*args):
+        checkouts.append(args)
+
+    event.listen(pool, 'checkout', count)
+
+    try:
+        results = await asyncio.gather(
+            *(inserts.insert(session.bind, todo_values(user)) for _ in '123'),
+            inserts.insert(session.bind, todo_values(user, title=None)),
+            return_exceptions=True,
+        )
+    finally:
+        event.remove(pool, 'checkout', count)
+
+    assert [todo.title for todo in results[:3]] == ['grouped'] * 3
+    assert isinstance(results[3], IntegrityError)
+    # The refused batch, then every row again on a single connection.
+    assert len(checkouts) == 2  # noqa: PLR2004
+    assert metrics.get('test.group.rows') == 3  # noqa: PLR2004
+
+
+@pytest.mark.asyncio
+async def test_failed_commit_is_not_retried(session, user, monkeypatch):
+    inserts = GroupInsert(Todo, 'test.group')
+    metrics.reset()
+
+    async def lose_connection(self):
+        raise OperationalError('COMMIT', {}, Exception('connection lost'))
+
+    monkeypatch.setattr(AsyncSession, 'commit', lose_connection)
+
+    results = await asyncio.gather(
+        inserts.insert(session.bind, todo_values(user)),
+        inserts.insert(session.bind, todo_values(user)),
+        return_exceptions=True,
+    )
+
+    assert all(isinstance(result, OperationalError) for result in results)
+    assert metrics.get('test.group.retried') == 0
+    assert metrics.get('test.group.batches') == 0
+
+
+def test_create_todo_with_group_commit(client, token, monkeypatch):
+    monkeypatch.setattr(app.state.settings, 'TODO_GROUP_COMMIT', True)
+    metrics.reset()
+
+    response = client.post(
+        '/todos/',
+        headers={'Authorization': f'Bearer {token}'},
+        json={'title': 'grouped', 'description': 'x', 'state': 'draft'},
+    )
+
+    assert response.status_code == HTTPStatus.CREATED
+    assert response.json()['title'] == 'grouped'
+    assert response.headers['etag']
+    assert metrics.get('todos.group_commit.rows') == 1
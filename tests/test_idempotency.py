@@ -0,0 +1,252 @@
+import asyncio
+from datetime import datetime
+from http import HTTPStatus
+
+import pytest
+from fastapi import HTTPException, Request
+from fastapi.testclient import TestClient
+from sqlalchemy import func, select
+
+from src import queries
+from src.app import app, create_app
+from src.database import get_session
+from src.idempotency import (
+    IDEMPOTENCY_CLAIM,
+    IdempotencyStore,
+    IdempotentReplay,
+)
+from src.metrics import metrics
+from src.models import IdempotencyKey, Todo
+from src.routers import users
+
+TODO = {'title': 'retried', 'description': 'retried', 'state': 'todo'}
+
+
+def post_todo(client, token, key, json=TODO):
+    return client.post(
+        '/todos/',
+        headers={'Authorization': f'Bearer {token}', 'Idempotency-Key': key},
+        json=json,
+    )
+
+
+def make_request(body: bytes = b'{}') -> Request:
+    async def receive():
+        return {'type': 'http.request', 'body': body}
+
+    scope = {
+        'type': 'http',
+        'method': 'POST',
+        'path': '/todos/',
+        'query_string': b'',
+        'headers': [],
+    }
+    return Request(scope, receive)
+
+
+@pytest.mark.asyncio
+async def test_retried_create_returns_stored_response(client, session, token):
+    first = post_todo(client, token, 'create-1')
+    retry = post_todo(client, token, 'create-1')
+
+    assert retry.status_code == HTTPStatus.CREATED
+    assert retry.json() == first.json()
+    assert retry.headers['etag'] == first.headers['etag']
+    assert retry.headers['idempotent-replayed'] == 'true'
+    assert await session.scalar(select(func.count(Todo.id))) == 1
+
+
+def test_key_reused_for_another_request(client, token):
+    post_todo(client, token, 'create-1')
+    response = post_todo(client, token, 'create-1', TODO | {'title': 'other'})
+
+    assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+
+
+def test_keys_are_per_user(client, token, other_user):
+    other = client.post(
+        '/auth/token',
+        data={
+            'username': other_user.username,
+            'password': other_user.clean_password,
+        },
+    ).json()['access_token']
+
+    first = post_todo(client, token, 'create-1')
+    second = post_todo(client, other, 'create-1')
+
+    assert second.status_code == HTTPStatus.CREATED
+    assert second.json()['id'] != first.json()['id']
+
+
+def test_retried_signup_hashes_once(client, monkeypatch):
+    hashes = []
+    hash_password = users.get_password_hash
+
+    def counting_hash(password, hasher=None):
+        hashes.append(password)
+        return hash_password(password, hasher)
+
+    monkeypatch.setattr(users, 'get_password_hash', counting_hash)
+    body = {
+        'username': 'mobile',
+        'email': 'mobile@example.com',
+        'password': 'x',
+    }
+
+    responses = [
+        client.post(
+            '/users/', headers={'Idempotency-Key': 'signup'}, json=body
+        )
+        for _ in range(2)
+    ]
+
+    assert [response.status_code for response in responses] == [
+        HTTPStatus.CREATED
+    ] * 2
+    assert len(hashes) == 1
+
+
+@pytest.mark.asyncio
+async def test_duplicate_waits_for_the_first(session):
+    idempotency = IdempotencyStore()
+    first = make_request()
+    await idempotency.begin(first, session, 1, 'wait')
+
+    duplicate = asyncio.create_task(
+        idempotency.begin(make_request(), session, 1, 'wait')
+    )
+    await asyncio.sleep(0.05)
+    assert not duplicate.done()
+
+    # The handler's commit publishes the claim.
+    await session.commit()
+    await idempotency.complete(
+        first.scope[IDEMPOTENCY_CLAIM], HTTPStatus.CREATED, [], b'{"id": 1}'
+    )
+
+    with pytest.raises(IdempotentReplay) as replay:
+        await duplicate
+    assert replay.value.response.body == b'{"id": 1}'
+
+
+@pytest.mark.asyncio
+async def test_failed_request_lets_the_duplicate_run(session):
+    idempotency = IdempotencyStore()
+    first = make_request()
+    await idempotency.begin(first, session, 1, 'fail')
+
+    second = make_request()
+    duplicate = asyncio.create_task(
+        idempotency.begin(second, session, 1, 'fail')
+    )
+    await asyncio.sleep(0.05)
+    # The handler's rollback takes the claim with it.
+    await session.rollback()
+    await idempotency.complete(
+        first.scope[IDEMPOTENCY_CLAIM],
+        HTTPStatus.INTERNAL_SERVER_ERROR,
+        [],
+        b'',
+    )
+    await duplicate
+
+    assert IDEMPOTENCY_CLAIM in second.scope
+
+
+@pytest.mark.asyncio
+async def test_duplicate_gives_up_after_wait_timeout(session):
+    idempotency = IdempotencyStore()
+    idempotency.configure(wait_timeout=0.05)
+    await idempotency.begin(make_request(), session, 1, 'slow')
+
+    with pytest.raises(HTTPException) as conflict:
+        await idempotency.begin(make_request(), session, 1, 'slow')
+
+    assert conflict.value.status_code == HTTPStatus.CONFLICT
+
+
+@pytest.mark.asyncio
+async def test_claim_commits_with_the_request(session, user):
+    idempotency = IdempotencyStore()
+    user_id = user.id
+    request = make_request()
+    await idempotency.begin(request, session, user_id, 'atomic')
+    session.add(Todo(**TODO, user_id=user_id))  # type: ignore
+    await session.rollback()
+    idempotency.release(request.scope[IDEMPOTENCY_CLAIM])
+
+    assert await session.scalar(select(func.count(IdempotencyKey.key))) == 0
+
+    await idempotency.begin(make_request(), session, user_id, 'atomic')
+    session.add(Todo(**TODO, user_id=user_id))  # type: ignore
+    await session.commit()
+
+    assert await session.scalar(select(func.count(IdempotencyKey.key))) == 1
+
+
+@pytest.mark.asyncio
+async def test_committed_claim_without_response_never_runs_again(
+    session, user
+):
+    idempotency = IdempotencyStore()
+    idempotency.configure(lock_timeout=0)
+    request = make_request()
+    await idempotency.begin(request, session, user.id, 'lost')
+    await session.commit()
+    # The worker died before storing the response.
+    idempotency.release(request.scope[IDEMPOTENCY_CLAIM])
+
+    with pytest.raises(HTTPException) as conflict:
+        await idempotency.begin(make_request(), session, user.id, 'lost')
+
+    assert conflict.value.status_code == HTTPStatus.CONFLICT
+    assert 'not kept' in conflict.value.detail
+
+
+def test_oversized_response_is_not_kept(client, session, settings, token):
+    small = create_app(
+        settings.model_copy(
+            update={
+                'IDEMPOTENCY_MAX_BODY_SIZE': 10,
+                'IDEMPOTENCY_LOCK_SECONDS': 0,
+            }
+        )
+    )
+    small.dependency_overrides[get_session] = lambda: session
+
+    with TestClient(small) as small_client:
+        first = post_todo(small_client, token, 'oversized')
+        retry = post_todo(small_client, token, 'oversized')
+
+    assert first.status_code == HTTPStatus.CREATED
+    assert retry.status_code == HTTPStatus.CONFLICT
+    assert metrics.get('idempotency.too_large') >= 1
+
+
+def test_create_todo_skips_group_commit_with_a_key(client, token, monkeypatch):
+    monkeypatch.setattr(app.state.settings, 'TODO_GROUP_COMMIT', True)
+    metrics.reset()
+
+    first = post_todo(client, token, 'grouped')
+    retry = post_todo(client, token, 'grouped')
+
+    assert retry.json() == first.json()
+    assert metrics.get('todos.group_commit.batches') == 0
+
+
+@pytest.mark.asyncio
+async def test_purge_deletes_a_bounded_batch(session, monkeypatch):
+    expired = datetime(2000, 1, 1)
+    session.add_all(
+        IdempotencyKey(
+            user_id=1, key=str(n), fingerprint='-', expires_at=expired
+        )
+        for n in range(3)
+    )
+    await session.commit()
+
+    await session.execute(queries.purge_idempotency_keys(datetime.now(), 2))
+    await session.commit()
+
+    assert await session.scalar(select(func.count(IdempotencyKey.key))) == 1
@@ -0,0 +1,50 @@
+import asyncio
+
+import pytest
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from src.migrate import (
+    alembic_config,
+    current_revision,
+    script_head,
+    upgrade_to_head,
+)
+
+
+@pytest.fixture
+def sqlite_engine(tmp_path):
+    return create_async_engine(f'sqlite+aiosqlite:///{tmp_path}/app.db')
+
+
+@pytest.mark.asyncio
+async def test_current_revision_on_fresh_database(sqlite_engine):
+    async with sqlite_engine.connect() as conn:
+        assert await current_revision(conn) is None
+
+    await sqlite_engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_upgrade_to_head_skips_when_current(sqlite_engine):
+    assert await upgrade_to_head(sqlite_engine) is True
+    assert await upgrade_to_head(sqlite_engine) is False
+
+    async with sqlite_engine.connect() as conn:
+        assert await current_revision(conn) == script_head(alembic_config())
+
+    await sqlite_engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_upgrade_to_head_only_one_replica_migrates(tmp_path):
+    engines = [
+        create_async_engine(f'sqlite+aiosqlite:///{tmp_path}/app.db')
+        for _ in range(3)
+    ]
+
+    results = await asyncio.gather(*map(upgrade_to_head, engines))
+
+    assert sorted(results) == [False, False, True]
+
+    for engine in engines:
+        await engine.dispose()
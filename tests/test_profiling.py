@@ -0,0 +1,118 @@
+import asyncio
+import json
+import time
+from http import HTTPStatus
+
+import pytest
+from fastapi.testclient import TestClient
+
+from src.app import create_app
+from src.profiling import StackSampler, prune_profiles
+
+
+async def busy(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+async def waiting(seconds):
+    await asyncio.sleep(seconds)
+
+
+async def handler():
+    await busy(0.05)
+    await waiting(0.05)
+
+
+@pytest.mark.asyncio
+async def test_sampler_attributes_running_and_awaiting_time():
+    task = asyncio.ensure_future(handler())
+    sampler = StackSampler(task, interval=0.001)
+    sampler.start()
+    await task
+    sampler.stop()
+
+    collapsed = sampler.collapsed()
+
+    assert 'handler;busy ' in collapsed
+    assert 'handler;waiting;sleep;[await] ' in collapsed
+
+
+@pytest.mark.asyncio
+async def test_sampler_speedscope_profile():
+    task = asyncio.ensure_future(handler())
+    sampler = StackSampler(task, interval=0.001)
+    sampler.start()
+    await task
+    sampler.stop()
+
+    profile = sampler.speedscope('GET /')
+    frames = [frame['name'] for frame in profile['shared']['frames']]
+    sampled = profile['profiles'][0]
+
+    assert {'handler', 'busy', 'waiting'} <= set(frames)
+    assert len(sampled['samples']) == len(sampled['weights'])
+    assert sum(sampled['weights']) <= sampled['endValue']
+
+
+def test_prune_profiles_keeps_newest(tmp_path):
+    for n in range(3):
+        (tmp_path / f'{n}.collapsed').write_text('')
+        (tmp_path / f'{n}.speedscope.json').write_text('')
+        time.sleep(0.01)
+
+    prune_profiles(tmp_path, 1)
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        '2.collapsed',
+        '2.speedscope.json',
+    ]
+
+
+@pytest.fixture
+def profiled_app(settings, tmp_path):
+    return create_app(
+        settings.model_copy(
+            update={
+                'PROFILING_ENABLED': True,
+                'PROFILING_TOKEN': 'profile-token',
+                'PROFILING_DIR': str(tmp_path),
+                'PROFILING_RETENTION': 2,
+            }
+        )
+    )
+
+
+def test_profiles_authorized_request(profiled_app, tmp_path):
+    with TestClient(profiled_app) as client:
+        response = client.get('/', headers={'X-Profile': 'profile-token'})
+
+    profile_id = response.headers['x-profile-id']
+    speedscope = json.loads(
+        (tmp_path / f'{profile_id}.speedscope.json').read_text()
+    )
+
+    assert response.status_code == HTTPStatus.OK
+    assert (tmp_path / f'{profile_id}.collapsed').exists()
+    assert speedscope['name'] == 'GET /'
+
+
+def test_skips_request_without_valid_token(profiled_app, tmp_path):
+    with TestClient(profiled_app) as client:
+        plain = client.get('/')
+        wrong = client.get('/', headers={'X-Profile': 'wrong'})
+
+    assert 'x-profile-id' not in plain.headers
+    assert 'x-profile-id' not in wrong.headers
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_profiles_retention_limit(profiled_app, tmp_path):
+    with TestClient(profiled_app) as client:
+        for _ in range(3):
+            client.get('/', headers={'X-Profile': 'profile-token'})
+
+    expected_files = 4
+
+    assert len(list(tmp_path.iterdir())) == expected_files
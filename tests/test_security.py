@@ -2,7 +2,13 @@ from http import HTTPStatus
 
 from jwt import decode
 
-from src.security import create_access_token
+from src.security import (
+    Argon2Profile,
+    create_access_token,
+    load_argon2_profile,
+    write_argon2_profile,
+)
+from src.tools.calibrate import MIN_MEMORY_COST, MIN_TIME_COST, calibrate
 
 
 def test_create_access_token(settings):
@@ -45,3 +51,63 @@ def test_jwt_user_not_exists(client):
 
     assert response.status_code == HTTPStatus.UNAUTHORIZED
     assert response.json() == {'detail': 'Could not validate credentials'}
+
+
+def test_argon2_profile_round_trip(tmp_path):
+    path = str(tmp_path / 'argon2.json')
+    profile = Argon2Profile(time_cost=2, memory_cost=32 * 1024, target_ms=50)
+
+    write_argon2_profile(path, profile)
+
+    assert load_argon2_profile(path) == profile
+    assert load_argon2_profile(str(tmp_path / 'missing.json')) == (
+        Argon2Profile()
+    )
+
+
+def fake_measure(profile, rounds):
+    # 10 ms per pass over each 8 MiB.
+    return 10.0 * profile.time_cost * profile.memory_cost / (8 * 1024)
+
+
+def test_calibrate_adds_passes_within_target():
+    seen = []
+
+    profile = calibrate(
+        target_ms=250,
+        max_memory_cost=64 * 1024,
+        parallelism=1,
+        measure=fake_measure,
+        report=lambda p, ms: seen.append((p.time_cost, ms)),
+    )
+
+    expected_time_cost = 3
+    expected_verify_ms = 240
+    assert profile.memory_cost == 64 * 1024
+    assert profile.time_cost == expected_time_cost
+    assert profile.verify_ms == expected_verify_ms
+    assert seen[-1][0] == expected_time_cost + 1
+
+
+def test_calibrate_halves_memory_when_one_pass_is_too_slow():
+    profile = calibrate(
+        target_ms=90,
+        max_memory_cost=256 * 1024,
+        parallelism=1,
+        measure=fake_measure,
+    )
+
+    assert profile.memory_cost == 32 * 1024
+    assert profile.time_cost == MIN_TIME_COST
+
+
+def test_calibrate_never_goes_below_the_minimum():
+    profile = calibrate(
+        target_ms=1,
+        max_memory_cost=8 * 1024,
+        parallelism=1,
+        measure=fake_measure,
+    )
+
+    assert profile.memory_cost == MIN_MEMORY_COST
+    assert profile.time_cost == MIN_TIME_COST
@@ -0,0 +1,56 @@
+import pytest
+from sqlalchemy import func, select
+
+from src.models import Todo, TodoState, User
+from src.sharding import ShardMap
+from src.tools.seed import Generator, SeedOptions, parse_states, seed
+
+
+def test_generator_is_deterministic():
+    options = SeedOptions(users=1, todos_per_user=5, seed=7)
+
+    assert Generator(options).todos(1) == Generator(options).todos(1)
+    assert Generator(options).todos(1) != Generator(
+        SeedOptions(users=1, todos_per_user=5, seed=8)
+    ).todos(1)
+
+
+def test_parse_states_keeps_only_listed_states():
+    assert parse_states('todo=3,done') == {
+        TodoState.todo: 3.0,
+        TodoState.done: 1.0,
+    }
+
+
+@pytest.mark.asyncio
+async def test_seed_loads_users_and_todos(session, engine):
+    expected_users, expected_todos = 3, 12
+    options = SeedOptions(
+        users=expected_users,
+        todos_per_user=expected_todos // expected_users,
+        states={TodoState.done: 1},
+        title_length=(5, 5),
+        batch_size=8,
+    )
+
+    loaded = await seed(ShardMap([engine]), options)
+    rows = (await session.execute(select(Todo.state, Todo.version))).all()
+    titles = await session.scalars(select(func.length(Todo.title)))
+
+    assert loaded == (expected_users, expected_todos)
+    assert {state for state, _ in rows} == {TodoState.done}
+    assert len({version for _, version in rows}) == expected_todos
+    assert max(titles) <= options.title_length[1]
+
+
+@pytest.mark.asyncio
+async def test_signup_ids_continue_after_seeded_users(session, engine):
+    await seed(ShardMap([engine]), SeedOptions(users=2, todos_per_user=0))
+
+    user = User(username='new', email='new@example.com', password='-')
+    user.version = 1
+    session.add(user)
+    await session.commit()
+
+    assert user.id == await session.scalar(select(func.max(User.id)))
+    assert await session.scalar(select(func.count(User.id))) == user.id
@@ -0,0 +1,48 @@
+import pytest
+
+from src import serve
+
+
+def test_worker_count_from_settings(settings):
+    expected_workers = 3
+    settings.SERVER_WORKERS = expected_workers
+
+    assert serve.worker_count(settings) == expected_workers
+
+
+def test_worker_count_defaults_to_cores(settings, monkeypatch):
+    expected_workers = 4
+    settings.SERVER_WORKERS = None
+    monkeypatch.setattr(serve.os, 'process_cpu_count', lambda: 4)
+
+    assert serve.worker_count(settings) == expected_workers
+
+
+def test_server_options(settings):
+    options = serve.server_options(settings)
+
+    assert options['port'] == settings.SERVER_PORT
+    assert options['backlog'] == settings.SERVER_BACKLOG
+    assert options['loop'] in {'uvloop', 'asyncio'}
+    assert options['http'] in {'httptools', 'h11'}
+    assert (
+        options['timeout_graceful_shutdown']
+        == settings.SERVER_GRACEFUL_TIMEOUT_SECONDS
+    )
+
+
+def test_main_exits_when_self_check_fails(monkeypatch):
+    async def failing_self_check(engine):
+        raise ConnectionRefusedError
+
+    monkeypatch.setattr(serve, 'self_check', failing_self_check)
+    monkeypatch.setattr(
+        serve.uvicorn,
+        'run',
+        lambda *args, **kwargs: pytest.fail('server started'),
+    )
+
+    with pytest.raises(SystemExit) as exc_info:
+        serve.main()
+
+    assert exc_info.value.code == 1
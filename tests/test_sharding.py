@@ -0,0 +1,398 @@
+from datetime import datetime, timedelta
+from http import HTTPStatus
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, func, insert, select
+
+from src.app import create_app
+from src.models import (
+    IdempotencyKey,
+    Todo,
+    User,
+    UserDirectory,
+    table_registry,
+)
+from src.sharding import ShardMap, merge_pages
+
+SHARDS = 3
+TODO = {'title': 'batched', 'description': 'batched', 'state': 'draft'}
+
+
+@pytest.fixture
+def shard_urls(tmp_path):
+    urls = [f'sqlite:///{tmp_path}/shard{n}.db' for n in range(SHARDS)]
+    for url in urls:
+        engine = create_engine(url)
+        table_registry.metadata.create_all(engine)
+        engine.dispose()
+    return urls
+
+
+@pytest.fixture
+def sharded_client(settings, shard_urls):
+    async_urls = [
+        url.replace('sqlite', 'sqlite+aiosqlite') for url in shard_urls
+    ]
+    app = create_app(
+        settings.model_copy(
+            update={
+                'DATABASE_URL': async_urls[0],
+                'DATABASE_SHARD_URLS': async_urls[1:],
+            }
+        )
+    )
+
+    with TestClient(app) as client:
+        yield client
+
+
+def _count(url, model, **filters):
+    engine = create_engine(url)
+    with engine.connect() as conn:
+        count = conn.scalar(
+            select(func.count()).select_from(model).filter_by(**filters)
+        )
+    engine.dispose()
+    return count
+
+
+def _create_user(client, username):
+    response = client.post(
+        '/users',
+        json={
+            'username': username,
+            'email': f'{username}@test.com',
+            'password': 'secret',
+        },
+    )
+    return response.json()
+
+
+def _token(client, username):
+    response = client.post(
+        '/auth/token', data={'username': username, 'password': 'secret'}
+    )
+    return response.json()['access_token']
+
+
+def test_shard_index_is_stable():
+    shards = ShardMap([None] * SHARDS)  # type: ignore
+
+    assert shards.sharded
+    assert shards.index(42) == shards.index(42)
+    assert {shards.index(user_id) for user_id in range(100)} == set(
+        range(SHARDS)
+    )
+
+
+def test_merge_pages():
+    class Row:
+        def __init__(self, id):
+            self.id = id
+
+    pages = [[Row(1), Row(4)], [Row(2), Row(3)], [Row(5)]]
+
+    assert [row.id for row in merge_pages(pages, 1, 3)] == [2, 3, 4]
+
+
+def test_users_are_stored_on_their_shard(sharded_client, shard_urls):
+    shards = ShardMap([None] * SHARDS)  # type: ignore
+
+    users = [_create_user(sharded_client, f'user{n}') for n in range(6)]
+
+    for user in users:
+        shard_url = shard_urls[shards.index(user['id'])]
+        assert _count(shard_url, User, id=user['id']) == 1
+
+
+def test_create_user_conflict_across_shards(sharded_client):
+    _create_user(sharded_client, 'test')
+
+    response = sharded_client.post(
+        '/users',
+        json={
+            'username': 'other',
+            'email': 'test@test.com',
+            'password': 'secret',
+        },
+    )
+
+    assert response.status_code == HTTPStatus.CONFLICT
+    assert response.json() == {'detail': 'email already exists'}
+
+
+def test_user_ids_come_from_the_directory(sharded_client, shard_urls):
+    users = [_create_user(sharded_client, f'user{n}') for n in range(6)]
+
+    assert [user['id'] for user in users] == list(range(1, 7))
+    assert _count(shard_urls[0], UserDirectory) == len(users)
+    for url in shard_urls[1:]:
+        assert _count(url, UserDirectory) == 0
+
+
+def test_create_user_conflict_ignores_case_across_shards(sharded_client):
+    shards = ShardMap([None] * SHARDS)  # type: ignore
+    first = _create_user(sharded_client, 'test')
+    # The next id lands on another shard, whose users table has no 'test'.
+    assert shards.index(first['id']) != shards.index(first['id'] + 1)
+
+    response = sharded_client.post(
+        '/users',
+        json={
+            'username': 'TEST',
+            'email': 'other@test.com',
+            'password': 'secret',
+        },
+    )
+
+    assert response.status_code == HTTPStatus.CONFLICT
+    assert response.json() == {'detail': 'username already exists'}
+
+
+def test_login_asks_only_the_directory_shard(sharded_client, shard_urls):
+    shards = ShardMap([None] * SHARDS)  # type: ignore
+    users = [_create_user(sharded_client, f'user{n}') for n in range(SHARDS)]
+    user = next(user for user in users if shards.index(user['id']))
+    # Same name, another password, on every shard the directory does not
+    # point at; asking them all would find the one on shard 0 first.
+    for index, url in enumerate(shard_urls):
+        if index == shards.index(user['id']):
+            continue
+        engine = create_engine(url)
+        with engine.begin() as conn:
+            conn.execute(
+                insert(User).values(
+                    id=1000 + index,
+                    username=user['username'],
+                    email=f'{index}@decoy.com',
+                    password='-',
+                    version=1,
+                )
+            )
+        engine.dispose()
+
+    response = sharded_client.post(
+        '/auth/token',
+        data={'username': user['username'], 'password': 'secret'},
+    )
+
+    assert response.status_code == HTTPStatus.OK
+
+
+def test_create_user_reclaims_stale_reservation(sharded_client, shard_urls):
+    # Left by a signup that died before writing the user to its shard.
+    engine = create_engine(shard_urls[0])
+    with engine.begin() as conn:
+        conn.execute(
+            insert(UserDirectory).values(
+                username='test',
+                email='test@test.com',
+                reserved_at=datetime(2000, 1, 1),
+            )
+        )
+    engine.dispose()
+
+    user = _create_user(sharded_client, 'test')
+
+    assert user['username'] == 'test'
+    assert _count(shard_urls[0], UserDirectory) == 1
+
+
+def test_retried_signup_replays_after_reclaiming(sharded_client, shard_urls):
+    engine = create_engine(shard_urls[0])
+    with engine.begin() as conn:
+        conn.execute(
+            insert(UserDirectory).values(
+                username='test',
+                email='test@test.com',
+                reserved_at=datetime(2000, 1, 1),
+            )
+        )
+    engine.dispose()
+    body = {'username': 'test', 'email': 'test@test.com', 'password': 'x'}
+
+    # Reclaiming must not drop the claim, nor commit it early.
+    responses = [
+        sharded_client.post(
+            '/users/', headers={'Idempotency-Key': 'signup'}, json=body
+        )
+        for _ in range(2)
+    ]
+
+    assert [response.status_code for response in responses] == [
+        HTTPStatus.CREATED
+    ] * 2
+    assert responses[1].headers['idempotent-replayed'] == 'true'
+    assert _count(shard_urls[0], IdempotencyKey) == 1
+
+
+def test_create_user_keeps_fresh_reservation(sharded_client, shard_urls):
+    engine = create_engine(shard_urls[0])
+    with engine.begin() as conn:
+        conn.execute(
+            insert(UserDirectory).values(
+                username='test',
+                email='test@test.com',
+                reserved_at=datetime.now() + timedelta(days=1),
+            )
+        )
+    engine.dispose()
+
+    response = sharded_client.post(
+        '/users',
+        json={
+            'username': 'test',
+            'email': 'test@test.com',
+            'password': 'secret',
+        },
+    )
+
+    assert response.status_code == HTTPStatus.CONFLICT
+
+
+def test_update_user_names_are_unique_across_shards(sharded_client):
+    _create_user(sharded_client, 'first')
+    second = _create_user(sharded_client, 'second')
+    token = _token(sharded_client, 'second')
+    headers = {'Authorization': f'Bearer {token}'}
+
+    response = sharded_client.put(
+        f'/users/{second["id"]}',
+        headers=headers,
+        json={
+            'username': 'first',
+            'email': 'second@test.com',
+            'password': 'secret',
+        },
+    )
+
+    assert response.status_code == HTTPStatus.CONFLICT
+
+    response = sharded_client.put(
+        f'/users/{second["id"]}',
+        headers=headers,
+        json={
+            'username': 'renamed',
+            'email': 'renamed@test.com',
+            'password': 'secret',
+        },
+    )
+
+    assert response.status_code == HTTPStatus.OK
+    assert _create_user(sharded_client, 'second')['username'] == 'second'
+
+
+def test_delete_user_frees_its_names(sharded_client, shard_urls):
+    user = _create_user(sharded_client, 'test')
+    token = _token(sharded_client, 'test')
+
+    sharded_client.delete(
+        f'/users/{user["id"]}', headers={'Authorization': f'Bearer {token}'}
+    )
+
+    assert _count(shard_urls[0], UserDirectory) == 0
+    assert _create_user(sharded_client, 'test')['username'] == 'test'
+
+
+def test_todos_follow_the_user_shard(sharded_client, shard_urls):
+    shards = ShardMap([None] * SHARDS)  # type: ignore
+    user = _create_user(sharded_client, 'test')
+    token = _token(sharded_client, 'test')
+
+    response = sharded_client.post(
+        '/todos',
+        headers={'Authorization': f'Bearer {token}'},
+        json={'title': 'test', 'description': 'test', 'state': 'draft'},
+    )
+
+    assert response.status_code == HTTPStatus.CREATED
+
+    for index, url in enumerate(shard_urls):
+        expected = 1 if index == shards.index(user['id']) else 0
+        assert _count(url, Todo, user_id=user['id']) == expected
+
+    response = sharded_client.get(
+        '/todos', headers={'Authorization': f'Bearer {token}'}
+    )
+
+    assert len(response.json()['todos']) == 1
+
+
+def test_read_users_scatter_gather(sharded_client):
+    users = [_create_user(sharded_client, f'user{n}') for n in range(6)]
+    token = _token(sharded_client, 'user0')
+    expected_ids = sorted(user['id'] for user in users)
+
+    response = sharded_client.get(
+        '/users/?offset=1&limit=3',
+        headers={'Authorization': f'Bearer {token}'},
+    )
+
+    assert [user['id'] for user in response.json()['users']] == (
+        expected_ids[1:4]
+    )
+
+
+def test_read_user_on_other_shard(sharded_client):
+    users = [_create_user(sharded_client, f'user{n}') for n in range(4)]
+    token = _token(sharded_client, 'user0')
+
+    for user in users:
+        response = sharded_client.get(
+            f'/users/{user["id"]}',
+            headers={'Authorization': f'Bearer {token}'},
+        )
+
+        assert response.json()['username'] == user['username']
+
+
+@pytest.mark.parametrize('atomic', [True, False])
+def test_batch_stays_on_the_users_shard(sharded_client, shard_urls, atomic):
+    owner = [_create_user(sharded_client, f'user{n}') for n in range(2)][1]
+    headers = {'Authorization': f'Bearer {_token(sharded_client, "user1")}'}
+    renamed = {
+        'username': 'renamed',
+        'email': 'renamed@test.com',
+        'password': 'secret',
+    }
+
+    response = sharded_client.post(
+        '/batch',
+        headers=headers,
+        json={
+            'atomic': atomic,
+            'operations': [
+                {'method': 'POST', 'path': '/todos/', 'body': TODO},
+                {'method': 'POST', 'path': '/users/', 'body': renamed},
+                {
+                    'method': 'PUT',
+                    'path': f'/users/{owner["id"]}',
+                    'body': renamed,
+                },
+                {'method': 'POST', 'path': '/todos/', 'body': TODO},
+            ],
+        },
+    )
+
+    statuses = [result['status'] for result in response.json()['results']]
+    assert statuses[1] == HTTPStatus.BAD_REQUEST
+    shard = shard_urls[ShardMap([None] * SHARDS).index(owner['id'])]  # type: ignore
+    if atomic:
+        assert statuses == [
+            HTTPStatus.CREATED,
+            HTTPStatus.BAD_REQUEST,
+            HTTPStatus.FAILED_DEPENDENCY,
+            HTTPStatus.FAILED_DEPENDENCY,
+        ]
+        assert _count(shard, Todo) == 0
+    else:
+        assert statuses == [
+            HTTPStatus.CREATED,
+            HTTPStatus.BAD_REQUEST,
+            HTTPStatus.BAD_REQUEST,
+            HTTPStatus.CREATED,
+        ]
+        assert _count(shard, Todo, user_id=owner['id']) == 2  # noqa: PLR2004
+    assert sum(_count(url, User) for url in shard_urls) == 2  # noqa: PLR2004
+    assert _count(shard_urls[0], UserDirectory, username='renamed') == 0
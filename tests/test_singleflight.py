@@ -0,0 +1,124 @@
+import asyncio
+
+import pytest
+
+from src.metrics import metrics
+from src.singleflight import SingleFlight
+
+
+class Query:
+    def __init__(self, result='body'):
+        self.calls = 0
+        self.result = result
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.calls += 1
+        await self.release.wait()
+        return self.result
+
+
+@pytest.mark.asyncio
+async def test_concurrent_identical_calls_share_one_query():
+    flights = SingleFlight('test.flights')
+    query = Query()
+    metrics.reset()
+
+    tasks = [
+        asyncio.ensure_future(flights.do((1, 'todos'), query))
+        for _ in range(3)
+    ]
+    await asyncio.sleep(0)
+    query.release.set()
+    expected_coalesced = 2
+
+    assert await asyncio.gather(*tasks) == ['body'] * 3
+    assert query.calls == 1
+    assert metrics.get('test.flights.executed') == 1
+    assert metrics.get('test.flights.coalesced') == expected_coalesced
+    assert flights.in_flight() == 0
+
+
+@pytest.mark.asyncio
+async def test_different_keys_do_not_share():
+    flights = SingleFlight('test.flights')
+    query = Query()
+    query.release.set()
+
+    await asyncio.gather(
+        flights.do((1, 'todos', ('state', 'todo')), query),
+        flights.do((1, 'todos', ('state', 'done')), query),
+        flights.do((2, 'todos', ('state', 'todo')), query),
+    )
+    expected_calls = 3
+
+    assert query.calls == expected_calls
+
+
+@pytest.mark.asyncio
+async def test_forget_starts_a_new_flight():
+    flights = SingleFlight('test.flights')
+    before_write, after_write = Query('old'), Query('new')
+
+    first = asyncio.ensure_future(flights.do((1, 'todos'), before_write))
+    await asyncio.sleep(0)
+    flights.forget(1)
+    second = asyncio.ensure_future(flights.do((1, 'todos'), after_write))
+    await asyncio.sleep(0)
+    before_write.release.set()
+    after_write.release.set()
+
+    assert await first == 'old'
+    assert await second == 'new'
+    assert flights.in_flight() == 0
+
+
+@pytest.mark.asyncio
+async def test_followers_get_the_leader_error():
+    flights = SingleFlight('test.flights')
+    release = asyncio.Event()
+
+    async def failing():
+        await release.wait()
+        raise ValueError('boom')
+
+    tasks = [
+        asyncio.ensure_future(flights.do((1, 'todos'), failing))
+        for _ in range(2)
+    ]
+    await asyncio.sleep(0)
+    release.set()
+
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+@pytest.mark.asyncio
+async def test_follower_takes_over_cancelled_leader():
+    flights = SingleFlight('test.flights')
+    query = Query()
+
+    leader = asyncio.ensure_future(flights.do((1, 'todos'), query))
+    await asyncio.sleep(0)
+    follower = asyncio.ensure_future(flights.do((1, 'todos'), query))
+    await asyncio.sleep(0)
+    leader.cancel()
+    await asyncio.sleep(0)
+    query.release.set()
+    expected_calls = 2
+
+    assert await follower == 'body'
+    assert query.calls == expected_calls
+    assert leader.cancelled()
+
+
+def test_read_todos_counts_executed_flights(client, token):
+    metrics.reset()
+
+    response = client.get(
+        '/todos/?state=todo', headers={'Authorization': f'Bearer {token}'}
+    )
+
+    assert response.json() == {'todos': []}
+    assert metrics.get('todos.reads.executed') == 1
@@ -0,0 +1,130 @@
+from http import HTTPStatus
+
+import pytest
+from sqlalchemy import text
+
+from src.app import app
+from src.database import build_engine
+from src.metrics import metrics
+from src.models import TodoState
+from src.slow_queries import SlowQuery, SlowQueryLog, explain, redact
+from src.tracing import current_route
+
+
+@pytest.fixture
+def log(monkeypatch):
+    _log = SlowQueryLog(size=10, per_minute=10)
+    monkeypatch.setattr('src.database.slow_query_log', _log)
+    monkeypatch.setattr('src.routers.admin.slow_query_log', _log)
+    return _log
+
+
+def test_redact_keeps_shape_and_numbers():
+    assert redact({'username': 'alice', 'limit': 10, 'x': None}) == {
+        'username': '<str>',
+        'limit': 10,
+        'x': None,
+    }
+    assert redact(('secret', 1, TodoState.todo)) == ['<str>', 1, '<TodoState>']
+
+
+def test_log_is_rate_limited():
+    _log = SlowQueryLog(size=10, per_minute=2)
+    metrics.reset()
+
+    recorded = [
+        _log.record(SlowQuery('SELECT 1', [], 500.0, None, 0.0))
+        for _ in range(3)
+    ]
+
+    assert recorded == [True, True, False]
+    assert len(_log.entries(10)) == len([r for r in recorded if r])
+    assert metrics.get('db.slow_queries.suppressed') == 1
+
+
+@pytest.mark.asyncio
+async def test_slow_statement_logged_with_plan(settings, tmp_path, log):
+    engine = build_engine(
+        settings.model_copy(update={'SLOW_QUERY_THRESHOLD_MS': 0}),
+        f'sqlite+aiosqlite:///{tmp_path}/slow.db',
+    )
+    token = current_route.set('GET /todos/')
+
+    async with engine.connect() as conn:
+        await conn.execute(text('CREATE TABLE notes (body TEXT)'))
+        await conn.execute(
+            text('SELECT * FROM notes WHERE body LIKE :body'),
+            {'body': '%secret%'},
+        )
+
+    current_route.reset(token)
+    await log.drain()
+    await engine.dispose()
+
+    entry = log.entries(1)[0]
+
+    assert entry['statement'] == 'SELECT * FROM notes WHERE body LIKE ?'
+    assert entry['parameters'] == ['<str>']
+    assert entry['route'] == 'GET /todos/'
+    assert 'SCAN notes' in entry['plan']
+    assert not any(
+        e['statement'].startswith('EXPLAIN') for e in log.entries(10)
+    )
+
+
+@pytest.mark.asyncio
+async def test_explain_analyze_never_keeps_effects(engine, user):
+    if engine.dialect.name != 'postgresql':
+        pytest.skip('ANALYZE is Postgres only')
+
+    async def last_version():
+        async with engine.connect() as conn:
+            return await conn.scalar(
+                text('SELECT last_value FROM change_version_seq')
+            )
+
+    before = await last_version()
+
+    read = await explain(engine, 'SELECT id FROM users', None, analyze=True)
+    nextval = await explain(
+        engine, "SELECT nextval('change_version_seq')", None, analyze=True
+    )
+    locking = await explain(
+        engine, 'SELECT id FROM users FOR UPDATE', None, analyze=True
+    )
+    write = await explain(
+        engine,
+        'WITH gone AS (DELETE FROM users RETURNING id) SELECT * FROM gone',
+        None,
+        analyze=True,
+    )
+
+    assert 'actual time' in read
+    assert all('actual time' not in plan for plan in (nextval, locking, write))
+    assert await last_version() == before
+    async with engine.connect() as conn:
+        assert await conn.scalar(text('SELECT count(*) FROM users')) == 1
+
+
+@pytest.mark.asyncio
+async def test_fast_statement_not_logged(settings, tmp_path, log):
+    engine = build_engine(settings, f'sqlite+aiosqlite:///{tmp_path}/fast.db')
+
+    async with engine.connect() as conn:
+        await conn.execute(text('SELECT 1'))
+
+    await engine.dispose()
+
+    assert log.entries(10) == []
+
+
+def test_read_slow_queries(client, user, token, monkeypatch, log):
+    monkeypatch.setattr(app.state.settings, 'ADMIN_USERNAMES', [user.username])
+    log.record(SlowQuery('SELECT 1', [], 500.0, 'GET /todos/', 0.0))
+
+    response = client.get(
+        '/admin/slow-queries', headers={'Authorization': f'Bearer {token}'}
+    )
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.json()[0]['route'] == 'GET /todos/'
@@ -1,10 +1,15 @@
+import json
+from base64 import urlsafe_b64encode
+from datetime import datetime
 from http import HTTPStatus
 
 import factory
 import factory.fuzzy
 import pytest
+from sqlalchemy import update
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from src.metrics import metrics
 from src.models import Todo, TodoState, User
 
 
@@ -198,6 +203,93 @@ async def test_read_todos_checking_fields(
     ]
 
 
+@pytest.mark.asyncio
+async def test_read_todos_ordered_with_cursor(
+    session: AsyncSession, user: User, client, token
+):
+    session.add_all(
+        TodoFactory(user_id=user.id, title=title) for title in 'cabed'
+    )
+    await session.commit()
+    headers = {'Authorization': f'Bearer {token}'}
+
+    first = client.get(
+        '/todos/?order_by=title&order=desc&limit=3', headers=headers
+    ).json()
+    second = client.get(
+        f'/todos/?order_by=title&order=desc&limit=3&cursor={first["next_cursor"]}',
+        headers=headers,
+    ).json()
+
+    assert [todo['title'] for todo in first['todos']] == ['e', 'd', 'c']
+    assert [todo['title'] for todo in second['todos']] == ['b', 'a']
+    assert 'next_cursor' not in second
+
+
+@pytest.mark.asyncio
+async def test_read_todos_created_after(
+    session: AsyncSession, user: User, client, token, mock_db_time
+):
+    for time in (datetime(2025, 1, 1), datetime(2025, 3, 1)):
+        with mock_db_time(model=Todo, time=time):
+            session.add(TodoFactory(user_id=user.id))
+            await session.commit()
+
+    response = client.get(
+        '/todos/?created_after=2025-02-01T00:00:00Z',
+        headers={'Authorization': f'Bearer {token}'},
+    )
+
+    assert response.status_code == HTTPStatus.OK
+    assert [todo['created_at'] for todo in response.json()['todos']] == [
+        '2025-03-01T00:00:00'
+    ]
+
+
+@pytest.mark.parametrize(
+    'query',
+    [
+        'created_after=2025-01-01T00:00:00&order_by=title',
+        'created_after=2025-01-01T00:00:00&updated_after=2025-01-01T00:00:00',
+        'cursor=abc',
+        'order_by=title&cursor=abc&offset=1',
+        'order_by=created_at&state=todo',
+        'order_by=title&title=x',
+        'created_after=2025-01-01T00:00:00&description=x',
+    ],
+)
+def test_read_todos_rejects_unindexed_combinations(client, token, query):
+    response = client.get(
+        f'/todos/?{query}', headers={'Authorization': f'Bearer {token}'}
+    )
+
+    assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+
+
+@pytest.mark.parametrize(
+    ('order_by', 'value'),
+    [
+        ('created_at', 'nope'),
+        ('created_at', [5, 1]),
+        ('created_at', ['2025-01-01T00:00:00+01:00', 1]),
+        ('title', ['a', [1]]),
+        ('title', ['a', None]),
+        ('title', [5, 1]),
+        ('state', ['nope', 1]),
+        ('state', 5),
+    ],
+)
+def test_read_todos_invalid_cursor(client, token, order_by, value):
+    cursor = urlsafe_b64encode(json.dumps(value).encode()).decode()
+    response = client.get(
+        f'/todos/?order_by={order_by}&cursor={cursor}',
+        headers={'Authorization': f'Bearer {token}'},
+    )
+
+    assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+    assert response.json() == {'detail': 'invalid cursor'}
+
+
 @pytest.mark.asyncio
 async def test_patch_todo(
     client, user: User, session: AsyncSession, token, mock_db_time
@@ -347,3 +439,246 @@ async def test_delete_todo_other_user(
 
     assert response.status_code == HTTPStatus.NOT_FOUND
     assert response.json() == {'detail': 'task not found'}
+
+
+@pytest.mark.asyncio
+async def test_read_todo_changes(
+    session: AsyncSession, user: User, client, token
+):
+    expected_todos = 3
+    session.add_all(TodoFactory.create_batch(expected_todos, user_id=user.id))
+    await session.commit()
+
+    response = client.get(
+        '/todos/changes', headers={'Authorization': f'Bearer {token}'}
+    )
+    changes = response.json()
+
+    assert response.status_code == HTTPStatus.OK
+    assert len(changes['todos']) == expected_todos
+    assert changes['deleted'] == []
+    assert changes['version'] == changes['todos'][-1]['version']
+    assert changes['has_more'] is False
+
+
+@pytest.mark.asyncio
+async def test_read_todo_changes_since_version(
+    session: AsyncSession, user: User, client, token
+):
+    todos = TodoFactory.create_batch(3, user_id=user.id, state=TodoState.todo)
+    session.add_all(todos)
+    await session.commit()
+
+    response = client.get(
+        '/todos/changes', headers={'Authorization': f'Bearer {token}'}
+    )
+    version = response.json()['version']
+
+    client.patch(
+        f'/todos/{todos[0].id}',
+        headers={'Authorization': f'Bearer {token}'},
+        json={'state': 'done'},
+    )
+    client.delete(
+        f'/todos/{todos[1].id}', headers={'Authorization': f'Bearer {token}'}
+    )
+
+    response = client.get(
+        f'/todos/changes?since={version}',
+        headers={'Authorization': f'Bearer {token}'},
+    )
+    changes = response.json()
+
+    assert [todo['id'] for todo in changes['todos']] == [todos[0].id]
+    assert changes['todos'][0]['state'] == 'done'
+    assert [todo['id'] for todo in changes['deleted']] == [todos[1].id]
+    assert changes['version'] == changes['deleted'][0]['version']
+
+
+@pytest.mark.asyncio
+async def test_read_todo_changes_waits_for_lower_versions_in_flight(
+    engine, session: AsyncSession, user: User, client, token
+):
+    if engine.dialect.name != 'postgresql':
+        pytest.skip('other backends serialize writers')
+
+    headers = {'Authorization': f'Bearer {token}'}
+    async with AsyncSession(engine) as writer:
+        slow = TodoFactory(user_id=user.id)
+        writer.add(slow)
+        await writer.flush()
+
+        fast = TodoFactory(user_id=user.id)
+        session.add(fast)
+        await session.commit()
+
+        assert slow.version < fast.version
+        slow_id = slow.id
+
+        # Serving fast's version now would let the client skip slow's.
+        response = client.get('/todos/changes', headers=headers)
+        assert response.json()['todos'] == []
+        stalled = metrics.snapshot()['todos.changes.watermark_lag_xids']
+
+        await writer.commit()
+
+    response = client.get('/todos/changes', headers=headers)
+    assert [todo['id'] for todo in response.json()['todos']] == [
+        slow_id,
+        fast.id,
+    ]
+    assert stalled >= 2  # noqa: PLR2004
+    assert metrics.snapshot()['todos.changes.watermark_lag_xids'] < stalled
+
+
+@pytest.mark.asyncio
+async def test_read_todo_changes_pagination(
+    session: AsyncSession, user: User, client, token
+):
+    expected_todos = 2
+    session.add_all(TodoFactory.create_batch(3, user_id=user.id))
+    await session.commit()
+
+    response = client.get(
+        '/todos/changes?limit=2', headers={'Authorization': f'Bearer {token}'}
+    )
+    first_page = response.json()
+
+    response = client.get(
+        f'/todos/changes?limit=2&since={first_page["version"]}',
+        headers={'Authorization': f'Bearer {token}'},
+    )
+    second_page = response.json()
+
+    assert len(first_page['todos']) == expected_todos
+    assert first_page['has_more'] is True
+    assert len(second_page['todos']) == 1
+    assert second_page['has_more'] is False
+
+
+@pytest.mark.asyncio
+async def test_read_todo_changes_other_user(
+    session: AsyncSession, other_user: User, client, token
+):
+    session.add_all(TodoFactory.create_batch(3, user_id=other_user.id))
+    await session.commit()
+
+    response = client.get(
+        '/todos/changes', headers={'Authorization': f'Bearer {token}'}
+    )
+
+    assert response.json() == {
+        'todos': [],
+        'deleted': [],
+        'version': 0,
+        'has_more': False,
+    }
+
+
+@pytest.mark.asyncio
+async def test_patch_todo_returns_etag(
+    session: AsyncSession, user: User, client, token
+):
+    todo = TodoFactory(user_id=user.id, state=TodoState.todo)
+    session.add(todo)
+    await session.commit()
+
+    response = client.patch(
+        f'/todos/{todo.id}',
+        headers={
+            'Authorization': f'Bearer {token}',
+            'If-Match': f'"{todo.version}"',
+        },
+        json={'state': 'done'},
+    )
+
+    await session.refresh(todo)
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers['ETag'] == f'"{todo.version}"'
+
+
+@pytest.mark.asyncio
+async def test_patch_todo_if_match_mismatch(
+    session: AsyncSession, user: User, client, token
+):
+    todo = TodoFactory(user_id=user.id, state=TodoState.todo)
+    session.add(todo)
+    await session.commit()
+
+    response = client.patch(
+        f'/todos/{todo.id}',
+        headers={
+            'Authorization': f'Bearer {token}',
+            'If-Match': f'"{todo.version + 1}"',
+        },
+        json={'state': 'done'},
+    )
+
+    assert response.status_code == HTTPStatus.PRECONDITION_FAILED
+    assert response.json() == {'detail': 'resource was modified'}
+
+
+@pytest.mark.asyncio
+async def test_patch_todo_if_match_weak_etag(
+    session: AsyncSession, user: User, client, token
+):
+    todo = TodoFactory(user_id=user.id, state=TodoState.todo)
+    session.add(todo)
+    await session.commit()
+
+    response = client.patch(
+        f'/todos/{todo.id}',
+        headers={
+            'Authorization': f'Bearer {token}',
+            'If-Match': f'W/"{todo.version}"',
+        },
+        json={'state': 'done'},
+    )
+
+    assert response.status_code == HTTPStatus.PRECONDITION_FAILED
+
+
+@pytest.mark.asyncio
+async def test_patch_todo_if_match_compressed_etag(
+    session: AsyncSession, user: User, client, token
+):
+    todo = TodoFactory(user_id=user.id, state=TodoState.todo)
+    session.add(todo)
+    await session.commit()
+
+    response = client.patch(
+        f'/todos/{todo.id}',
+        headers={
+            'Authorization': f'Bearer {token}',
+            'If-Match': f'"{todo.version}-gzip"',
+        },
+        json={'state': 'done'},
+    )
+
+    assert response.status_code == HTTPStatus.OK
+
+
+@pytest.mark.asyncio
+async def test_patch_todo_concurrent_update(
+    session: AsyncSession, user: User, client, token
+):
+    todo = TodoFactory(user_id=user.id, state=TodoState.todo)
+    session.add(todo)
+    await session.commit()
+
+    await session.execute(
+        update(Todo)
+        .where(Todo.id == todo.id)
+        .values(version=todo.version + 1)
+        .execution_options(synchronize_session=False)
+    )
+
+    response = client.patch(
+        f'/todos/{todo.id}',
+        headers={'Authorization': f'Bearer {token}'},
+        json={'state': 'done'},
+    )
+
+    assert response.status_code == HTTPStatus.PRECONDITION_FAILED
+    assert response.json() == {'detail': 'resource was modified'}
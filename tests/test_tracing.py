@@ -0,0 +1,196 @@
+import json
+from http import HTTPStatus
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from src.app import app
+from src.metrics import metrics
+from src.tracing import (
+    JsonLinesExporter,
+    RingBufferCollector,
+    Tracer,
+    instrument_tracing,
+)
+
+
+@pytest.fixture
+def traces():
+    return RingBufferCollector(size=2)
+
+
+@pytest.fixture
+def local_tracer(traces):
+    _tracer = Tracer()
+    _tracer.configure([traces])
+    return _tracer
+
+
+def test_spans_nest_under_the_trace(local_tracer, traces):
+    with local_tracer.trace('GET /') as trace:
+        with local_tracer.span('outer'):
+            with local_tracer.span('inner', key='value'):
+                pass
+        local_tracer.record('late', trace.root.start)
+
+    exported = traces.get(trace.id)
+    spans = {span['name']: span for span in exported['spans']}
+
+    assert spans['outer']['parent_id'] == spans['GET /']['id']
+    assert spans['inner']['parent_id'] == spans['outer']['id']
+    assert spans['inner']['attributes'] == {'key': 'value'}
+    assert spans['late']['offset_ms'] == 0
+
+
+def test_spans_outside_a_trace_are_not_recorded(local_tracer, traces):
+    with local_tracer.span('orphan') as span:
+        pass
+
+    assert span is None
+    assert local_tracer.start_span('orphan') is None
+    assert traces.traces(10) == []
+
+
+def test_ring_buffer_keeps_newest_traces(local_tracer, traces):
+    for name in ('first', 'second', 'third'):
+        with local_tracer.trace(name):
+            pass
+
+    assert [trace['name'] for trace in traces.traces(10)] == [
+        'third',
+        'second',
+    ]
+    assert traces.traces(1, min_duration_ms=60_000) == []
+
+
+@pytest.mark.asyncio
+async def test_json_lines_exporter(local_tracer, tmp_path):
+    path = tmp_path / 'traces.jsonl'
+    exporter = JsonLinesExporter(str(path))
+    local_tracer.configure([exporter])
+
+    with local_tracer.trace('first'):
+        pass
+    with local_tracer.trace('second'):
+        pass
+
+    assert not path.exists()
+    await exporter.drain()
+    lines = path.read_text().splitlines()
+
+    assert [json.loads(line)['name'] for line in lines] == ['first', 'second']
+
+
+@pytest.mark.asyncio
+async def test_json_lines_exporter_drops_oldest_when_behind(
+    local_tracer, tmp_path
+):
+    path = tmp_path / 'traces.jsonl'
+    exporter = JsonLinesExporter(str(path), buffer_size=2)
+    local_tracer.configure([exporter])
+    metrics.reset()
+
+    for name in ('first', 'second', 'third'):
+        with local_tracer.trace(name):
+            pass
+    await exporter.drain()
+    lines = path.read_text().splitlines()
+
+    assert [json.loads(line)['name'] for line in lines] == ['second', 'third']
+    assert metrics.get('tracing.dropped') == 1
+
+
+def test_spans_per_trace_are_capped(traces):
+    _tracer = Tracer()
+    _tracer.configure([traces], max_spans=3)
+
+    with _tracer.trace('GET /') as trace:
+        for name in ('first', 'second', 'third'):
+            with _tracer.span(name) as span:
+                _tracer.record('nested', span.start if span else 0)
+
+    exported = traces.get(trace.id)
+
+    assert [span['name'] for span in exported['spans']] == [
+        'GET /',
+        'first',
+        'nested',
+    ]
+    assert exported['dropped_spans'] == 4  # noqa: PLR2004
+
+
+@pytest.mark.asyncio
+async def test_sql_statements_become_spans(local_tracer, traces, monkeypatch):
+    monkeypatch.setattr('src.tracing.tracer', local_tracer)
+    engine = create_async_engine('sqlite+aiosqlite:///:memory:')
+    instrument_tracing(engine)
+
+    with local_tracer.trace('job') as trace:
+        async with engine.connect() as conn:
+            await conn.execute(text('SELECT 1'))
+
+    await engine.dispose()
+    spans = traces.get(trace.id)['spans']
+
+    assert spans[1]['name'] == 'sql'
+    assert spans[1]['attributes'] == {'statement': 'SELECT 1'}
+
+
+def test_request_trace_spans(client, token):
+    response = client.get(
+        '/todos/', headers={'Authorization': f'Bearer {token}'}
+    )
+    trace = app.state.traces.get(response.headers['x-trace-id'])
+    names = [span['name'] for span in trace['spans']]
+
+    assert trace['name'] == 'GET /todos/'
+    assert trace['spans'][0]['attributes'] == {'status': HTTPStatus.OK}
+    assert names[:5] == [
+        'GET /todos/',
+        'route',
+        'jwt.decode',
+        'user.lookup',
+        'endpoint',
+    ]
+    assert names[-1] == 'serialize'
+
+
+def test_login_trace_has_argon2_span(client, user):
+    response = client.post(
+        '/auth/token',
+        data={'username': user.username, 'password': user.clean_password},
+    )
+    trace = app.state.traces.get(response.headers['x-trace-id'])
+
+    assert 'argon2.verify' in [span['name'] for span in trace['spans']]
+
+
+def test_read_traces(client, user, token, monkeypatch):
+    monkeypatch.setattr(app.state.settings, 'ADMIN_USERNAMES', [user.username])
+    first = client.get('/', headers={'Authorization': f'Bearer {token}'})
+
+    response = client.get(
+        '/admin/traces?limit=1', headers={'Authorization': f'Bearer {token}'}
+    )
+    single = client.get(
+        f'/admin/traces/{first.headers["x-trace-id"]}',
+        headers={'Authorization': f'Bearer {token}'},
+    )
+
+    assert response.status_code == HTTPStatus.OK
+    assert [trace['trace_id'] for trace in response.json()] == [
+        first.headers['x-trace-id']
+    ]
+    assert single.json()['name'] == 'GET /'
+
+
+def test_read_trace_not_found(client, user, token, monkeypatch):
+    monkeypatch.setattr(app.state.settings, 'ADMIN_USERNAMES', [user.username])
+
+    response = client.get(
+        '/admin/traces/missing', headers={'Authorization': f'Bearer {token}'}
+    )
+
+    assert response.status_code == HTTPStatus.NOT_FOUND
+    assert response.json() == {'detail': 'trace not found'}
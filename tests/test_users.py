@@ -1,5 +1,9 @@
 from http import HTTPStatus
 
+import pytest
+from sqlalchemy import event, func, select
+
+from src.models import Todo
 from src.schemas import UserPublic
 
 
@@ -49,6 +53,90 @@ def test_create_user_email_already_exists(client, user):
     assert response.json() == {'detail': 'email already exists'}
 
 
+def test_create_user_username_differs_only_by_case(client, user):
+    response = client.post(
+        '/users',
+        json={
+            'username': user.username.upper(),
+            'email': 'other@test.com',
+            'password': 'secret',
+        },
+    )
+
+    assert response.status_code == HTTPStatus.CONFLICT
+    assert response.json() == {'detail': 'username already exists'}
+
+
+def test_create_user_email_differs_only_by_case(client, user):
+    response = client.post(
+        '/users',
+        json={
+            'username': 'other',
+            'email': user.email.upper(),
+            'password': 'secret',
+        },
+    )
+
+    assert response.status_code == HTTPStatus.CONFLICT
+    assert response.json() == {'detail': 'email already exists'}
+
+
+def test_create_user_taken_skips_password_hash(client, user, monkeypatch):
+    def fail(password, hasher=None):
+        raise AssertionError('hashed a password for a taken username')
+
+    monkeypatch.setattr('src.routers.users.get_password_hash', fail)
+
+    response = client.post(
+        '/users',
+        json={
+            'username': user.username,
+            'email': user.email,
+            'password': 'secret',
+        },
+    )
+
+    assert response.status_code == HTTPStatus.CONFLICT
+
+
+def test_create_user_two_statements(client, engine):
+    statements = []
+
+    def capture(conn, cursor, statement, *args):
+        statements.append(statement.split()[0])
+
+    event.listen(engine.sync_engine, 'before_cursor_execute', capture)
+    response = client.post(
+        '/users',
+        json={'username': 'test', 'email': 'test@test.com', 'password': 'x'},
+    )
+    event.remove(engine.sync_engine, 'before_cursor_execute', capture)
+
+    assert response.status_code == HTTPStatus.CREATED
+    assert statements == ['SELECT', 'INSERT']
+
+
+def test_create_user_concurrent_signup_conflict(client, user, monkeypatch):
+    async def check_missed_the_other_signup(session, shards, user):
+        return None
+
+    monkeypatch.setattr(
+        'src.routers.users._find_taken', check_missed_the_other_signup
+    )
+
+    response = client.post(
+        '/users',
+        json={
+            'username': 'other',
+            'email': user.email,
+            'password': 'secret',
+        },
+    )
+
+    assert response.status_code == HTTPStatus.CONFLICT
+    assert response.json() == {'detail': 'email already exists'}
+
+
 def test_read_users(client, user, token):
     user_schema = UserPublic.model_validate(user).model_dump()
     response = client.get(
@@ -139,6 +227,26 @@ def test_delete_user(client, user, token):
     assert response.json() == {'message': 'user deleted'}
 
 
+@pytest.mark.asyncio
+async def test_delete_user_deletes_todos(client, session, user, token):
+    user_id = user.id
+    client.post(
+        '/todos/',
+        headers={'Authorization': f'Bearer {token}'},
+        json={'title': 't', 'description': 'd', 'state': 'todo'},
+    )
+    # Requests share the test session; start from a fresh user like a new
+    # request would.
+    session.expire_all()
+
+    response = client.delete(
+        f'/users/{user_id}', headers={'Authorization': f'Bearer {token}'}
+    )
+
+    assert response.status_code == HTTPStatus.OK
+    assert await session.scalar(select(func.count(Todo.id))) == 0
+
+
 def test_delete_user_with_wrong_user(client, other_user, token):
     response = client.delete(
         f'/users/{other_user.id}', headers={'Authorization': f'Bearer {token}'}
@@ -146,3 +254,68 @@ def test_delete_user_with_wrong_user(client, other_user, token):
 
     assert response.status_code == HTTPStatus.FORBIDDEN
     assert response.json() == {'detail': 'not enough permissions'}
+
+
+def test_read_user_returns_etag(client, user, token):
+    response = client.get(
+        f'/users/{user.id}', headers={'Authorization': f'Bearer {token}'}
+    )
+
+    assert response.headers['ETag'] == f'"{user.version}"'
+
+
+def test_authenticated_request_does_not_load_todos(
+    client, session, engine, user, token
+):
+    user_id = user.id
+    session.expire_all()
+    statements = []
+
+    def capture(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(engine.sync_engine, 'before_cursor_execute', capture)
+    response = client.get(
+        f'/users/{user_id}', headers={'Authorization': f'Bearer {token}'}
+    )
+    event.remove(engine.sync_engine, 'before_cursor_execute', capture)
+
+    assert response.status_code == HTTPStatus.OK
+    assert not [statement for statement in statements if 'todos' in statement]
+
+
+def test_update_user_with_if_match(client, user, token):
+    version = user.version
+    response = client.put(
+        f'/users/{user.id}',
+        headers={
+            'Authorization': f'Bearer {token}',
+            'If-Match': f'"{user.version}"',
+        },
+        json={
+            'username': 'test2 test',
+            'email': 'test2@test.com',
+            'password': 'secret2',
+        },
+    )
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers['ETag'] == f'"{version + 1}"'
+
+
+def test_update_user_if_match_mismatch(client, user, token):
+    response = client.put(
+        f'/users/{user.id}',
+        headers={
+            'Authorization': f'Bearer {token}',
+            'If-Match': f'"{user.version + 1}"',
+        },
+        json={
+            'username': 'test2 test',
+            'email': 'test2@test.com',
+            'password': 'secret2',
+        },
+    )
+
+    assert response.status_code == HTTPStatus.PRECONDITION_FAILED
+    assert response.json() == {'detail': 'resource was modified'}